@@ -1,23 +1,122 @@
+import asyncio
+import functools
+import os
 import uuid
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from researcher.document.chunker import Chunker
+from researcher.document.parser import ParserPool
 from researcher.embeddings.embeddings import Embeddings
-from researcher.store.vectorstore import Store
+from researcher.store import PGVectorStore, Store
 from route.auth import router as auth_router
 from route.message import router as message_router
 from route.research import router as research_router
 from route.thread import router as thread_router
-from route.s3 import router as s3_router
+from route.s3 import (
+    UPLOAD_SPOOL_CLEAN_INTERVAL,
+    UPLOAD_SPOOL_DIR,
+    UPLOAD_SPOOL_MAX_AGE,
+    ingest_file,
+    router as s3_router,
+)
 from route.file import router as file_router
+from route.metrics import router as metrics_router
 from langchain_community.vectorstores import PGEmbedding
+from researcher.cache import LRUCache, PostgresCache, TieredCache
 from researcher.checkpoint import BaseCheckpointManager
 from researcher.graph.researcher import Researcher
+from researcher.metrics import register_cache_metrics
 from researcher.utils.database import close_db_pool, get_db_connection_str, init_db_pool
+from utils.compaction import compact_periodically, purge_caches_periodically
+from utils.ingestion import IngestionQueue, IngestionWorkers
+from utils.upload import clean_spool, clean_spool_periodically
 
 load_dotenv()
 
+# Query embedding cache settings, the Postgres tier is shared by every worker
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 4096))
+EMBEDDING_CACHE_TTL = float(os.environ.get("EMBEDDING_CACHE_TTL", 86400))
+EMBEDDING_CACHE_POSTGRES = (
+    os.environ.get("EMBEDDING_CACHE_POSTGRES", "true").lower() == "true"
+)
+
+# LLM completion cache settings; set LLM_CACHE_SIZE to 0 to disable the cache
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", 1024))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 3600))
+LLM_CACHE_POSTGRES = os.environ.get("LLM_CACHE_POSTGRES", "true").lower() == "true"
+
+# Seconds between purges of the expired entries of the Postgres caches; set the
+# interval to 0 to disable them
+CACHE_PURGE_INTERVAL = float(os.environ.get("CACHE_PURGE_INTERVAL", 3600))
+
+# Web search result cache settings; set SEARCH_CACHE_SIZE to 0 to disable the cache
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 512))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 600))
+
+# Vector store of uploaded files: "pgvector", or the legacy "pgembedding" tables.
+# Deployments upgrading from "pgembedding" copy their chunks to pgvector with
+# init/migrate_pgembedding_chunks.sql
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "pgvector")
+# Partition the pgvector table by user, so searches only scan the user's chunks.
+# An existing unpartitioned table is migrated with init/partition_document_chunks.sql
+VECTOR_STORE_PARTITION_BY_USER = (
+    os.environ.get("VECTOR_STORE_PARTITION_BY_USER", "true").lower() == "true"
+)
+# Store embeddings quantized, as "float16" (halfvec) or "binary" with rescoring, to
+# shrink the table and its index. Existing tables are migrated with
+# init/quantize_document_chunks.sql
+VECTOR_STORE_QUANTIZATION = os.environ.get("VECTOR_STORE_QUANTIZATION") or None
+# HNSW candidate list size per query, higher values trade latency for recall
+VECTOR_STORE_EF_SEARCH = int(os.environ.get("VECTOR_STORE_EF_SEARCH", 40))
+# Fuse full-text and vector results, finding exact identifiers embeddings miss
+VECTOR_STORE_HYBRID = os.environ.get("VECTOR_STORE_HYBRID", "true").lower() == "true"
+# Re-select file search results by MMR, dropping near-duplicate overlapping chunks
+VECTOR_STORE_MMR = os.environ.get("VECTOR_STORE_MMR", "true").lower() == "true"
+VECTOR_STORE_MMR_FETCH_K = int(os.environ.get("VECTOR_STORE_MMR_FETCH_K", 40))
+VECTOR_STORE_MMR_LAMBDA = float(os.environ.get("VECTOR_STORE_MMR_LAMBDA", 0.5))
+
+# Seconds between compactions of the vector store, reclaiming deleted chunks from
+# tables whose dead rows exceed the ratio; set the interval to 0 to disable them
+VECTOR_STORE_COMPACTION_INTERVAL = float(
+    os.environ.get("VECTOR_STORE_COMPACTION_INTERVAL", 3600)
+)
+VECTOR_STORE_COMPACTION_DEAD_RATIO = float(
+    os.environ.get("VECTOR_STORE_COMPACTION_DEAD_RATIO", 0.1)
+)
+
+# Uploaded files are indexed in the background, INGESTION_WORKERS at a time per
+# process. Idle workers poll the shared job queue every INGESTION_POLL_INTERVAL
+# seconds, and a job silent for INGESTION_LEASE seconds is claimed by another worker
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", 2))
+INGESTION_POLL_INTERVAL = float(os.environ.get("INGESTION_POLL_INTERVAL", 5))
+INGESTION_LEASE = float(os.environ.get("INGESTION_LEASE", 300))
+INGESTION_MAX_ATTEMPTS = int(os.environ.get("INGESTION_MAX_ATTEMPTS", 3))
+
+# Uploaded files are parsed in child processes, PARSER_WORKERS at a time (one per CPU
+# by default), each killed after PARSER_TIMEOUT seconds or when its memory exceeds
+# PARSER_MEMORY_LIMIT_MB of address space; a process starts at about 200 MB and text
+# files take about three times their size, so the default fits ones of about 600 MB.
+# Set the limit to 0 to disable it
+PARSER_WORKERS = int(os.environ.get("PARSER_WORKERS", 0)) or None
+PARSER_TIMEOUT = float(os.environ.get("PARSER_TIMEOUT", 300))
+PARSER_MEMORY_LIMIT_MB = int(os.environ.get("PARSER_MEMORY_LIMIT_MB", 2048))
+
+# Remember the chunks of indexed files by the SHA-256 of their content, so identical
+# uploads, by any user or under any name, copy them instead of being parsed and
+# embedded again
+FILE_CACHE = os.environ.get("FILE_CACHE", "true").lower() == "true"
+FILE_CACHE_TTL = float(os.environ.get("FILE_CACHE_TTL", 30 * 86400))
+
+# Chunks of uploaded files, measured in tokens of the embedding model's encoding
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 256))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", 50))
+CHUNK_ENCODING = os.environ.get("CHUNK_ENCODING", "cl100k_base")
+
+# Answer and self-assess in one structured-output call instead of validating separately
+SELF_ASSESSMENT = os.environ.get("SELF_ASSESSMENT", "false").lower() == "true"
+
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from typing import TypedDict
@@ -43,25 +142,88 @@ async def lifespan(_: FastAPI) -> AsyncIterator[State]:
         checkpoint_type="postgres", conn_string=get_db_connection_str()
     )
 
+    # Cache query embeddings in process, backed by a shared Postgres tier
+    embedding_cache = None
+    if EMBEDDING_CACHE_POSTGRES:
+        embedding_cache = PostgresCache("embedding_cache", ttl=EMBEDDING_CACHE_TTL)
+        await embedding_cache.acreate_table()
     embeddings = Embeddings(
-        embedding_provider="openai", model="text-embedding-3-small"
+        embedding_provider="openai",
+        model="text-embedding-3-small",
+        cache=LRUCache(max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL),
+        persistent_cache=embedding_cache,
     ).get_embeddings()
-    collection_name = "user_files"
-    connection_string = get_db_connection_str()
-    vector_store = PGEmbedding.from_existing_index(
-        embedding=embeddings,
-        collection_name=collection_name,
-        pre_delete_collection=False,
-        connection_string=connection_string,
-    )
+    if VECTOR_STORE_BACKEND == "pgvector":
+        vector_store = PGVectorStore(
+            embeddings,
+            ef_search=VECTOR_STORE_EF_SEARCH,
+            partition_by_user=VECTOR_STORE_PARTITION_BY_USER,
+            quantization=VECTOR_STORE_QUANTIZATION,
+        )
+        await vector_store.acreate_table()
+    else:
+        collection_name = "user_files"
+        connection_string = get_db_connection_str()
+        vector_store = PGEmbedding.from_existing_index(
+            embedding=embeddings,
+            collection_name=collection_name,
+            pre_delete_collection=False,
+            connection_string=connection_string,
+        )
+    file_cache = None
+    if FILE_CACHE:
+        file_cache = PostgresCache("file_cache", ttl=FILE_CACHE_TTL)
+        await file_cache.acreate_table()
     store = Store(
-        vector_store_type="pgembedding",
+        vector_store_type=VECTOR_STORE_BACKEND,
         vector_store=vector_store,
+        embeddings=embeddings,
+        hybrid=VECTOR_STORE_HYBRID,
+        mmr=VECTOR_STORE_MMR,
+        fetch_k=VECTOR_STORE_MMR_FETCH_K,
+        lambda_mult=VECTOR_STORE_MMR_LAMBDA,
+        chunker=Chunker(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, encoding=CHUNK_ENCODING
+        ),
+        file_cache=file_cache,
     )
+    if VECTOR_STORE_BACKEND != "pgvector":
+        # Look up uploaded chunks by content hash before embedding them
+        await store.acreate_chunk_hash_index()
+
+    # Cache exact-match completions in process, backed by a shared Postgres tier
+    llm_cache = None
+    llm_postgres_cache = None
+    if LLM_CACHE_SIZE > 0:
+        llm_caches = [LRUCache(max_size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)]
+        if LLM_CACHE_POSTGRES:
+            llm_postgres_cache = PostgresCache("llm_cache", ttl=LLM_CACHE_TTL)
+            await llm_postgres_cache.acreate_table()
+            llm_caches.append(llm_postgres_cache)
+        llm_cache = TieredCache(*llm_caches)
+
+    search_cache = None
+    if SEARCH_CACHE_SIZE > 0:
+        search_cache = LRUCache(max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+    # Expose the cache hit rates on /metrics
+    caches = {"embedding": embeddings.cache}
+    if embedding_cache is not None:
+        caches["embedding_postgres"] = embedding_cache
+    if llm_cache is not None:
+        caches["llm"] = llm_cache
+    if search_cache is not None:
+        caches["search"] = search_cache
+    if file_cache is not None:
+        caches["file"] = file_cache
+    register_cache_metrics(caches)
 
     researcher = await Researcher.create_researcher(
         vector_store=store,
         checkpoint_manager=checkpoint_manager,
+        llm_cache=llm_cache,
+        search_cache=search_cache,
+        self_assessment=SELF_ASSESSMENT,
     )
 
     # Compile the graph with the checkpointer
@@ -70,7 +232,66 @@ async def lifespan(_: FastAPI) -> AsyncIterator[State]:
 
         # Generate a visualization of the graph
         graph.get_graph().draw_mermaid_png(output_file_path="docs/researcher_graph.png")
-        yield {"graph": graph, "store": store}
+
+        # Reclaim the space of deleted chunks in the background
+        compaction = None
+        if VECTOR_STORE_COMPACTION_INTERVAL > 0:
+            compaction = asyncio.create_task(
+                compact_periodically(
+                    store,
+                    VECTOR_STORE_COMPACTION_INTERVAL,
+                    VECTOR_STORE_COMPACTION_DEAD_RATIO,
+                )
+            )
+
+        # Delete the expired entries of the Postgres caches in the background
+        purge = None
+        postgres_caches = [
+            cache
+            for cache in (embedding_cache, llm_postgres_cache, file_cache)
+            if cache is not None
+        ]
+        if CACHE_PURGE_INTERVAL > 0 and postgres_caches:
+            purge = asyncio.create_task(
+                purge_caches_periodically(postgres_caches, CACHE_PURGE_INTERVAL)
+            )
+
+        # Remove the stale spooled uploads now and then in the background
+        await asyncio.to_thread(clean_spool, UPLOAD_SPOOL_DIR, UPLOAD_SPOOL_MAX_AGE)
+        spool_cleaning = None
+        if UPLOAD_SPOOL_CLEAN_INTERVAL > 0:
+            spool_cleaning = asyncio.create_task(
+                clean_spool_periodically(
+                    UPLOAD_SPOOL_DIR, UPLOAD_SPOOL_MAX_AGE, UPLOAD_SPOOL_CLEAN_INTERVAL
+                )
+            )
+
+        # Index uploaded files in the background, from the shared job queue
+        ingestion_queue = IngestionQueue(lease=INGESTION_LEASE)
+        await ingestion_queue.acreate_table()
+        parser = ParserPool(
+            max_workers=PARSER_WORKERS,
+            timeout=PARSER_TIMEOUT,
+            memory_limit=PARSER_MEMORY_LIMIT_MB * 2**20 or None,
+        )
+        ingestion = IngestionWorkers(
+            ingestion_queue,
+            functools.partial(ingest_file, store=store, parser=parser),
+            workers=INGESTION_WORKERS,
+            poll_interval=INGESTION_POLL_INTERVAL,
+            max_attempts=INGESTION_MAX_ATTEMPTS,
+        )
+        ingestion.start()
+        try:
+            yield {"graph": graph, "store": store, "ingestion": ingestion}
+        finally:
+            await ingestion.stop()
+            if compaction is not None:
+                compaction.cancel()
+            if purge is not None:
+                purge.cancel()
+            if spool_cleaning is not None:
+                spool_cleaning.cancel()
 
     # Close the database connection pool on shutdown
     await close_db_pool()
@@ -93,6 +314,7 @@ app.include_router(message_router)
 app.include_router(thread_router)
 app.include_router(s3_router)
 app.include_router(file_router)
+app.include_router(metrics_router)
 
 if __name__ == "__main__":
     import uvicorn
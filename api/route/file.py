@@ -1,6 +1,6 @@
 """Module for file operations."""
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from researcher.utils.database import get_db_connection
 from pydantic import BaseModel
 
@@ -62,17 +62,36 @@ async def add_file(file_metadata: FileMetadata, _: dict = Depends(get_current_us
 
 
 @router.delete("/file")
-async def delete_file(file_id: int, _: dict = Depends(get_current_user)):
+async def delete_file(
+    file_id: int, request: Request, current_user: dict = Depends(get_current_user)
+):
     """
-    Mark a file as deleted in the database.
+    Mark a file of the user as deleted in the database and delete its chunks from
+    the vector store, unless another file of the user still has the same location.
     """
+    user_id = current_user["username"]
     async with get_db_connection() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(
-                "UPDATE user_files SET deleted = TRUE WHERE id = %s", (file_id,)
+                """
+                UPDATE user_files SET deleted = TRUE
+                WHERE id = %s AND user_id = %s
+                RETURNING s3_location,
+                    EXISTS (
+                        SELECT 1 FROM user_files other
+                        WHERE other.s3_location = user_files.s3_location
+                            AND other.id <> user_files.id AND NOT other.deleted
+                    )
+                """,
+                (file_id, user_id),
             )
-            if cursor.rowcount == 0:
+            row = await cursor.fetchone()
+            if row is None:
                 raise HTTPException(status_code=404, detail="File not found")
+
+    s3_location, still_used = row
+    if not still_used:
+        await request.state.store.adelete({"source": s3_location, "user_id": user_id})
     return {"message": "File marked as deleted successfully"}
 
 
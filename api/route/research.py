@@ -1,11 +1,18 @@
+import json
 import logging
+import os
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
+from researcher.graph.researcher import ANSWER_TAG, ASSESSED_ANSWER_TAG
 from researcher.history import BaseChatHistoryManager
+from researcher.llm import JSONFieldStream, structured_output_fragment
 from researcher.state import GraphState
 from researcher.utils.thread import get_threads_for_user_from_db
+from utils.admission import AdmissionController, AdmittedStream
 
 from .auth import get_current_user
 
@@ -17,6 +24,24 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Per-request budgets for the research graph, bounding latency and LLM spend
+CHAT_MAX_ITERATIONS = int(os.environ.get("CHAT_MAX_ITERATIONS", 10))
+CHAT_TIMEOUT = float(os.environ.get("CHAT_TIMEOUT", 60))
+CHAT_TOKEN_BUDGET = int(os.environ.get("CHAT_TOKEN_BUDGET", 50000))
+
+# Admission control for the research graph, shared by /chat and /chat/stream, so a
+# spike is shed with 429/503 instead of overwhelming the LLM and search APIs
+CHAT_MAX_CONCURRENCY = int(os.environ.get("CHAT_MAX_CONCURRENCY", 16))
+CHAT_MAX_QUEUE = int(os.environ.get("CHAT_MAX_QUEUE", 64))
+CHAT_QUEUE_TIMEOUT = float(os.environ.get("CHAT_QUEUE_TIMEOUT", 10))
+
+chat_admission = AdmissionController(
+    "chat",
+    max_concurrency=CHAT_MAX_CONCURRENCY,
+    max_queue=CHAT_MAX_QUEUE,
+    queue_timeout=CHAT_QUEUE_TIMEOUT,
+)
+
 
 # Define the ChatRequest model to validate incoming chat requests
 class ChatRequest(BaseModel):
@@ -25,13 +50,11 @@ class ChatRequest(BaseModel):
     files: Optional[List[str]] = []
 
 
-# The /chat endpoint that accepts a chat request
-@router.post("/chat")
-async def chat(
-    chat_request: ChatRequest,
-    request: Request,
-    current_user: dict = Depends(get_current_user),
-):
+async def prepare_chat(chat_request: ChatRequest, current_user: dict):
+    """
+    Verify thread ownership, store the user's prompt and build the initial graph
+    state and config for a chat request.
+    """
     # Fetch threads for the user
     user_threads = await get_threads_for_user_from_db(current_user["username"])
     logger.info("Chat request received: %s", chat_request.model_dump())
@@ -40,9 +63,6 @@ async def chat(
     if not any(thread["id"] == chat_request.thread_id for thread in user_threads):
         raise HTTPException(status_code=404, detail="Thread not found")
 
-    # Get graph from app state
-    graph = request.state.graph
-
     history = await BaseChatHistoryManager.create_history(
         memory_type="postgres",
         table_name="chat_history",
@@ -61,16 +81,124 @@ async def chat(
 
     await history.add_memory(chat_request.prompt, message_type="human")
 
-    # Process the user's prompt
-    response = await graph.ainvoke(
-        graph_state,
-        config={
-            "configurable": {
-                "max_iterations": 10,
-                "thread_id": chat_request.thread_id,
-            }
-        },
-    )
+    config = {
+        "configurable": {
+            "max_iterations": CHAT_MAX_ITERATIONS,
+            "timeout": CHAT_TIMEOUT,
+            "token_budget": CHAT_TOKEN_BUDGET,
+            "thread_id": chat_request.thread_id,
+            "user_id": current_user["username"],
+        }
+    }
+    return history, graph_state, config
+
+
+def format_sse(event: str, data: dict) -> str:
+    """
+    Format a server-sent event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    await history.add_memory(response["response"], message_type="ai")
+
+# The /chat endpoint that accepts a chat request
+@router.post("/chat")
+async def chat(
+    chat_request: ChatRequest,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+):
+    # Admit the request before storing the prompt, so rejected prompts are not kept
+    async with chat_admission.slot():
+        history, graph_state, config = await prepare_chat(chat_request, current_user)
+
+        # Get graph from app state
+        graph = request.state.graph
+
+        # Process the user's prompt
+        response = await graph.ainvoke(graph_state, config=config)
+
+        await history.add_memory(response["response"], message_type="ai")
     return {"response": response["response"]}
+
+
+# The /chat/stream endpoint streams graph progress and answer tokens as SSE
+@router.post("/chat/stream")
+async def chat_stream(
+    chat_request: ChatRequest,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Stream a chat response as server-sent events.
+
+    Emits a `node` event whenever a graph node starts or ends, a `token` event for
+    every token produced by `generate_response` and a final `response` event with
+    the validated answer, which is also persisted to the chat history. In
+    self-assessment mode, the tokens are those of the answer field of the
+    structured response, decoded as its JSON streams in.
+
+    The admission slot is acquired before the response starts, so a saturated
+    route is rejected with a status code, and held until the stream ends or the
+    response is dropped.
+    """
+    acquired_at = await chat_admission.acquire()
+    try:
+        history, graph_state, config = await prepare_chat(chat_request, current_user)
+    except BaseException:
+        chat_admission.release(acquired_at)
+        raise
+
+    # Get graph from app state
+    graph = request.state.graph
+
+    async def event_stream():
+        response = None
+        # Decoders of the answer field of every self-assessed LLM call, by run
+        answers = {}
+        try:
+            async for event in graph.astream_events(
+                graph_state, config=config, version="v2"
+            ):
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+
+                if kind == "on_chat_model_stream" and ANSWER_TAG in event["tags"]:
+                    token = event["data"]["chunk"].content
+                    if token:
+                        yield format_sse("token", {"content": token})
+                elif (
+                    kind == "on_chat_model_stream"
+                    and ASSESSED_ANSWER_TAG in event["tags"]
+                ):
+                    answer = answers.setdefault(
+                        event["run_id"], JSONFieldStream("answer")
+                    )
+                    token = answer.feed(
+                        structured_output_fragment(event["data"]["chunk"])
+                    )
+                    if token:
+                        yield format_sse("token", {"content": token})
+                elif kind in ("on_chain_start", "on_chain_end") and (
+                    event["name"] == node and node != "__start__"
+                ):
+                    status = "start" if kind == "on_chain_start" else "end"
+                    yield format_sse("node", {"node": node, "status": status})
+                    if node == "final_response" and status == "end":
+                        response = event["data"]["output"]["response"]
+            await history.add_memory(response, message_type="ai")
+        except Exception:
+            logger.exception("Chat stream failed for thread %s", chat_request.thread_id)
+            yield format_sse("error", {"message": "Failed to generate a response"})
+            return
+
+        yield format_sse("response", {"response": response})
+
+    # The slot is released when the stream ends, or by the background task when the
+    # client disconnected before it did
+    body = AdmittedStream(chat_admission, acquired_at, event_stream())
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(body.aclose),
+    )
@@ -1,16 +1,21 @@
 """Description: This file contains the backend code for handling S3 operations."""
 
-from io import BytesIO
-
+import asyncio
 import tempfile
 import os
-from fastapi import APIRouter, UploadFile, HTTPException, Request, Depends
+import uuid
+from contextlib import aclosing
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Depends
 import boto3
+from boto3.s3.transfer import TransferConfig
 
 from researcher.embeddings.embeddings import Embeddings
 from .file import add_file, FileMetadata, Depends
 from .auth import get_current_user
+from utils.upload import file_sha256, remove_spooled, spool_upload
 from researcher.document.document import DocumentLoader
+from researcher.document.parser import ParserPool
 from researcher.store.vectorstore import Store
 from langchain_community.vectorstores import PGEmbedding
 
@@ -20,52 +25,182 @@ router = APIRouter()
 s3_client = boto3.client("s3", region_name=os.environ.get("COGNITO_REGION"))
 S3_BUCKET = os.environ.get("S3_BUCKET")
 
+# Uploads are spooled to this directory until parsed; spooled files older than
+# UPLOAD_SPOOL_MAX_AGE seconds, whose upload was indexed on another host, are removed
+# at startup and then every UPLOAD_SPOOL_CLEAN_INTERVAL seconds, 0 disabling the
+# periodic removal
+UPLOAD_SPOOL_DIR = os.environ.get(
+    "UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "researcher-uploads")
+)
+UPLOAD_SPOOL_MAX_AGE = float(os.environ.get("UPLOAD_SPOOL_MAX_AGE", 86400))
+UPLOAD_SPOOL_CLEAN_INTERVAL = float(os.environ.get("UPLOAD_SPOOL_CLEAN_INTERVAL", 3600))
 
-@router.post("/upload")
-async def upload_file(
-    file: UploadFile, request: Request, current_user: dict = Depends(get_current_user)
-):
+# Files are transferred to and from S3 in parts of S3_MULTIPART_CHUNK_MB, with up to
+# S3_MULTIPART_CONCURRENCY parts in flight
+S3_MULTIPART_CHUNK_MB = int(os.environ.get("S3_MULTIPART_CHUNK_MB", 8))
+S3_MULTIPART_CONCURRENCY = int(os.environ.get("S3_MULTIPART_CONCURRENCY", 4))
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_CHUNK_MB * 2**20,
+    multipart_chunksize=S3_MULTIPART_CHUNK_MB * 2**20,
+    max_concurrency=S3_MULTIPART_CONCURRENCY,
+)
+
+# Chunks embedded per request to the embedding API, and batches embedded at once
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", 4))
+
+
+@router.post(
+    "/upload",
+    status_code=202,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                    }
+                }
+            },
+        }
+    },
+)
+async def upload_file(request: Request, current_user: dict = Depends(get_current_user)):
     """
-    Function to upload a file to S3 and index it in PGEmbedding.
+    Function to upload a file to S3 and queue its indexing in the vector store.
+
+    The multipart body is streamed straight to the spool directory rather than parsed
+    into an UploadFile, whose own temporary file would write the upload twice.
     """
     user_id = current_user["username"]
-    file_path = f"files/{user_id}/{file.filename}"
+
+    # Step 1: Spool the upload to disk, once, a buffer at a time, hashing it
+    try:
+        file_name, spool_path, sha256 = await spool_upload(
+            request.stream(), request.headers.get("content-type", ""), UPLOAD_SPOOL_DIR
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    file_path = f"files/{user_id}/{file_name}"
     s3_location = f"s3://{S3_BUCKET}/{file_path}"
-    file_extension = file.filename.split(".")[-1].lower()
 
     try:
-        # Step 1: Upload file to S3
-        file_content = await file.read()
-        s3_client.upload_fileobj(BytesIO(file_content), S3_BUCKET, file_path)
+        # Step 2: Stream the spooled file to S3, in concurrent multipart parts
+        await asyncio.to_thread(
+            s3_client.upload_file,
+            spool_path,
+            S3_BUCKET,
+            file_path,
+            Config=S3_TRANSFER_CONFIG,
+        )
 
-        # Step 2: Add file metadata to the database
+        # Step 3: Add file metadata to the database
         file_metadata = FileMetadata(
             user_id=user_id,
-            file_name=file.filename,
+            file_name=file_name,
             s3_location=s3_location,
         )
         await add_file(file_metadata)
 
-        # Step 3: Write file temporarily to disk
-        with tempfile.NamedTemporaryFile(
-            delete=False, suffix=f".{file_extension}"
-        ) as tmp_file:
-            tmp_file.write(file_content)
-            tmp_file_path = tmp_file.name
-
-        # Step 4: Load document content for indexing
-        loader = DocumentLoader(path=tmp_file_path, source=s3_location)
-        documents = await loader.load()
-
-        # Step 4: Get Store from app state
-        store = request.state.store
-
-        # Step 5: Index the document content in PGEmbedding
-        store.load(documents)
+        # Step 4: Queue the indexing of the file, done by the ingestion workers,
+        # which parse the spooled file if they run on this host
+        job_id = await request.state.ingestion.asubmit(
+            user_id, file_name, s3_location, spool_path, sha256
+        )
 
         return {
-            "message": "File uploaded and indexed successfully",
-            "file_name": file.filename,
+            "message": "File uploaded, indexing queued",
+            "file_name": file_name,
+            "job_id": job_id,
         }
     except Exception as e:
+        remove_spooled(spool_path)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/upload/{job_id}")
+async def get_upload_status(
+    job_id: str, request: Request, current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the status, stage and progress of the indexing of an uploaded file.
+    """
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = await request.state.ingestion.queue.aget(job_id, current_user["username"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def ingest_file(
+    job: dict, report, store: Store, parser: Optional[ParserPool] = None
+):
+    """
+    Index an uploaded file in the vector store, for an ingestion job.
+    """
+    file_path = job["s3_location"].split("/", 3)[3]
+    file_extension = job["file_name"].split(".")[-1].lower()
+    file_hash = job.get("sha256")
+    spool_path = job.get("spool_path")
+
+    try:
+        # Step 1: Copy the chunks of an identical file already indexed, for any user
+        # or under any name, without downloading, parsing or embedding it again
+        if file_hash is not None:
+            await report("copying")
+            copied = await store.acopy_file(
+                file_hash, job["s3_location"], job["user_id"], replace=True
+            )
+            if copied is not None:
+                await report("copying", 1, chunks=copied)
+                return
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Step 2: Read the file spooled by the upload on this host, or download
+            # it from S3. The spooled file is parsed once, retries download the file
+            tmp_file_path = spool_path
+            if tmp_file_path is None or not os.path.exists(tmp_file_path):
+                await report("downloading")
+                tmp_file_path = os.path.join(directory, f"upload.{file_extension}")
+                await asyncio.to_thread(
+                    s3_client.download_file,
+                    S3_BUCKET,
+                    file_path,
+                    tmp_file_path,
+                    Config=S3_TRANSFER_CONFIG,
+                )
+            if file_hash is None:
+                file_hash = await asyncio.to_thread(file_sha256, tmp_file_path)
+
+            # Step 3: Index the document content page by page as it is parsed, in
+            # concurrent batches, replacing the chunks of a previous upload of the
+            # file, and remember its chunks for identical uploads
+            await report("parsing")
+            loader = DocumentLoader(
+                path=tmp_file_path, source=job["s3_location"], parser=parser
+            )
+
+            async def on_progress(written: int, total: Optional[int]):
+                progress = None if not total else written / total
+                await report("embedding", progress, chunks=written)
+
+            async with aclosing(loader.lazy_load()) as pages:
+                await store.aload(
+                    ({**page, "user_id": job["user_id"]} async for page in pages),
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    max_concurrency=EMBEDDING_CONCURRENCY,
+                    replace=True,
+                    on_progress=on_progress,
+                    file_hash=file_hash,
+                )
+    finally:
+        if spool_path is not None:
+            remove_spooled(spool_path)
@@ -0,0 +1,207 @@
+"""Module to hold the admission control for expensive routes."""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+from prometheus_client import Counter, Gauge, Histogram
+
+from researcher.metrics import LATENCY_BUCKETS
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "researcher_admission_in_flight",
+    "Requests holding an admission slot, by route.",
+    ["route"],
+)
+ADMISSION_QUEUED = Gauge(
+    "researcher_admission_queued",
+    "Requests waiting for an admission slot, by route.",
+    ["route"],
+)
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "researcher_admission_queue_seconds",
+    "Time admitted requests waited for a slot, by route.",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "researcher_admission_rejected_total",
+    "Requests rejected by admission control, by route and reason.",
+    ["route", "reason"],
+)
+
+
+class AdmissionController:
+    """
+    Bound the number of concurrent requests on a route, with a bounded wait queue.
+
+    Requests beyond `max_concurrency` wait for a slot in a queue of at most
+    `max_queue` requests. A request arriving at a full queue is rejected at once
+    with 429, and a request that waits longer than `queue_timeout` seconds with 503.
+    Both carry a Retry-After header estimated from the recent time slots are held.
+    """
+
+    def __init__(
+        self,
+        route: str,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        """
+        :param route: Route name, used as the metrics label.
+        :param max_concurrency: Maximum number of requests holding a slot.
+        :param max_queue: Maximum number of requests waiting for a slot.
+        :param queue_timeout: Seconds a request may wait for a slot.
+        """
+        self.route = route
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.queued = 0
+        # Moving average of the seconds a slot is held, for Retry-After
+        self.hold_time = 1.0
+
+    def retry_after(self) -> int:
+        """
+        Estimate the seconds until the current queue drains.
+        """
+        batches = (self.queued + 1) / self.max_concurrency
+        return max(1, math.ceil(self.hold_time * batches))
+
+    def _reject(self, status_code: int, reason: str, detail: str):
+        ADMISSION_REJECTED.labels(route=self.route, reason=reason).inc()
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def acquire(self):
+        """
+        Wait for a slot, raising HTTPException if the route is saturated.
+        """
+        if self.semaphore.locked() and self.queued >= self.max_queue:
+            self._reject(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                "queue_full",
+                "Too many requests, try again later",
+            )
+
+        self.queued += 1
+        ADMISSION_QUEUED.labels(route=self.route).inc()
+        start = time.perf_counter()
+        # wait_for can take the slot and still time out, so the acquire is tracked
+        # and its slot given back when abandoned
+        acquiring = asyncio.ensure_future(self.semaphore.acquire())
+        try:
+            done, _ = await asyncio.wait({acquiring}, timeout=self.queue_timeout)
+            if not done:
+                self._abandon(acquiring)
+                self._reject(
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "queue_timeout",
+                    "Service busy, try again later",
+                )
+        except asyncio.CancelledError:
+            self._abandon(acquiring)
+            raise
+        finally:
+            self.queued -= 1
+            ADMISSION_QUEUED.labels(route=self.route).dec()
+
+        ADMISSION_QUEUE_SECONDS.labels(route=self.route).observe(
+            time.perf_counter() - start
+        )
+        ADMISSION_IN_FLIGHT.labels(route=self.route).inc()
+        return time.perf_counter()
+
+    def _abandon(self, acquiring: asyncio.Future):
+        """
+        Cancel an acquire no longer waited for, releasing its slot if it was taken
+        before the cancellation landed.
+        """
+
+        def release_taken(task: asyncio.Future):
+            if not task.cancelled() and task.exception() is None:
+                self.semaphore.release()
+
+        acquiring.cancel()
+        acquiring.add_done_callback(release_taken)
+
+    def release(self, acquired_at: float):
+        """
+        Release a slot acquired at `acquired_at`.
+        """
+        held = time.perf_counter() - acquired_at
+        self.hold_time = 0.9 * self.hold_time + 0.1 * held
+        ADMISSION_IN_FLIGHT.labels(route=self.route).dec()
+        self.semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold a slot for the duration of the context.
+        """
+        acquired_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+
+class AdmittedStream:
+    """
+    Body iterator of a streaming response holding an admission slot.
+
+    The slot is released once, when the stream ends, fails or is closed, or when
+    the stream is garbage collected, so a response dropped before its body was
+    ever iterated, e.g. on an early client disconnect, doesn't leak it.
+    """
+
+    def __init__(
+        self, controller: AdmissionController, acquired_at: float, stream: AsyncIterator
+    ):
+        """
+        :param controller: Controller the slot was acquired from.
+        :param acquired_at: Time the slot was acquired, as returned by `acquire`.
+        :param stream: Async generator of the response body.
+        """
+        self.controller = controller
+        self.acquired_at = acquired_at
+        self.stream = stream
+        self.released = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.stream.__anext__()
+        except BaseException:
+            self.release()
+            raise
+
+    async def aclose(self):
+        """
+        Close the stream and release its slot.
+        """
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+
+    def release(self):
+        """
+        Release the slot, if it wasn't already.
+        """
+        if not self.released:
+            self.released = True
+            self.controller.release(self.acquired_at)
+
+    def __del__(self):
+        self.release()
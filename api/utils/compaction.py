@@ -0,0 +1,48 @@
+"""Module to hold the background compaction of the vector store and caches."""
+
+import asyncio
+import logging
+from typing import List
+
+from researcher.cache import PostgresCache
+from researcher.store import Store
+
+logger = logging.getLogger(__name__)
+
+
+async def compact_periodically(store: Store, interval: float, dead_ratio: float):
+    """
+    Compact the vector store every `interval` seconds, reclaiming the space and
+    index entries of deleted chunks, until cancelled. Failures are logged and
+    retried at the next interval.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            compacted = await store.acompact(dead_ratio=dead_ratio)
+            if compacted:
+                logger.info(f"Compacted vector store tables: {', '.join(compacted)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Vector store compaction failed")
+
+
+async def purge_caches_periodically(caches: List[PostgresCache], interval: float):
+    """
+    Delete the expired entries of the Postgres caches every `interval` seconds,
+    until cancelled. Failures are logged and retried at the next interval.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for cache in caches:
+            try:
+                purged = await cache.apurge()
+                if purged:
+                    logger.info(
+                        f"Purged {purged} expired entries of {cache.table_name}"
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Purging cache {cache.table_name} failed")
@@ -0,0 +1,359 @@
+"""Module to hold the background ingestion of uploaded files."""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from researcher.metrics import LATENCY_BUCKETS
+from researcher.utils.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+INGESTION_JOBS = Counter(
+    "researcher_ingestion_jobs_total",
+    "Ingestion jobs finished by the workers, by outcome.",
+    ["outcome"],
+)
+INGESTION_RUNNING = Gauge(
+    "researcher_ingestion_running",
+    "Ingestion jobs being processed by the workers of this process.",
+)
+INGESTION_SECONDS = Histogram(
+    "researcher_ingestion_seconds",
+    "Time taken by an ingestion job attempt, by outcome.",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Reports the current stage of a job and, optionally, its progress within it and the
+# number of chunks indexed
+Reporter = Callable[..., Awaitable[None]]
+
+
+class IngestionQueue:
+    """
+    Queue of ingestion jobs persisted to a PostgreSQL table, shared by every worker.
+
+    A job is claimed by a single worker with `FOR UPDATE SKIP LOCKED` and keeps its
+    lease while the worker reports progress. A job whose lease expired, because its
+    worker died, is claimed again by another worker.
+    """
+
+    def __init__(
+        self,
+        table_name: str = "ingestion_jobs",
+        lease: float = 300,
+        async_connection=get_db_connection,
+    ):
+        """
+        :param table_name: Name of the table holding the jobs.
+        :param lease: Seconds without progress after which a running job is reclaimed.
+        :param async_connection: Async context manager yielding a connection.
+        """
+        self.table_name = table_name
+        self.lease = lease
+        self.async_connection = async_connection
+
+    async def acreate_table(self):
+        """
+        Create the jobs table if it doesn't exist.
+        """
+        query = sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {table} (
+                id UUID PRIMARY KEY,
+                user_id VARCHAR(255) NOT NULL,
+                file_name VARCHAR(255) NOT NULL,
+                s3_location VARCHAR(255) NOT NULL,
+                spool_path TEXT,
+                sha256 TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                stage TEXT NOT NULL DEFAULT 'queued',
+                progress REAL NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            CREATE INDEX IF NOT EXISTS {index} ON {table} (created_at)
+            WHERE status IN ('queued', 'running');
+            """
+        ).format(
+            table=sql.Identifier(self.table_name),
+            index=sql.Identifier(f"{self.table_name}_pending_idx"),
+        )
+        async with self.async_connection() as connection:
+            await connection.execute(query)
+
+    async def aenqueue(
+        self,
+        user_id: str,
+        file_name: str,
+        s3_location: str,
+        spool_path: Optional[str] = None,
+        sha256: Optional[str] = None,
+    ) -> str:
+        """
+        Queue the ingestion of an uploaded file.
+
+        :param spool_path: Local copy of the file, read instead of downloading it
+                           from S3 by a worker of the same host.
+        :param sha256: Hex digest of the file content, used to reuse the chunks of
+                       an identical file already indexed.
+        :return: The id of the job.
+        """
+        job_id = str(uuid.uuid4())
+        query = sql.SQL(
+            "INSERT INTO {table} "
+            "(id, user_id, file_name, s3_location, spool_path, sha256) "
+            "VALUES (%s, %s, %s, %s, %s, %s)"
+        ).format(table=sql.Identifier(self.table_name))
+        async with self.async_connection() as connection:
+            await connection.execute(
+                query, (job_id, user_id, file_name, s3_location, spool_path, sha256)
+            )
+        return job_id
+
+    async def aclaim(self) -> Optional[dict]:
+        """
+        Claim the oldest queued job, or a running job whose lease expired.
+
+        :return: The claimed job, or None if there is none.
+        """
+        query = sql.SQL(
+            """
+            UPDATE {table}
+            SET status = 'running', stage = 'starting', progress = 0, chunks = 0,
+                attempts = attempts + 1, updated_at = NOW()
+            WHERE id = (
+                SELECT id FROM {table}
+                WHERE status = 'queued'
+                OR (status = 'running'
+                    AND updated_at < NOW() - make_interval(secs => %s))
+                ORDER BY created_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id::text, user_id, file_name, s3_location, spool_path,
+                sha256, attempts;
+            """
+        ).format(table=sql.Identifier(self.table_name))
+        async with self.async_connection() as connection:
+            async with connection.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(query, (self.lease,))
+                return await cursor.fetchone()
+
+    async def aupdate(
+        self,
+        job_id: str,
+        attempt: int,
+        stage: str,
+        progress: Optional[float] = None,
+        chunks: Optional[int] = None,
+    ) -> bool:
+        """
+        Record the stage, progress and number of chunks indexed of a running job,
+        renewing its lease.
+
+        :return: False if the job was reclaimed since the attempt started.
+        """
+        query = sql.SQL(
+            """
+            UPDATE {table}
+            SET stage = %s, progress = COALESCE(%s, progress),
+                chunks = COALESCE(%s, chunks), updated_at = NOW()
+            WHERE id = %s AND attempts = %s AND status = 'running';
+            """
+        ).format(table=sql.Identifier(self.table_name))
+        async with self.async_connection() as connection:
+            cursor = await connection.execute(
+                query, (stage, progress, chunks, job_id, attempt)
+            )
+            return cursor.rowcount > 0
+
+    async def acomplete(self, job_id: str, attempt: int):
+        """
+        Mark a running job as succeeded.
+        """
+        query = sql.SQL(
+            """
+            UPDATE {table}
+            SET status = 'succeeded', stage = 'done', progress = 1, error = NULL,
+                updated_at = NOW()
+            WHERE id = %s AND attempts = %s AND status = 'running';
+            """
+        ).format(table=sql.Identifier(self.table_name))
+        async with self.async_connection() as connection:
+            await connection.execute(query, (job_id, attempt))
+
+    async def afail(self, job_id: str, attempt: int, error: str, retry: bool):
+        """
+        Record the failure of a running job, queuing it again if `retry`.
+        """
+        query = sql.SQL(
+            """
+            UPDATE {table}
+            SET status = %s, stage = %s, error = %s, updated_at = NOW()
+            WHERE id = %s AND attempts = %s AND status = 'running';
+            """
+        ).format(table=sql.Identifier(self.table_name))
+        status = "queued" if retry else "failed"
+        async with self.async_connection() as connection:
+            await connection.execute(query, (status, status, error, job_id, attempt))
+
+    async def aget(self, job_id: str, user_id: str) -> Optional[dict]:
+        """
+        Return a job of the user, or None if the user has no such job.
+        """
+        query = sql.SQL(
+            """
+            SELECT id::text AS job_id, file_name, s3_location, status, stage,
+                progress, chunks, attempts, error, created_at, updated_at
+            FROM {table}
+            WHERE id = %s AND user_id = %s;
+            """
+        ).format(table=sql.Identifier(self.table_name))
+        async with self.async_connection() as connection:
+            async with connection.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(query, (job_id, user_id))
+                return await cursor.fetchone()
+
+
+class IngestionWorkers:
+    """
+    Pool of asyncio workers processing the jobs of an IngestionQueue in the
+    background, with `handler(job, report)`.
+
+    Idle workers poll the queue every `poll_interval` seconds, and are woken at once
+    by `asubmit` for the jobs queued by this process. A job failing is retried until
+    it has been attempted `max_attempts` times, then marked as failed with its error.
+    """
+
+    def __init__(
+        self,
+        queue: IngestionQueue,
+        handler: Callable[[dict, Reporter], Awaitable[None]],
+        workers: int = 2,
+        poll_interval: float = 5,
+        max_attempts: int = 3,
+    ):
+        """
+        :param queue: Queue of the jobs.
+        :param handler: Coroutine function processing a job, awaiting
+                        `report(stage, progress=None, chunks=None)` as it goes.
+        :param workers: Number of jobs processed concurrently.
+        :param poll_interval: Seconds between polls of the queue by idle workers.
+        :param max_attempts: Maximum number of attempts of a job.
+        """
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """
+        Start the workers.
+        """
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Stop the workers, interrupting their jobs, which are reclaimed once their
+        lease expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def asubmit(
+        self,
+        user_id: str,
+        file_name: str,
+        s3_location: str,
+        spool_path: Optional[str] = None,
+        sha256: Optional[str] = None,
+    ) -> str:
+        """
+        Queue the ingestion of an uploaded file and wake an idle worker.
+
+        :return: The id of the job.
+        """
+        job_id = await self.queue.aenqueue(
+            user_id, file_name, s3_location, spool_path, sha256
+        )
+        self._wakeup.set()
+        return job_id
+
+    async def _run(self):
+        while True:
+            try:
+                job = await self.queue.aclaim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Claiming an ingestion job failed")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(job)
+
+    async def _process(self, job: dict):
+        job_id, attempt = job["id"], job["attempts"]
+        current = {"stage": "starting"}
+
+        async def report(
+            stage: str, progress: Optional[float] = None, chunks: Optional[int] = None
+        ):
+            current["stage"] = stage
+            if not await self.queue.aupdate(job_id, attempt, stage, progress, chunks):
+                logger.warning(f"Ingestion job {job_id} was reclaimed")
+
+        async def heartbeat():
+            # Renew the lease through stages reporting no progress, like parsing
+            while True:
+                await asyncio.sleep(self.queue.lease / 3)
+                try:
+                    await self.queue.aupdate(job_id, attempt, current["stage"])
+                except Exception:
+                    logger.exception(f"Renewing the lease of job {job_id} failed")
+
+        INGESTION_RUNNING.inc()
+        start = time.perf_counter()
+        lease = asyncio.create_task(heartbeat())
+        try:
+            if attempt > self.max_attempts:
+                raise RuntimeError(f"Gave up after {self.max_attempts} attempts")
+            await self.handler(job, report)
+            await self.queue.acomplete(job_id, attempt)
+            outcome = "succeeded"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            retry = attempt < self.max_attempts
+            outcome = "retried" if retry else "failed"
+            logger.exception(f"Ingestion job {job_id} failed, attempt {attempt}")
+            try:
+                await self.queue.afail(job_id, attempt, str(e), retry)
+            except Exception:
+                logger.exception(f"Recording the failure of job {job_id} failed")
+        finally:
+            lease.cancel()
+            INGESTION_RUNNING.dec()
+        INGESTION_JOBS.labels(outcome=outcome).inc()
+        INGESTION_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - start)
@@ -0,0 +1,177 @@
+"""Module to hold the spooling of uploaded files to disk."""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator, Tuple
+
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Bytes buffered before being written, bounding the memory used per upload
+SPOOL_BUFFER_SIZE = 2**20
+
+
+async def spool_upload(
+    stream: AsyncIterator[bytes], content_type: str, directory: str, field: str = "file"
+) -> Tuple[str, str, str]:
+    """
+    Stream the file of a multipart/form-data request body to a new file of the spool
+    directory, hashing its content on the way, so that the upload is written to disk
+    once and only a buffer of it is held in memory.
+
+    :param stream: The chunks of the request body.
+    :param content_type: The Content-Type header of the request, with its boundary.
+    :param directory: The spool directory.
+    :param field: The form field of the file; other fields are ignored.
+    :return: The name of the uploaded file, the path of the spooled file, removed by
+             its reader, and the SHA-256 hex digest of its content.
+    """
+    _, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise ValueError("Upload is not a multipart/form-data body")
+
+    part = {}
+    upload = {}
+    buffer = bytearray()
+
+    def on_part_begin():
+        part.clear()
+        part.update(header=b"", value=b"", disposition=b"", data=False)
+
+    def on_header_field(data: bytes, start: int, end: int):
+        part["header"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        if part["header"].lower() == b"content-disposition":
+            part["disposition"] = part["value"]
+        part.update(header=b"", value=b"")
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["disposition"])
+        if (
+            "file_name" not in upload
+            and options.get(b"name") == field.encode()
+            and b"filename" in options
+        ):
+            upload["file_name"] = options[b"filename"].decode("utf-8", "replace")
+            part["data"] = True
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if part["data"]:
+            buffer.extend(data[start:end])
+
+    def on_part_end():
+        if part["data"]:
+            upload["complete"] = True
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    digest = hashlib.sha256()
+    path = None
+    spooled = None
+
+    async def flush():
+        chunk = bytes(buffer)
+        buffer.clear()
+        digest.update(chunk)
+        await asyncio.to_thread(spooled.write, chunk)
+
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            if spooled is None and "file_name" in upload:
+                extension = upload["file_name"].split(".")[-1].lower()
+                path = os.path.join(directory, f"{uuid.uuid4().hex}.{extension}")
+                await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+                spooled = await asyncio.to_thread(open, path, "wb")
+            if spooled is not None and len(buffer) >= SPOOL_BUFFER_SIZE:
+                await flush()
+        parser.finalize()
+        if "complete" not in upload:
+            raise ValueError(f"Upload has no complete '{field}' file field")
+        await flush()
+        await asyncio.to_thread(spooled.close)
+    except BaseException:
+        if spooled is not None:
+            spooled.close()
+            remove_spooled(path)
+        raise
+    return upload["file_name"], path, digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hash the content of a file, a buffer at a time.
+
+    :return: The SHA-256 hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while buffer := file.read(SPOOL_BUFFER_SIZE):
+            digest.update(buffer)
+    return digest.hexdigest()
+
+
+def remove_spooled(path: str):
+    """
+    Remove a spooled file, if it still exists.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clean_spool(directory: str, max_age: float) -> int:
+    """
+    Remove the files of the spool directory older than `max_age` seconds, left
+    behind by uploads indexed on another host or by a crashed process.
+
+    :return: The number of files removed.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            remove_spooled(entry.path)
+            removed += 1
+    if removed:
+        logger.info(f"Removed {removed} stale spooled uploads from {directory}")
+    return removed
+
+
+async def clean_spool_periodically(directory: str, max_age: float, interval: float):
+    """
+    Remove the stale files of the spool directory every `interval` seconds, until
+    cancelled. Failures are logged and retried at the next interval.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(clean_spool, directory, max_age)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Cleaning spool directory {directory} failed")
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, List, Optional, Type
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+
+def _fraction(text: str) -> float:
+    """Map a text to a deterministic number in [0, 1)."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatOpenAI with an injected latency.
+
+    Replies depend only on the prompt, so concurrent runs take the same path through
+    the graph whatever the scheduling. Validation prompts are answered "yes" for a
+    `pass_rate` fraction of prompts, and structured output is supported for
+    self-assessment mode, passing with the same rate.
+    """
+
+    latency: float = 0.0
+    pass_rate: float = 0.5
+    tokens: int = 100
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self._llm_type, "pass_rate": self.pass_rate}
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "Answer 'yes' or 'no'" in prompt:
+            content = "yes" if _fraction(prompt) < self.pass_rate else "no"
+        else:
+            content = f"reply {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}"
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": self.tokens // 2,
+                "output_tokens": self.tokens - self.tokens // 2,
+                "total_tokens": self.tokens,
+            },
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def with_structured_output(
+        self, schema: Type[BaseModel], include_raw: bool = False, **kwargs: Any
+    ):
+        async def assess(prompt: Any) -> Any:
+            raw = await self.ainvoke(prompt)
+            complete = _fraction(raw.content) < self.pass_rate
+            parsed = schema(
+                answer=raw.content,
+                confidence=0.9 if complete else 0.3,
+                complete=complete,
+                follow_up_query=None if complete else f"follow up {raw.content}",
+            )
+            if include_raw:
+                return {"raw": raw, "parsed": parsed, "parsing_error": None}
+            return parsed
+
+        return RunnableLambda(assess)
+
+
+class FakeRetriever:
+    """Stand-in for TavilyRetriever returning synthetic results after a latency."""
+
+    def __init__(self, latency: float = 0.0, max_results: int = 2):
+        self.latency = latency
+        self.max_results = max_results
+
+    async def search(self, query: str):
+        await asyncio.sleep(self.latency)
+        return [
+            {"url": f"https://example.com/{i}", "content": f"Result {i} for {query}"}
+            for i in range(self.max_results)
+        ]
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings with an injected latency per call."""
+
+    latency: float = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
@@ -0,0 +1,158 @@
+"""
+Benchmark the Researcher graph offline.
+
+The real graph is compiled against deterministic stand-ins for the LLM, web search
+and embeddings with injected latencies, then driven with concurrent runs:
+
+    python -m benchmarks.graph_benchmark --requests 200 --concurrency 20
+
+Reports requests per second, p50/p99 latency and iterations per request.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+import uuid
+from typing import List
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakeRetriever  # noqa: E402
+from researcher.checkpoint import BaseCheckpointManager  # noqa: E402
+from researcher.graph.researcher import Researcher  # noqa: E402
+from researcher.llm import LLMProvider  # noqa: E402
+from researcher.store.vectorstore import Store  # noqa: E402
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def build_store(args) -> Store:
+    """Load a FAISS store with synthetic files, searched by every run."""
+    embeddings = FakeEmbeddings(
+        size=args.embedding_size, latency=args.embedding_latency
+    )
+    store = Store(embeddings=embeddings)
+    store.load(
+        [
+            {
+                "raw_content": " ".join(
+                    f"Paragraph {i} of file {n} about topic {i % 17}."
+                    for i in range(200)
+                ),
+                "url": f"file-{n}.pdf",
+            }
+            for n in range(args.files)
+        ]
+    )
+    return store
+
+
+async def run_benchmark(args) -> dict:
+    store = build_store(args)
+    checkpoint_manager = BaseCheckpointManager(
+        checkpoint_type="postgres" if args.postgres else None,
+        conn_string=args.postgres,
+    )
+    researcher = await Researcher.create_researcher(
+        store,
+        checkpoint_manager=checkpoint_manager,
+        llm=LLMProvider(
+            FakeChatModel(latency=args.llm_latency, pass_rate=args.pass_rate)
+        ),
+        retriever=FakeRetriever(latency=args.search_latency),
+        max_iterations=args.max_iterations,
+        self_assessment=args.self_assessment,
+    )
+    files = [f"file-{n}.pdf" for n in range(args.files)]
+
+    async with researcher.checkpointer.get_checkpointer() as checkpointer:
+        if args.postgres:
+            await checkpointer.setup()
+        graph = researcher.graph.compile(checkpointer=checkpointer)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies, iterations = [], []
+
+        async def run(index: int):
+            state = {
+                "question": f"Question {index}?",
+                "chat_history": [],
+                "files": files,
+            }
+            config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+            async with semaphore:
+                start = time.perf_counter()
+                result = await graph.ainvoke(state, config=config)
+                latencies.append(time.perf_counter() - start)
+                iterations.append(result["iterations"])
+
+        await asyncio.gather(*(run(index) for index in range(args.warmup)))
+        latencies.clear()
+        iterations.clear()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(index) for index in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": elapsed,
+        "requests_per_s": args.requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_iterations": sum(iterations) / len(iterations),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="seconds")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="seconds")
+    parser.add_argument("--embedding-size", type=int, default=1536)
+    parser.add_argument(
+        "--pass-rate",
+        type=float,
+        default=0.5,
+        help="fraction of responses passing validation",
+    )
+    parser.add_argument("--max-iterations", type=int, default=4)
+    parser.add_argument("--files", type=int, default=5, help="synthetic files searched")
+    parser.add_argument("--self-assessment", action="store_true")
+    parser.add_argument(
+        "--postgres",
+        metavar="CONN_STRING",
+        help="checkpoint to Postgres instead of memory",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(results))
+        return
+    for name, value in results.items():
+        print(
+            f"{name:>16}: {value:.2f}"
+            if isinstance(value, float)
+            else f"{name:>16}: {value}"
+        )
+
+
+if __name__ == "__main__":
+    main()
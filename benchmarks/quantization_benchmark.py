@@ -0,0 +1,220 @@
+"""
+Benchmark the recall of quantized vector storage against float32.
+
+Synthetic clustered embeddings are stored at full precision and quantized in the
+default FAISS store and, with --postgres, in pgvector tables, then searched with
+queries near the stored vectors:
+
+    python -m benchmarks.quantization_benchmark --vectors 20000 --queries 200
+
+Reports recall@k against the exact float32 neighbours, the storage size and the
+mean query latency of every configuration. pgvector quantization needs pgvector 0.7
+or later.
+
+FAISS vectors are appended in batches of --batch-size, as when loading files, and
+int8 is trained on the first --training-size of them. FAISS searches rank the
+quantized vectors without rescoring them at full precision, so their recall is the
+recall of the quantization itself.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import numpy as np
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from benchmarks.fakes import FakeEmbeddings  # noqa: E402
+from researcher.store import PGVectorStore, Store  # noqa: E402
+
+
+def synthetic_embeddings(
+    count: int, dimensions: int, clusters: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Unit vectors scattered around random cluster centres, like topical chunks."""
+    centres = rng.standard_normal((clusters, dimensions))
+    vectors = centres[rng.integers(clusters, size=count)]
+    vectors += 0.5 * rng.standard_normal((count, dimensions))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k nearest vectors of every query, by cosine similarity."""
+    return np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+
+
+def recall(results: List[List[int]], truth: np.ndarray) -> float:
+    """Mean fraction of the exact neighbours found by every query."""
+    found = [len(set(result) & set(exact)) for result, exact in zip(results, truth)]
+    return sum(found) / truth.size
+
+
+def run_faiss(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    quantization: Optional[str],
+    batch_size: int,
+    training_size: int,
+) -> dict:
+    store = Store(
+        embeddings=FakeEmbeddings(size=corpus.shape[1]),
+        quantization=quantization,
+        quantization_training_size=training_size,
+    )
+    for offset in range(0, len(corpus), batch_size):
+        batch = corpus[offset : offset + batch_size]
+        store._add_faiss_embeddings(
+            [str(offset + i) for i in range(len(batch))],
+            batch.tolist(),
+            [{"source": "benchmark"} for _ in range(len(batch))],
+        )
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        documents = store.vector_store.similarity_search_by_vector(query.tolist(), k=k)
+        results.append([int(doc.page_content) for doc in documents])
+    elapsed = time.perf_counter() - start
+    return {
+        "results": results,
+        "bytes_per_vector": store.vector_store.index.code_size,
+        "query_ms": elapsed / len(queries) * 1000,
+    }
+
+
+async def run_postgres(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    quantization: Optional[str],
+    conn_string: str,
+    ef_search: int,
+) -> dict:
+    import psycopg
+
+    @asynccontextmanager
+    async def connect():
+        async with await psycopg.AsyncConnection.connect(conn_string) as connection:
+            yield connection
+
+    table_name = f"quantization_benchmark_{quantization or 'float32'}"
+    vector_store = PGVectorStore(
+        FakeEmbeddings(size=corpus.shape[1]),
+        table_name=table_name,
+        dimensions=corpus.shape[1],
+        quantization=quantization,
+        ef_search=ef_search,
+        async_connection=connect,
+    )
+    async with connect() as connection:
+        await connection.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    await vector_store.acreate_table()
+    for offset in range(0, len(corpus), 1000):
+        batch = corpus[offset : offset + 1000]
+        await vector_store.aadd_embeddings(
+            [str(offset + i) for i in range(len(batch))],
+            batch.tolist(),
+            [{"source": "benchmark"} for _ in range(len(batch))],
+        )
+
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        documents = await vector_store.asimilarity_search_by_vector(query.tolist(), k=k)
+        results.append([int(doc.page_content) for doc, _ in documents])
+    elapsed = time.perf_counter() - start
+
+    async with connect() as connection:
+        cursor = await connection.execute(
+            "SELECT pg_table_size(%s), pg_indexes_size(%s)", [table_name, table_name]
+        )
+        table_size, index_size = await cursor.fetchone()
+        await connection.execute(f'DROP TABLE "{table_name}"')
+    return {
+        "results": results,
+        "table_mb": table_size / 2**20,
+        "index_mb": index_size / 2**20,
+        "query_ms": elapsed / len(queries) * 1000,
+    }
+
+
+async def run_benchmark(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    corpus = synthetic_embeddings(args.vectors, args.dimensions, args.clusters, rng)
+    queries = corpus[rng.integers(len(corpus), size=args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_neighbours(corpus, queries, args.k)
+
+    runs = {}
+    for quantization in (None, "float16", "int8"):
+        runs[f"faiss/{quantization or 'float32'}"] = run_faiss(
+            corpus, queries, args.k, quantization, args.batch_size, args.training_size
+        )
+    if args.postgres:
+        for quantization in (None, *args.postgres_quantizations):
+            runs[f"postgres/{quantization or 'float32'}"] = await run_postgres(
+                corpus, queries, args.k, quantization, args.postgres, args.ef_search
+            )
+
+    report = {}
+    for name, run in runs.items():
+        results = run.pop("results")
+        report[name] = {f"recall@{args.k}": recall(results, truth), **run}
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=10000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="vectors appended to FAISS at once"
+    )
+    parser.add_argument(
+        "--training-size",
+        type=int,
+        default=1024,
+        help="vectors the FAISS int8 quantizer is trained on",
+    )
+    parser.add_argument(
+        "--postgres",
+        metavar="CONN_STRING",
+        help="also benchmark pgvector tables in this database",
+    )
+    parser.add_argument(
+        "--postgres-quantizations",
+        type=lambda value: value.split(",") if value else [],
+        default=["float16", "binary"],
+        help="comma-separated pgvector quantizations compared with float32",
+    )
+    parser.add_argument("--ef-search", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report))
+        return
+    for name, results in report.items():
+        print(
+            f"{name:>16}: "
+            + ", ".join(f"{metric} {value:.3f}" for metric, value in results.items())
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+-- Record the owner of the chunks uploaded to the legacy PGEmbedding store before
+-- they carried one, taken from their source, s3://<bucket>/files/<user_id>/<file name>.
+-- Searches are restricted to the chunks of the requesting user.
+UPDATE langchain_pg_embedding
+SET cmetadata = (
+    cmetadata::jsonb || jsonb_build_object('user_id', split_part(cmetadata->>'source', '/', 5))
+)::json
+WHERE cmetadata->>'user_id' IS NULL AND cmetadata->>'source' LIKE 's3://%/files/%/%';
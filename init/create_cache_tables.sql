@@ -0,0 +1,21 @@
+-- Expired entries are deleted periodically by the API, by creation time
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    value JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS llm_cache_created_at_idx ON llm_cache (created_at);
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    key TEXT PRIMARY KEY,
+    value JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS embedding_cache_created_at_idx ON embedding_cache (created_at);
+
+CREATE TABLE IF NOT EXISTS file_cache (
+    key TEXT PRIMARY KEY,
+    value JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS file_cache_created_at_idx ON file_cache (created_at);
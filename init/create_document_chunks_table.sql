@@ -0,0 +1,23 @@
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- Partitioned by owner, the partition of each user is created on their first upload
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id BIGSERIAL,
+    user_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    chunk_hash TEXT,
+    content TEXT NOT NULL,
+    metadata JSONB NOT NULL DEFAULT '{}',
+    embedding vector(1536) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+    PRIMARY KEY (user_id, id)
+) PARTITION BY LIST (user_id);
+
+CREATE INDEX IF NOT EXISTS document_chunks_embedding_idx
+    ON document_chunks USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS document_chunks_tsv_idx ON document_chunks USING gin (tsv);
+CREATE INDEX IF NOT EXISTS document_chunks_source_idx ON document_chunks (source);
+CREATE INDEX IF NOT EXISTS document_chunks_user_id_idx ON document_chunks (user_id);
+CREATE INDEX IF NOT EXISTS document_chunks_chunk_hash_idx ON document_chunks (chunk_hash);
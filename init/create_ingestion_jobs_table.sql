@@ -0,0 +1,20 @@
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id UUID PRIMARY KEY,
+    user_id VARCHAR(255) NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    s3_location VARCHAR(255) NOT NULL,
+    spool_path TEXT,
+    sha256 TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Workers claim the oldest pending job
+CREATE INDEX IF NOT EXISTS ingestion_jobs_pending_idx ON ingestion_jobs (created_at)
+WHERE status IN ('queued', 'running');
@@ -1 +1,2 @@
 CREATE EXTENSION IF NOT EXISTS embedding;
+CREATE EXTENSION IF NOT EXISTS vector;
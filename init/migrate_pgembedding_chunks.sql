@@ -0,0 +1,57 @@
+-- Copy the chunks of the legacy PGEmbedding store (the user_files collection of
+-- langchain_pg_embedding) into document_chunks, for deployments switching to the
+-- pgvector backend. Run it after create_document_chunks_table.sql, or after starting
+-- the API once, and before uploads are indexed into document_chunks. Chunks stored
+-- without an owner are given the one in their source,
+-- s3://<bucket>/files/<user_id>/<file name>. Sources already in document_chunks are
+-- skipped, so the script can be run again.
+BEGIN;
+
+CREATE TEMPORARY TABLE legacy_chunks ON COMMIT DROP AS
+SELECT
+    COALESCE(e.cmetadata->>'user_id', split_part(e.cmetadata->>'source', '/', 5)) AS user_id,
+    e.cmetadata->>'source' AS source,
+    e.cmetadata->>'chunk_hash' AS chunk_hash,
+    e.document AS content,
+    e.cmetadata::jsonb AS metadata,
+    e.embedding::vector AS embedding
+FROM langchain_pg_embedding e
+JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+WHERE c.name = 'user_files' AND e.cmetadata->>'source' IS NOT NULL;
+
+DELETE FROM legacy_chunks l
+WHERE l.user_id = '' OR EXISTS (
+    SELECT 1 FROM document_chunks d WHERE d.source = l.source AND d.user_id = l.user_id
+);
+
+-- Partitions are named after a hash of the user id, as PGVectorStore.partition_name
+DO $$
+DECLARE
+    owner TEXT;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_partitioned_table
+        WHERE partrelid = 'document_chunks'::regclass
+    ) THEN
+        FOR owner IN SELECT DISTINCT user_id FROM legacy_chunks
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF document_chunks FOR VALUES IN (%L)',
+                'document_chunks_u_' || left(encode(sha256(convert_to(owner, 'UTF8')), 'hex'), 16),
+                owner
+            );
+        END LOOP;
+    END IF;
+END $$;
+
+INSERT INTO document_chunks (user_id, source, chunk_hash, content, metadata, embedding)
+SELECT
+    user_id,
+    source,
+    chunk_hash,
+    content,
+    metadata || jsonb_build_object('user_id', user_id),
+    embedding
+FROM legacy_chunks;
+
+COMMIT;
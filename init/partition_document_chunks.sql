@@ -0,0 +1,63 @@
+-- Migrate an existing document_chunks table to one list-partitioned by owner, with a
+-- partition per user. Run it once, while uploads are stopped, before starting the
+-- API with VECTOR_STORE_PARTITION_BY_USER=true. Chunks stored without an owner are
+-- given the one in their source, s3://<bucket>/files/<user_id>/<file name>.
+BEGIN;
+
+UPDATE document_chunks SET user_id = split_part(source, '/', 5) WHERE user_id IS NULL;
+
+ALTER TABLE document_chunks RENAME TO document_chunks_unpartitioned;
+ALTER INDEX document_chunks_pkey RENAME TO document_chunks_unpartitioned_pkey;
+ALTER SEQUENCE document_chunks_id_seq RENAME TO document_chunks_unpartitioned_id_seq;
+ALTER INDEX document_chunks_embedding_idx RENAME TO document_chunks_unpartitioned_embedding_idx;
+ALTER INDEX document_chunks_tsv_idx RENAME TO document_chunks_unpartitioned_tsv_idx;
+ALTER INDEX document_chunks_source_idx RENAME TO document_chunks_unpartitioned_source_idx;
+ALTER INDEX document_chunks_user_id_idx RENAME TO document_chunks_unpartitioned_user_id_idx;
+ALTER INDEX document_chunks_chunk_hash_idx RENAME TO document_chunks_unpartitioned_chunk_hash_idx;
+
+CREATE TABLE document_chunks (
+    id BIGSERIAL,
+    user_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    chunk_hash TEXT,
+    content TEXT NOT NULL,
+    metadata JSONB NOT NULL DEFAULT '{}',
+    embedding vector(1536) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+    PRIMARY KEY (user_id, id)
+) PARTITION BY LIST (user_id);
+
+-- Indexes of the partitioned table are created on every partition
+CREATE INDEX document_chunks_embedding_idx
+    ON document_chunks USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+CREATE INDEX document_chunks_tsv_idx ON document_chunks USING gin (tsv);
+CREATE INDEX document_chunks_source_idx ON document_chunks (source);
+CREATE INDEX document_chunks_user_id_idx ON document_chunks (user_id);
+CREATE INDEX document_chunks_chunk_hash_idx ON document_chunks (chunk_hash);
+
+-- Partitions are named after a hash of the user id, as PGVectorStore.partition_name
+DO $$
+DECLARE
+    owner TEXT;
+BEGIN
+    FOR owner IN
+        SELECT DISTINCT user_id FROM document_chunks_unpartitioned
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF document_chunks FOR VALUES IN (%L)',
+            'document_chunks_u_' || left(encode(sha256(convert_to(owner, 'UTF8')), 'hex'), 16),
+            owner
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO document_chunks
+    (user_id, source, chunk_hash, content, metadata, embedding, created_at)
+SELECT user_id, source, chunk_hash, content, metadata, embedding, created_at
+FROM document_chunks_unpartitioned;
+
+DROP TABLE document_chunks_unpartitioned;
+
+COMMIT;
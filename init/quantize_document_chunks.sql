@@ -0,0 +1,22 @@
+-- Store the embeddings of an existing document_chunks table as half-precision halfvec,
+-- halving the size of the table and of its HNSW index. Run it once, while uploads are
+-- stopped, before starting the API with VECTOR_STORE_QUANTIZATION=float16. Needs
+-- pgvector 0.7 or later.
+BEGIN;
+
+DROP INDEX IF EXISTS document_chunks_embedding_idx;
+
+ALTER TABLE document_chunks ALTER COLUMN embedding TYPE halfvec(1536)
+    USING embedding::halfvec(1536);
+
+CREATE INDEX document_chunks_embedding_idx
+    ON document_chunks USING hnsw (embedding halfvec_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+-- With VECTOR_STORE_QUANTIZATION=binary, index the sign bits of the embeddings
+-- instead:
+-- CREATE INDEX document_chunks_embedding_idx
+--     ON document_chunks USING hnsw ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops)
+--     WITH (m = 16, ef_construction = 64);
+
+COMMIT;
@@ -1,4 +1,8 @@
+import os
+
 from researcher.graph.researcher import Researcher
+from researcher.store.vectorstore import Store
 
-researcher = Researcher()
+# Persist the FAISS store of uploaded files across restarts when a directory is set
+researcher = Researcher(Store(persist_directory=os.environ.get("VECTOR_STORE_DIR")))
 graph = researcher.get_graph().compile()
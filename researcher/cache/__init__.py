@@ -0,0 +1,11 @@
+from .cache import BaseCache, LRUCache, PostgresCache, TieredCache, hash_key
+from .singleflight import SingleFlight
+
+__all__ = [
+    "BaseCache",
+    "LRUCache",
+    "PostgresCache",
+    "SingleFlight",
+    "TieredCache",
+    "hash_key",
+]
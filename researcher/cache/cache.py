@@ -0,0 +1,229 @@
+"""
+Cache utilities for the Researcher app.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from psycopg import sql
+from psycopg.types.json import Jsonb
+
+from researcher.utils.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+def hash_key(*parts: Any) -> str:
+    """
+    Build a cache key from the SHA-256 hash of the JSON encoded parts.
+
+    :param parts: The values identifying the cached item, e.g. model params and prompt.
+    :return: The hex digest of the key.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BaseCache:
+    """
+    Base class for the asynchronous key-value caches, counting hits and misses.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """
+        Return the cached value for the key, or None on a miss.
+        """
+        raise NotImplementedError
+
+    async def aset(self, key: str, value: Any):
+        """
+        Store the value under the key.
+        """
+        raise NotImplementedError
+
+    def _record(self, value: Optional[Any]) -> Optional[Any]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+
+class LRUCache(BaseCache):
+    """
+    Bounded in-process cache evicting the least recently used entries, with an
+    optional time to live.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        """
+        :param max_size: Maximum number of entries kept in memory.
+        :param ttl: Seconds after which an entry expires, or None to never expire.
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Sync callers may run in worker threads, so guard the entries
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return the cached value for the key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is not None and expires_at <= time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+            return self._record(None if entry is None else value)
+
+    def set(self, key: str, value: Any):
+        """
+        Store the value under the key, evicting the least recently used entry
+        when the cache is full.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any):
+        self.set(key, value)
+
+
+class PostgresCache(BaseCache):
+    """
+    Cache persisted to a PostgreSQL table, shared by every worker. Values must be
+    JSON serializable. Database errors are logged and treated as misses so the
+    cache never fails the request it serves. Expired entries are ignored by reads
+    and deleted by `apurge`, which should run periodically.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        ttl: Optional[float] = None,
+        async_connection=get_db_connection,
+    ):
+        """
+        :param table_name: Name of the table holding the cache entries.
+        :param ttl: Seconds after which an entry expires, or None to never expire.
+        :param async_connection: Async context manager yielding a connection.
+        """
+        super().__init__()
+        self.table_name = table_name
+        self.ttl = ttl
+        self.async_connection = async_connection
+
+    async def acreate_table(self):
+        """
+        Create the cache table and the index purges scan if they don't exist.
+        """
+        query = sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value JSONB NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            CREATE INDEX IF NOT EXISTS {index} ON {table} (created_at);
+            """
+        ).format(
+            table=sql.Identifier(self.table_name),
+            index=sql.Identifier(f"{self.table_name}_created_at_idx"),
+        )
+        async with self.async_connection() as connection:
+            await connection.execute(query)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        query = sql.SQL(
+            """
+            SELECT value FROM {table}
+            WHERE key = %s
+            AND (%s::float IS NULL OR created_at > NOW() - make_interval(secs => %s));
+            """
+        ).format(table=sql.Identifier(self.table_name))
+        try:
+            async with self.async_connection() as connection:
+                cursor = await connection.execute(query, (key, self.ttl, self.ttl))
+                row = await cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"Cache lookup in {self.table_name} failed: {e}")
+            row = None
+        return self._record(row[0] if row else None)
+
+    async def aset(self, key: str, value: Any):
+        query = sql.SQL(
+            """
+            INSERT INTO {table} (key, value) VALUES (%s, %s)
+            ON CONFLICT (key) DO UPDATE
+            SET value = EXCLUDED.value, created_at = NOW();
+            """
+        ).format(table=sql.Identifier(self.table_name))
+        try:
+            async with self.async_connection() as connection:
+                await connection.execute(query, (key, Jsonb(value)))
+        except Exception as e:
+            logger.warning(f"Cache write to {self.table_name} failed: {e}")
+
+    async def apurge(self) -> int:
+        """
+        Delete the expired entries, none when the cache has no time to live.
+
+        :return: The number of entries deleted.
+        """
+        if self.ttl is None:
+            return 0
+        query = sql.SQL(
+            "DELETE FROM {table} WHERE created_at <= NOW() - make_interval(secs => %s)"
+        ).format(table=sql.Identifier(self.table_name))
+        async with self.async_connection() as connection:
+            cursor = await connection.execute(query, (self.ttl,))
+            return cursor.rowcount
+
+
+class TieredCache(BaseCache):
+    """
+    Chain of caches checked in order, e.g. an in-process LRUCache in front of a
+    shared PostgresCache. Hits in a lower tier are written back to the tiers above.
+    """
+
+    def __init__(self, *caches: BaseCache):
+        super().__init__()
+        self.caches = caches
+
+    async def aget(self, key: str) -> Optional[Any]:
+        value = None
+        for index, cache in enumerate(self.caches):
+            value = await cache.aget(key)
+            if value is not None:
+                for upper in self.caches[:index]:
+                    await upper.aset(key, value)
+                break
+        return self._record(value)
+
+    async def aset(self, key: str, value: Any):
+        for cache in self.caches:
+            await cache.aset(key, value)
@@ -0,0 +1,42 @@
+"""
+In-flight request coalescing for the Researcher app.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls sharing a key, so only the first caller runs the
+    call and every other caller awaits the same result.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` unless a call for the same key is already in flight, in which case
+        wait for that call's result instead.
+
+        The call runs in its own task, so cancelling one waiting caller does not
+        cancel the call for the others.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception so it is not reported as unhandled when every
+        # caller was cancelled before the call finished
+        if not task.cancelled():
+            task.exception()
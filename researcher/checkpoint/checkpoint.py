@@ -36,6 +36,6 @@ class BaseCheckpointManager:
                 checkpointer = AsyncPostgresSaver(conn)
                 yield checkpointer
         else:
-            # For MemorySaver, use it directly as a synchronous context manager
-            with MemorySaver() as checkpointer:
-                yield checkpointer
+            # MemorySaver holds no connection, and entering it as a context manager
+            # yields its ExitStack rather than the saver itself
+            yield MemorySaver()
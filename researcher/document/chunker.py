@@ -0,0 +1,128 @@
+import bisect
+import re
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import tiktoken
+from langchain.docstore.document import Document
+
+# Preferred chunk boundaries, tried in order: paragraphs, lines, sentences, words
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+_WHITESPACE = re.compile(r"\s")
+
+
+class Chunker:
+    """
+    Split documents into overlapping chunks of at most `chunk_size` characters, or
+    tokens when given an encoding, ending them at the last paragraph, line, sentence
+    or word boundary of their second half.
+
+    Chunks are yielded lazily and record the character span they cover in their
+    document as `start_index` and `end_index`, so neighbouring context can be read
+    back by offset. The chunker holds no state between documents and can be shared.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        encoding: Optional[Union[str, tiktoken.Encoding]] = None,
+        separators: Sequence[str] = SEPARATORS,
+    ):
+        """
+        :param chunk_size: Maximum length of a chunk.
+        :param chunk_overlap: Length shared by consecutive chunks.
+        :param encoding: tiktoken encoding, or its name, measuring lengths in tokens
+                         instead of characters.
+        :param separators: Chunk boundaries, by order of preference.
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(
+                f"Chunk overlap ({chunk_overlap}) must be smaller than the chunk size ({chunk_size})"
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        if isinstance(encoding, str):
+            encoding = tiktoken.get_encoding(encoding)
+        self.encoding = encoding
+        self.separators = separators
+
+    def split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Split documents into chunks, keeping their metadata.
+        """
+        for document in documents:
+            text = document.page_content
+            for start, end in self.spans(text):
+                yield Document(
+                    page_content=text[start:end],
+                    metadata={
+                        **document.metadata,
+                        "start_index": start,
+                        "end_index": end,
+                    },
+                )
+
+    def spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Character spans of the chunks of a text, stripped of surrounding whitespace.
+        """
+        offsets = self._offsets(text)
+        length = len(offsets) - 1
+        start = 0
+        while start < length:
+            end = min(start + self.chunk_size, length)
+            if end < length:
+                end = self._boundary(text, offsets, start, end)
+            span = self._strip(text, offsets[start], offsets[end])
+            if span is not None:
+                yield span
+            if end >= length:
+                break
+            start = self._next_start(text, offsets, start, end)
+
+    def _offsets(self, text: str) -> Sequence[int]:
+        """
+        Character offset of every unit of length of the text, followed by its length.
+        """
+        if self.encoding is None:
+            return range(len(text) + 1)
+        _, offsets = self.encoding.decode_with_offsets(
+            self.encoding.encode(text, disallowed_special=())
+        )
+        return offsets + [len(text)]
+
+    def _boundary(self, text: str, offsets: Sequence[int], start: int, end: int) -> int:
+        """
+        End a chunk after the preferred separator of the second half of its window.
+        """
+        low, high = offsets[start + (end - start) // 2], offsets[end]
+        for separator in self.separators:
+            position = text.rfind(separator, low, high)
+            if position != -1:
+                cut = bisect.bisect_left(offsets, position + len(separator), start, end)
+                if cut > start:
+                    return cut
+        return end
+
+    def _next_start(
+        self, text: str, offsets: Sequence[int], start: int, end: int
+    ) -> int:
+        """
+        Start the next chunk `chunk_overlap` before the end of the current one, at the
+        next word.
+        """
+        overlap_start = max(end - self.chunk_overlap, start + 1)
+        space = _WHITESPACE.search(text, offsets[overlap_start], offsets[end])
+        if space is None:
+            return overlap_start
+        return bisect.bisect_left(offsets, space.end(), overlap_start, end)
+
+    @staticmethod
+    def _strip(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if not stripped:
+            return None
+        start += len(chunk) - len(chunk.lstrip())
+        return start, start + len(stripped)
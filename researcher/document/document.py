@@ -1,75 +1,68 @@
 # utils/document_loader.py
 
+import asyncio
 import logging
-from typing import List
-from langchain_community.document_loaders import (
-    PyMuPDFLoader,
-    TextLoader,
-    UnstructuredCSVLoader,
-    UnstructuredExcelLoader,
-    UnstructuredMarkdownLoader,
-    UnstructuredPowerPointLoader,
-    UnstructuredWordDocumentLoader,
-)
+from contextlib import aclosing
+from typing import AsyncIterator, Iterator, List, Optional
+
+from .parser import LOADERS, ParserPool, iter_pages
 
 logger = logging.getLogger(__name__)
 
 
 class DocumentLoader:
-    def __init__(self, path: str, source: str):
+    def __init__(self, path: str, source: str, parser: Optional[ParserPool] = None):
         """
         Initializes the DocumentLoader with a file path and source URL.
         :param path: Path of the file to load.
         :param source: The source URL or identifier of the file for metadata.
+        :param parser: Pool of processes parsing the file, or None to parse it in a
+                       thread of the current process.
         """
         self.path = path
         self.source = source
+        self.parser = parser
 
     async def load(self) -> List[dict]:
         """
         Asynchronously loads documents from the given file path.
         :return: A list of loaded documents with content and metadata.
         """
+        return [doc async for doc in self.lazy_load()]
+
+    async def lazy_load(self) -> AsyncIterator[dict]:
+        """
+        Asynchronously yields the pages of the file as they are parsed, so large
+        files can be indexed without holding all their pages in memory.
+        :return: The loaded pages with content and metadata.
+        """
         file_extension = self.path.split(".")[-1].lower()
         logger.info(f"Loading document with extension: {file_extension}")
 
-        documents = await self._load_document(file_extension)
-
-        docs = []
-        for page in documents:
-            if page.page_content:
-                docs.append(
-                    {
-                        "raw_content": page.page_content,
+        loaded = False
+        async with aclosing(self._load_document(file_extension)) as pages:
+            number = 0
+            async for page in pages:
+                if page:
+                    loaded = True
+                    yield {
+                        "raw_content": page,
                         "url": self.source,
+                        "page": number,
                     }
-                )
+                number += 1
 
-        if not docs:
+        if not loaded:
             logger.error("No content was loaded from the document.")
             raise ValueError("🤷 Failed to load any documents!")
 
-        return docs
-
-    async def _load_document(self, file_extension: str) -> list:
+    async def _load_document(self, file_extension: str) -> AsyncIterator[str]:
         """
         Helper method to load a document based on its file extension.
         :param file_extension: Extension of the document file.
-        :return: A list of document pages.
+        :return: The text of every page of the document, as it is parsed.
         """
-        loader_dict = {
-            "pdf": PyMuPDFLoader,
-            "txt": TextLoader,
-            "doc": UnstructuredWordDocumentLoader,
-            "docx": UnstructuredWordDocumentLoader,
-            "pptx": UnstructuredPowerPointLoader,
-            "csv": UnstructuredCSVLoader,
-            "xls": UnstructuredExcelLoader,
-            "xlsx": UnstructuredExcelLoader,
-            "md": UnstructuredMarkdownLoader,
-        }
-
-        loader_class = loader_dict.get(file_extension)
+        loader_class = LOADERS.get(file_extension)
         if loader_class is None:
             raise ValueError(f"Unsupported file extension: {file_extension}")
 
@@ -77,15 +70,29 @@ class DocumentLoader:
             f"Using loader {loader_class.__name__} for file extension: {file_extension}"
         )
 
-        # Load content from the file path
+        # Load content from the file path, off the event loop
+        if self.parser is not None:
+            pages = self.parser.aiter_pages(self.path, file_extension)
+        else:
+            pages = _aiter_in_thread(iter_pages(self.path, file_extension))
         try:
-            loader = loader_class(self.path)
-            documents = loader.load()
-            if not documents:
-                logger.error("Loader returned no documents.")
-            return documents
+            async with aclosing(pages):
+                async for page in pages:
+                    yield page
         except Exception as e:
             logger.error(
                 f"Failed to load document {self.path} with loader {loader_class.__name__}: {e}"
             )
             raise ValueError(f"Failed to load document: {e}")
+
+
+async def _aiter_in_thread(iterator: Iterator[str]) -> AsyncIterator[str]:
+    """
+    Iterate a blocking iterator in worker threads.
+    """
+    end = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, end)
+        if item is end:
+            return
+        yield item
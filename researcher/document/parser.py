@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from langchain_community.document_loaders import (
+    PyMuPDFLoader,
+    TextLoader,
+    UnstructuredCSVLoader,
+    UnstructuredExcelLoader,
+    UnstructuredMarkdownLoader,
+    UnstructuredPowerPointLoader,
+    UnstructuredWordDocumentLoader,
+)
+
+logger = logging.getLogger(__name__)
+
+# Messages sent by the parser processes
+_PAGE, _END, _ERROR = "page", "end", "error"
+
+# Loader of every supported file extension
+LOADERS = {
+    "pdf": PyMuPDFLoader,
+    "txt": TextLoader,
+    "doc": UnstructuredWordDocumentLoader,
+    "docx": UnstructuredWordDocumentLoader,
+    "pptx": UnstructuredPowerPointLoader,
+    "csv": UnstructuredCSVLoader,
+    "xls": UnstructuredExcelLoader,
+    "xlsx": UnstructuredExcelLoader,
+    "md": UnstructuredMarkdownLoader,
+}
+
+# Modules imported once by the fork server, so that parser processes start with the
+# loaders and the libraries they parse with already imported. The application's
+# entry module isn't among them, to keep its side effects out of the server
+PRELOAD = [
+    __name__,
+    *sorted({loader.__module__ for loader in LOADERS.values()}),
+    "pymupdf",
+]
+
+
+def iter_pages(path: str, file_extension: str) -> Iterator[str]:
+    """
+    Lazily parse a file with the loader of its extension, in the current process.
+
+    :return: The text of every page of the file, as it is parsed.
+    """
+    loader_class = LOADERS.get(file_extension)
+    if loader_class is None:
+        raise ValueError(f"Unsupported file extension: {file_extension}")
+    for page in loader_class(path).lazy_load():
+        yield page.page_content
+
+
+def _parse_in_child(connection, path: str, file_extension: str, memory_limit: int):
+    """
+    Entry point of the parser processes, sending back every page as it is parsed,
+    then the end of the file or the error.
+    """
+    if memory_limit:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    try:
+        for page in iter_pages(path, file_extension):
+            connection.send((_PAGE, page))
+        connection.send((_END, None))
+    except BaseException as e:
+        connection.send((_ERROR, _portable(e)))
+    finally:
+        connection.close()
+
+
+def _portable(e: BaseException) -> Exception:
+    """
+    The exception to send back to the parent process: the one raised parsing if it
+    can be pickled, otherwise a ValueError of its message.
+    """
+    if isinstance(e, Exception):
+        try:
+            pickle.loads(pickle.dumps(e))
+            return e
+        except Exception:
+            pass
+    return ValueError(f"{type(e).__name__}: {e}")
+
+
+class ParserPool:
+    """
+    Parse files in child processes, at most `max_workers` at a time, so CPU-heavy
+    loaders run on every core without blocking the event loop.
+
+    Every file is parsed in a fresh process, whose address space is capped at
+    `memory_limit` bytes and which is killed once it has spent `timeout` seconds
+    parsing, so a hostile or pathological file can neither exhaust the server's
+    memory nor hold a worker forever. Processes are forked from a server that has
+    already imported the loaders, so starting one is cheap.
+
+    A process starts with about 200 MB of address space, mostly shared libraries.
+    PyMuPDF then parses PDFs a page at a time within a few tens of MB, while text
+    files are read whole and take about three times their size: the text, its copy
+    in the page and the page pickled to the parent. A 2 GB limit thus fits text
+    files of about 600 MB.
+
+    Pages are streamed back as they are parsed. A process stops parsing while its
+    pages are not read, so a slow reader bounds the memory of the pages in flight
+    and its time isn't counted against the timeout.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout: float = 300,
+        memory_limit: Optional[int] = None,
+        start_method: Optional[str] = None,
+    ):
+        """
+        :param max_workers: Maximum number of files parsed at once, the number of
+                            CPUs by default.
+        :param timeout: Seconds of parsing after which a process is killed.
+        :param memory_limit: Maximum address space of a parser process in bytes, or
+                             None for no limit.
+        :param start_method: multiprocessing start method, forkserver by default
+                             where available.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        if start_method is None:
+            available = multiprocessing.get_all_start_methods()
+            start_method = "forkserver" if "forkserver" in available else "spawn"
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            self._context.set_forkserver_preload(PRELOAD)
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+    async def aparse(self, path: str, file_extension: str) -> List[str]:
+        """
+        Parse a file in a child process.
+
+        :return: The text of every page of the file.
+        :raises ValueError: If the extension isn't supported or the process died.
+        :raises MemoryError: If parsing exceeds the memory limit.
+        :raises TimeoutError: If parsing takes longer than the timeout.
+        :raises Exception: The error of the loader, if it fails to parse the file.
+        """
+        return [page async for page in self.aiter_pages(path, file_extension)]
+
+    async def aiter_pages(self, path: str, file_extension: str) -> AsyncIterator[str]:
+        """
+        Parse a file in a child process, yielding every page as it is parsed. The
+        process is killed when the iteration stops early.
+
+        :raises ValueError: If the extension isn't supported or the process died.
+        :raises MemoryError: If parsing exceeds the memory limit.
+        :raises TimeoutError: If parsing takes longer than the timeout.
+        :raises Exception: The error of the loader, if it fails to parse the file.
+        """
+        if file_extension not in LOADERS:
+            raise ValueError(f"Unsupported file extension: {file_extension}")
+        async with self._slots:
+            receiver, sender = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=_parse_in_child,
+                args=(sender, path, file_extension, self.memory_limit),
+                daemon=True,
+            )
+            process.start()
+            sender.close()
+            try:
+                remaining = self.timeout
+                while True:
+                    (kind, payload), waited = await asyncio.to_thread(
+                        self._receive, receiver, remaining
+                    )
+                    remaining -= waited
+                    if kind == _PAGE:
+                        yield payload
+                    elif kind == _END:
+                        return
+                    elif kind == _ERROR:
+                        if isinstance(payload, MemoryError):
+                            raise MemoryError(
+                                f"Parsing {os.path.basename(path)} exceeded the "
+                                f"memory limit of {self.memory_limit} bytes"
+                            )
+                        raise payload
+                    else:
+                        process.join(timeout=1)
+                        raise ValueError(
+                            f"Parser process died with exit code {process.exitcode}"
+                        )
+            except TimeoutError:
+                raise TimeoutError(
+                    f"Parsing {os.path.basename(path)} took over {self.timeout} seconds"
+                )
+            finally:
+                receiver.close()
+                await asyncio.to_thread(self._stop, process)
+
+    @staticmethod
+    def _receive(receiver, timeout: float) -> Tuple[Tuple[str, object], float]:
+        """
+        Wait for the next message of a parser process.
+
+        :return: The message, `(None, None)` if the process exited without sending
+                 one, and the seconds waited.
+        """
+        start = time.monotonic()
+        if not receiver.poll(max(timeout, 0)):
+            raise TimeoutError
+        try:
+            message = receiver.recv()
+        except EOFError:
+            message = (None, None)
+        return message, time.monotonic() - start
+
+    @staticmethod
+    def _stop(process):
+        process.join(timeout=1)
+        if process.is_alive():
+            process.kill()
+            process.join()
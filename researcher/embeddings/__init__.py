@@ -1,3 +1,4 @@
+from .cache import CachedEmbeddings
 from .embeddings import Embeddings
 
-__all__ = ["Embeddings"]
+__all__ = ["CachedEmbeddings", "Embeddings"]
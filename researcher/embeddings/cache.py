@@ -0,0 +1,63 @@
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings as LangchainEmbeddings
+
+from researcher.cache import BaseCache, LRUCache, hash_key
+
+
+class CachedEmbeddings(LangchainEmbeddings):
+    """
+    Wraps Langchain embeddings with a query embedding cache keyed on the model and
+    the hash of the query text.
+
+    Query embeddings are kept in a bounded in-process LRUCache and, for async
+    calls, optionally in a persistent cache shared across workers such as a
+    PostgresCache. Document embeddings are passed through.
+    """
+
+    def __init__(
+        self,
+        embeddings: LangchainEmbeddings,
+        model: str,
+        cache: Optional[LRUCache] = None,
+        persistent_cache: Optional[BaseCache] = None,
+    ):
+        """
+        :param embeddings: The Langchain embeddings to wrap.
+        :param model: Name of the embedding model, part of the cache key.
+        :param cache: In-process cache, a 1024 entry LRUCache by default.
+        :param persistent_cache: Optional async cache checked after the in-process one.
+        """
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache if cache is not None else LRUCache(max_size=1024)
+        self.persistent_cache = persistent_cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = hash_key(self.model, text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self.cache.set(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = hash_key(self.model, text)
+        embedding = self.cache.get(key)
+        if embedding is not None:
+            return embedding
+
+        if self.persistent_cache is not None:
+            embedding = await self.persistent_cache.aget(key)
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(text)
+            if self.persistent_cache is not None:
+                await self.persistent_cache.aset(key, embedding)
+        self.cache.set(key, embedding)
+        return embedding
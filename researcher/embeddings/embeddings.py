@@ -1,7 +1,10 @@
 import os
-from typing import Any
+from typing import Any, Optional
 from langchain_openai import OpenAIEmbeddings
 
+from researcher.cache import BaseCache, LRUCache
+from .cache import CachedEmbeddings
+
 _SUPPORTED_PROVIDERS = {
     "openai",
 }
@@ -12,8 +15,18 @@ class Embeddings:
         self,
         embedding_provider: str,
         model: str = "text-embedding-3-small",
+        cache: Optional[LRUCache] = None,
+        persistent_cache: Optional[BaseCache] = None,
         **embdding_kwargs: Any,
     ):
+        """
+        :param embedding_provider: The embedding provider, e.g. "openai".
+        :param model: The embedding model.
+        :param cache: Optional in-process cache for query embeddings.
+        :param persistent_cache: Optional shared cache for query embeddings, used by
+                                 async calls. Query embeddings are cached when
+                                 either cache is given.
+        """
         _embeddings = None
         match embedding_provider:
             case "openai":
@@ -24,6 +37,11 @@ class Embeddings:
                     f"Embedding not found. Supported providers: {_SUPPORTED_PROVIDERS}"
                 )
 
+        if cache is not None or persistent_cache is not None:
+            _embeddings = CachedEmbeddings(
+                _embeddings, model, cache=cache, persistent_cache=persistent_cache
+            )
+
         self._embeddings = _embeddings
 
     def get_embeddings(self):
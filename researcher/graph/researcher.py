@@ -1,40 +1,122 @@
+import functools
+import logging
+import time
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
 from langgraph.graph import END, START, StateGraph
+from prometheus_client import Counter, Histogram
 
 from researcher.checkpoint import BaseCheckpointManager
-from researcher.llm import LLMProvider
+from researcher.llm import AssessedResponse, LLMProvider
+from researcher.metrics import LATENCY_BUCKETS
 from researcher.retriever import TavilyRetriever
 from researcher.state import GraphState
 from researcher.store.vectorstore import Store
 
+logger = logging.getLogger(__name__)
+
+# Tags attached to the LLM call producing the answer, used to pick its tokens out
+# of the graph's event stream: the answer is the text of the call, or the answer
+# field of the JSON it streams in self-assessment mode
+ANSWER_TAG = "researcher_answer"
+ASSESSED_ANSWER_TAG = "researcher_assessed_answer"
+
+NODE_DURATION = Histogram(
+    "researcher_node_duration_seconds",
+    "Time spent in each Researcher graph node.",
+    ["node"],
+    buckets=LATENCY_BUCKETS,
+)
+NODE_CALLS = Counter(
+    "researcher_node_calls_total",
+    "Researcher graph node calls, by node and outcome.",
+    ["node", "status"],
+)
+RUN_ITERATIONS = Histogram(
+    "researcher_run_iterations",
+    "Number of generate_response passes per graph run.",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10),
+)
+RUN_TOKENS = Histogram(
+    "researcher_run_tokens",
+    "LLM tokens consumed per graph run.",
+    buckets=(500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+)
+
+
+def instrument_node(name: str, node):
+    """
+    Wrap an async graph node to record its latency and outcome. The wrapper keeps
+    the node's signature, so LangGraph still passes the config to nodes taking one.
+    """
+
+    @functools.wraps(node)
+    async def instrumented(*args, **kwargs):
+        status = "error"
+        try:
+            with NODE_DURATION.labels(node=name).time():
+                result = await node(*args, **kwargs)
+            status = "success"
+            return result
+        finally:
+            NODE_CALLS.labels(node=name, status=status).inc()
+
+    return instrumented
+
 
 class Researcher:
     def __init__(self, vector_store: Store, **kwargs):
         """
-        Initialize the synchronous Researcher class.
+        Initialize the Researcher class.
+
+        :param vector_store: Store searched for the user's files.
+        :param kwargs: Optional settings:
+                       - checkpoint_manager: BaseCheckpointManager for the graph.
+                       - llm: LLMProvider to use instead of the default OpenAI one.
+                       - llm_cache: Completion cache for the default LLMProvider.
+                       - retriever: Web retriever to use instead of TavilyRetriever.
+                       - search_cache: Result cache for the default TavilyRetriever.
+                       - max_iterations, timeout, token_budget: Per-run budgets.
+                       - self_assessment, min_confidence: Self-assessment mode.
+                       Remaining kwargs are passed to the TavilyRetriever.
         """
-        checkpoint_manager = BaseCheckpointManager()
+        checkpoint_manager = kwargs.pop("checkpoint_manager", None)
+        if checkpoint_manager is None:
+            checkpoint_manager = BaseCheckpointManager()
+
+        # Set the default per-run budgets, overridable through the run's config
+        self.set_budgets(kwargs)
+
+        # In self-assessment mode the answer and its assessment come back from a
+        # single structured-output call, replacing the validation round trip
+        self.self_assessment = kwargs.pop("self_assessment", False)
+        self.min_confidence = kwargs.pop("min_confidence", 0.7)
 
         # Initialize the StateGraph for processing
         self.graph = StateGraph(GraphState)
         self.checkpointer = checkpoint_manager
-        # Initialize the LLM
-        self.llm = LLMProvider.create_provider(
-            "openai", model="gpt-3.5-turbo", **kwargs
-        )
 
-        # Configure and initialize the Tavily Retriever
-        default_tavily_params = {
-            "max_results": 2,
-            "search_depth": "advanced",
-            "include_images": False,
-            "include_answer": False,
-        }
-        tavily_params = {**default_tavily_params, **kwargs}
-        self.retriever = TavilyRetriever(**tavily_params)
+        # Initialize the LLM, with an optional completion cache
+        self.llm = kwargs.pop("llm", None)
+        llm_cache = kwargs.pop("llm_cache", None)
+        if self.llm is None:
+            self.llm = LLMProvider.create_provider(
+                "openai", model="gpt-3.5-turbo", cache=llm_cache
+            )
 
-        # Set maximum iterations from kwargs, defaulting to 3 if not provided
-        self.max_iterations = kwargs.get("max_iterations", 3)
-        self.iterations = 0
+        # Configure and initialize the Tavily Retriever
+        self.retriever = kwargs.pop("retriever", None)
+        search_cache = kwargs.pop("search_cache", None)
+        if self.retriever is None:
+            default_tavily_params = {
+                "max_results": 2,
+                "search_depth": "advanced",
+                "include_images": False,
+                "include_answer": False,
+            }
+            tavily_params = {**default_tavily_params, **kwargs}
+            self.retriever = TavilyRetriever(cache=search_cache, **tavily_params)
 
         self.store = vector_store
 
@@ -46,35 +128,21 @@ class Researcher:
         """
         Create a researcher with the specified checkpointer manager and settings.
         """
-        self = cls(vector_store)
-        checkpoint_manager = kwargs.pop("checkpoint_manager", None)
-        if checkpoint_manager is None:
-            checkpoint_manager = BaseCheckpointManager()
-
-        # Initialize the StateGraph for processing
-        self.graph = StateGraph(GraphState)
-        self.checkpointer = checkpoint_manager
-        # Initialize the LLM
-        self.llm = LLMProvider.create_provider("openai", model="gpt-3.5-turbo")
+        return cls(vector_store, **kwargs)
 
-        # Configure and initialize the Tavily Retriever
-        default_tavily_params = {
-            "max_results": 2,
-            "search_depth": "advanced",
-            "include_images": False,
-            "include_answer": False,
-        }
-        tavily_params = {**default_tavily_params, **kwargs}
-        self.retriever = TavilyRetriever(**tavily_params)
-
-        # Set maximum iterations from kwargs, defaulting to 4 if not provided
-        self.max_iterations = kwargs.get("max_iterations", 4)
-        self.iterations = 1
+    def set_budgets(self, kwargs: dict):
+        """
+        Pop the default per-run budgets from the constructor kwargs.
 
-        # Add nodes and edges to the graph
-        self.add_graph_nodes_and_edges()
+        - max_iterations: maximum number of generate_response passes per run.
+        - timeout: wall-clock seconds a run may take before it is short-circuited.
+        - token_budget: maximum number of LLM tokens a run may consume.
 
-        return self
+        Each default can be overridden per run through `config["configurable"]`.
+        """
+        self.max_iterations = kwargs.pop("max_iterations", 4)
+        self.timeout = kwargs.pop("timeout", None)
+        self.token_budget = kwargs.pop("token_budget", None)
 
     def get_graph(self):
         return self.graph
@@ -83,23 +151,21 @@ class Researcher:
         """
         Define the states and conditional transitions in the StateGraph.
         """
-        # Define nodes
-        self.graph.add_node("generate_query", self.generate_query)
-        self.graph.add_node("query_tavily", self.query_tavily)
-        self.graph.add_node("query_vector_store", self.query_vector_store)
-        self.graph.add_node("generate_response", self.generate_response)
-        self.graph.add_node("generate_new_query", self.generate_new_query)
-        self.graph.add_node("final_response", self.final_response)
+        # Define nodes, each instrumented with latency and call metrics
+        nodes = {
+            "generate_query": self.generate_query,
+            "query_tavily": self.query_tavily,
+            "query_vector_store": self.query_vector_store,
+            "generate_response": self.generate_response,
+            "validate_response": self.validate_response,
+            "generate_new_query": self.generate_new_query,
+            "final_response": self.final_response,
+        }
+        for name, node in nodes.items():
+            self.graph.add_node(name, instrument_node(name, node))
 
         # Define transitions
-        self.graph.add_conditional_edges(
-            START,
-            self.check_iteration_limit,
-            {
-                "within_limit": "generate_query",
-                "limit_reached": "final_response",
-            },
-        )
+        self.graph.add_edge(START, "generate_query")
 
         # After generate_query, go to both query_tavily and query_vector_store
         self.graph.add_edge("generate_query", "query_tavily")
@@ -109,9 +175,18 @@ class Researcher:
         self.graph.add_edge("query_tavily", "generate_response")
         self.graph.add_edge("query_vector_store", "generate_response")
 
+        # Short-circuit to the final response once the run's budget is exhausted
         self.graph.add_conditional_edges(
             "generate_response",
-            self.validate_response,
+            self.check_iteration_limit,
+            {
+                "within_limit": "validate_response",
+                "limit_reached": "final_response",
+            },
+        )
+        self.graph.add_conditional_edges(
+            "validate_response",
+            self.check_validation,
             {
                 "validation_passes": "final_response",
                 "validation_fails": "generate_new_query",
@@ -121,17 +196,28 @@ class Researcher:
         self.graph.add_edge("generate_new_query", "query_vector_store")
         self.graph.add_edge("final_response", END)
 
-    async def generate_query(self, state: GraphState):
+    async def generate_query(self, state: GraphState, config: RunnableConfig):
         """
         Generate an initial search query using the user's question and chat history.
+        Starts the run's budget: iterations, token usage and deadline are reset.
         """
         question = state["question"]
         chat_history = "\n".join(state["chat_history"])
         prompt = f"Conversation History:\n{chat_history}\n\nCurrent Question: {question}\nGenerate an optimized search query."
 
+        timeout = config.get("configurable", {}).get("timeout", self.timeout)
+        deadline = time.time() + timeout if timeout is not None else None
+
         # Generate a refined query based on history and question
-        generated_query = await self.llm.agenerate([prompt])
-        return {"question": generated_query.strip()}
+        generated_query, tokens = await self.llm.agenerate_with_usage(
+            [prompt], config=config
+        )
+        return {
+            "question": generated_query.strip(),
+            "iterations": 0,
+            "tokens_used": tokens,
+            "deadline": deadline,
+        }
 
     async def query_tavily(self, state: GraphState):
         """
@@ -141,23 +227,42 @@ class Researcher:
         search_results = await self.retriever.search(question)
         return {"search_results": search_results}
 
-    def query_vector_store(self, state: GraphState):
+    async def query_vector_store(self, state: GraphState, config: RunnableConfig):
         """
         Query the vector store using the generated or refined query.
+
+        The HNSW search breadth of a pgvector store can be tuned per run with the
+        `ef_search` key of `config["configurable"]`, hybrid lexical and vector
+        search turned on or off with `hybrid_search`, and the MMR diversity
+        re-selection of the results with `mmr` and `mmr_lambda`. The `user_id` key
+        restricts the search to the chunks of the files' owner, which a store
+        partitioned by user answers from that user's partition only.
         """
         vector_store_results = []
         if state["files"] and len(state["files"]) > 0:
             question = state["question"]
-            vector_store_results = self.store.similarity_search(
+            configurable = config.get("configurable", {})
+            filter = {"source": {"in": state["files"]}}
+            if configurable.get("user_id"):
+                # Route the search to the partition of the files' owner
+                filter["user_id"] = configurable["user_id"]
+            vector_store_results = await self.store.asimilarity_search(
                 question,
-                k=self.iterations * 5,
-                filter={"source": {"in": state["files"]}},
+                k=(state.get("iterations", 0) + 1) * 5,
+                filter=filter,
+                ef_search=configurable.get("ef_search"),
+                hybrid=configurable.get("hybrid_search"),
+                mmr=configurable.get("mmr"),
+                lambda_mult=configurable.get("mmr_lambda"),
             )
         return {"vector_store_results": vector_store_results}
 
-    async def generate_response(self, state: GraphState):
+    async def generate_response(self, state: GraphState, config: RunnableConfig):
         """
         Generate a response based on Tavily search results, vector store results, the question, and the chat history.
+
+        In self-assessment mode, enabled by `self_assessment` in `config["configurable"]`
+        or at creation, the model also assesses its answer in the same call.
         """
         search_results = state["search_results"]
         vector_store_results = (
@@ -171,47 +276,112 @@ class Researcher:
             f"File Search Results:\n{vector_store_results}\n\n"
             f"Question: {question}\nProvide a comprehensive answer."
         )
-        response = await self.llm.agenerate([prompt])
-        return {"response": response.strip()}
+        assessment = None
+        if config.get("configurable", {}).get("self_assessment", self.self_assessment):
+            config = merge_configs(config, {"tags": [ASSESSED_ANSWER_TAG]})
+            prompt += (
+                " Then assess your answer: rate your confidence that it is accurate, "
+                "state whether it fully addresses the question and, if not, what "
+                "information is missing and a search query that would find it."
+            )
+            assessed, tokens = await self.llm.agenerate_structured(
+                [prompt], AssessedResponse, config=config
+            )
+            response = assessed.answer
+            assessment = assessed.model_dump(exclude={"answer"})
+        else:
+            config = merge_configs(config, {"tags": [ANSWER_TAG]})
+            response, tokens = await self.llm.agenerate_with_usage(
+                [prompt], config=config
+            )
+        return {
+            "response": response.strip(),
+            "assessment": assessment,
+            "iterations": state.get("iterations", 0) + 1,
+            "tokens_used": state.get("tokens_used", 0) + tokens,
+        }
 
-    async def validate_response(self, state: GraphState):
+    async def validate_response(self, state: GraphState, config: RunnableConfig):
         """
         Validate if the generated response is satisfactory.
+
+        A response generated with a self-assessment is validated from it, without
+        another LLM call.
         """
+        assessment = state.get("assessment")
+        if assessment is not None:
+            return {
+                "validated": assessment["complete"]
+                and assessment["confidence"] >= self.min_confidence
+            }
+
         response = state["response"]
         question = state["question"]
         prompt = f"Response: {response}\n\nQuestion: {question}\nIs this response accurate? Answer 'yes' or 'no'."
-        validation = await self.llm.agenerate([prompt])
-        return (
-            "validation_passes"
-            if validation.strip().lower() == "yes"
-            else "validation_fails"
+        validation, tokens = await self.llm.agenerate_with_usage(
+            [prompt], config=config
         )
+        return {
+            "validated": validation.strip().lower() == "yes",
+            "tokens_used": state.get("tokens_used", 0) + tokens,
+        }
+
+    async def check_validation(self, state: GraphState):
+        """
+        Route on the outcome of validate_response.
+        """
+        return "validation_passes" if state["validated"] else "validation_fails"
 
-    async def generate_new_query(self, state: GraphState):
+    async def generate_new_query(self, state: GraphState, config: RunnableConfig):
         """
         Generate a refined query if the response validation fails.
+
+        The follow-up query from the response's self-assessment is used directly
+        when there is one.
         """
+        assessment = state.get("assessment") or {}
+        if assessment.get("follow_up_query"):
+            return {"question": assessment["follow_up_query"].strip()}
+
         question = state["question"]
         response = state["response"]
         prompt = (
             f"Original Query: {question}\nResponse: {response}\n"
             f"The response did not meet expectations. Suggest a new query for more accurate results."
         )
-        new_query = await self.llm.agenerate([prompt])
-        return {"question": new_query.strip()}
+        new_query, tokens = await self.llm.agenerate_with_usage([prompt], config=config)
+        return {
+            "question": new_query.strip(),
+            "tokens_used": state.get("tokens_used", 0) + tokens,
+        }
 
-    async def check_iteration_limit(self, _: GraphState):
+    async def check_iteration_limit(self, state: GraphState, config: RunnableConfig):
         """
-        Check if the iteration limit is reached.
+        Check if the run's iteration, time or token budget is exhausted.
+
+        Budgets default to the values the Researcher was created with and can be
+        overridden per run with the `max_iterations`, `timeout` and `token_budget`
+        keys of `config["configurable"]`.
         """
-        self.iterations += 1
-        return (
-            "within_limit" if self.iterations < self.max_iterations else "limit_reached"
-        )
+        configurable = config.get("configurable", {})
+        max_iterations = configurable.get("max_iterations", self.max_iterations)
+        token_budget = configurable.get("token_budget", self.token_budget)
+
+        if state.get("iterations", 0) >= max_iterations:
+            logger.info("Iteration limit of %s reached", max_iterations)
+            return "limit_reached"
+        if state.get("deadline") is not None and time.time() >= state["deadline"]:
+            logger.info("Run deadline reached")
+            return "limit_reached"
+        if token_budget is not None and state.get("tokens_used", 0) >= token_budget:
+            logger.info("Token budget of %s reached", token_budget)
+            return "limit_reached"
+        return "within_limit"
 
     async def final_response(self, state: GraphState):
         """
         Return the final validated response.
         """
+        RUN_ITERATIONS.observe(state.get("iterations", 0))
+        RUN_TOKENS.observe(state.get("tokens_used", 0))
         return {"response": state["response"]}
@@ -1,3 +1,10 @@
 from .provider import LLMProvider
+from .schema import AssessedResponse
+from .stream import JSONFieldStream, structured_output_fragment
 
-__all__ = ["LLMProvider"]
+__all__ = [
+    "AssessedResponse",
+    "JSONFieldStream",
+    "LLMProvider",
+    "structured_output_fragment",
+]
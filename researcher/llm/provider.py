@@ -1,34 +1,111 @@
-from typing import Any
+from typing import Any, Optional, Tuple, Type
 
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel
 from langchain_openai import ChatOpenAI
+from prometheus_client import Counter
+
+from researcher.cache import BaseCache, hash_key
 
 _SUPPORTED_PROVIDERS = ["openai"]
 
+LLM_TOKENS = Counter(
+    "researcher_llm_tokens_total",
+    "LLM tokens consumed, by graph node.",
+    ["node"],
+)
+
 
 class LLMProvider:
     """
     LLM provider
     """
 
-    def __init__(self, llm):
+    def __init__(self, llm, cache: Optional[BaseCache] = None):
+        """
+        :param llm: The Langchain chat model.
+        :param cache: Optional completion cache, keyed on the model params and prompt.
+        """
         self.llm = llm
+        self.cache = cache
 
     @classmethod
     def create_provider(cls, provider: str, **kwargs: Any):
         """
         Create an LLM provider
         """
+        cache = kwargs.pop("cache", None)
         if provider == "openai":
+            # Report token usage for streamed calls too, for per-run token budgets
+            kwargs.setdefault("stream_usage", True)
             llm = ChatOpenAI(**kwargs)
-            return cls(llm)
+            return cls(llm, cache=cache)
         raise ValueError(
             f"Unknown LLM provider: {provider} - Supported providers: {"".join(_SUPPORTED_PROVIDERS)}"
         )
 
-    async def agenerate(self, prompt: str) -> str:
+    async def agenerate(
+        self, prompt: str, config: Optional[RunnableConfig] = None
+    ) -> str:
         """
         Generate a response asynchronously
+
+        Passing the graph node's config attaches the call to the running graph, so
+        its tokens are surfaced by `astream_events`.
         """
-        response = await self.llm.agenerate([prompt])
-        response = response.generations[0][0].text
+        response, _ = await self.agenerate_with_usage(prompt, config=config)
         return response
+
+    async def agenerate_with_usage(
+        self, prompt: str, config: Optional[RunnableConfig] = None
+    ) -> Tuple[str, int]:
+        """
+        Generate a response asynchronously, along with the total number of tokens
+        the call consumed. Responses served from the cache consume no tokens.
+        """
+        if self.cache is not None:
+            key = hash_key(self.llm._identifying_params, prompt)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return cached, 0
+
+        response = await self.llm.ainvoke(prompt, config=config)
+        usage = response.usage_metadata or {}
+        self._record_usage(usage, config)
+
+        if self.cache is not None:
+            await self.cache.aset(key, response.content)
+        return response.content, usage.get("total_tokens", 0)
+
+    async def agenerate_structured(
+        self,
+        prompt: str,
+        schema: Type[BaseModel],
+        config: Optional[RunnableConfig] = None,
+    ) -> Tuple[BaseModel, int]:
+        """
+        Generate a response asynchronously as an instance of the given schema, along
+        with the total number of tokens the call consumed.
+        """
+        if self.cache is not None:
+            key = hash_key(self.llm._identifying_params, schema.__name__, prompt)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return schema(**cached), 0
+
+        structured_llm = self.llm.with_structured_output(schema, include_raw=True)
+        response = await structured_llm.ainvoke(prompt, config=config)
+        if response["parsed"] is None:
+            raise ValueError(
+                f"Failed to parse structured response: {response['parsing_error']}"
+            )
+        usage = response["raw"].usage_metadata or {}
+        self._record_usage(usage, config)
+
+        if self.cache is not None:
+            await self.cache.aset(key, response["parsed"].model_dump())
+        return response["parsed"], usage.get("total_tokens", 0)
+
+    def _record_usage(self, usage: dict, config: Optional[RunnableConfig]):
+        node = (config or {}).get("metadata", {}).get("langgraph_node", "none")
+        LLM_TOKENS.labels(node=node).inc(usage.get("total_tokens", 0))
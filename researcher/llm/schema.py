@@ -0,0 +1,25 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class AssessedResponse(BaseModel):
+    """
+    An answer together with the model's own assessment of it, produced by a single
+    structured-output call instead of a separate validation round trip.
+    """
+
+    answer: str = Field(description="Comprehensive answer to the question.")
+    confidence: float = Field(
+        ge=0, le=1, description="Confidence that the answer is accurate, from 0 to 1."
+    )
+    complete: bool = Field(
+        description="Whether the answer fully addresses the question."
+    )
+    missing_information: Optional[str] = Field(
+        default=None, description="Information needed to improve the answer, if any."
+    )
+    follow_up_query: Optional[str] = Field(
+        default=None,
+        description="Search query that would find the missing information, if any.",
+    )
@@ -0,0 +1,85 @@
+import json
+import re
+from typing import Optional
+
+from langchain_core.messages import AIMessageChunk
+
+_HIGH_SURROGATE = re.compile(r"[dD][89abAB][0-9a-fA-F]{2}")
+
+
+def structured_output_fragment(chunk: AIMessageChunk) -> str:
+    """
+    The JSON text streamed by a chunk of a structured-output call, carried by its
+    tool call arguments with function calling and by its content in JSON mode.
+    """
+    if isinstance(chunk.content, str) and chunk.content:
+        return chunk.content
+    return "".join(tool_call.get("args") or "" for tool_call in chunk.tool_call_chunks)
+
+
+class JSONFieldStream:
+    """
+    Decode the value of a string field of a JSON object while the object streams
+    in, e.g. the answer of a structured-output LLM call.
+    """
+
+    def __init__(self, field: str):
+        """
+        :param field: Name of the string field to decode.
+        """
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        # Position of the next character of the value, None until it is found
+        self._position: Optional[int] = None
+        self.done = False
+
+    def feed(self, fragment: str) -> str:
+        """
+        Add a fragment of the JSON text.
+
+        :return: The part of the field's value decoded from it.
+        """
+        if self.done:
+            return ""
+        self._buffer += fragment
+        if self._position is None:
+            match = self._start.search(self._buffer)
+            if match is None:
+                return ""
+            self._position = match.end()
+
+        buffer, position, decoded = self._buffer, self._position, []
+        while position < len(buffer):
+            char = buffer[position]
+            if char == '"':
+                self.done = True
+                break
+            if char != "\\":
+                decoded.append(char)
+                position += 1
+                continue
+            # Escape sequences are decoded once complete, a high surrogate with the
+            # low surrogate following it
+            if position + 1 == len(buffer):
+                break
+            end = position + 2
+            if buffer[position + 1] == "u":
+                end = position + 6
+                if end <= len(buffer) and _HIGH_SURROGATE.fullmatch(
+                    buffer[position + 2 : end]
+                ):
+                    if end + 2 > len(buffer):
+                        break
+                    if buffer[end : end + 2] == "\\u":
+                        end += 6
+            if end > len(buffer):
+                break
+            escape = buffer[position:end]
+            try:
+                decoded.append(json.loads(f'"{escape}"'))
+            except ValueError:
+                decoded.append(escape[1:])
+            position = end
+
+        self._buffer, self._position = buffer[position:], 0
+        return "".join(decoded)
@@ -0,0 +1,13 @@
+from .metrics import (
+    LATENCY_BUCKETS,
+    CallbackCollector,
+    register_cache_metrics,
+    register_collector,
+)
+
+__all__ = [
+    "LATENCY_BUCKETS",
+    "CallbackCollector",
+    "register_cache_metrics",
+    "register_collector",
+]
@@ -0,0 +1,61 @@
+"""
+Metrics collected at scrape time, registered with the prometheus_client registry.
+"""
+
+from typing import Callable, Dict, Iterable
+
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.core import CounterMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+# Histogram buckets of latencies, up to the minutes an ingestion job can take
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class CallbackCollector(Collector):
+    """
+    Collector of the metrics returned by a callable on every scrape, e.g. from
+    connection pool or cache statistics.
+    """
+
+    def __init__(self, collect: Callable[[], Iterable[Metric]]):
+        self._collect = collect
+
+    def collect(self) -> Iterable[Metric]:
+        return self._collect()
+
+    def describe(self) -> Iterable[Metric]:
+        # The metrics depend on the state at scrape time, such as an open pool
+        return []
+
+
+def register_collector(
+    collect: Callable[[], Iterable[Metric]],
+    registry: CollectorRegistry = REGISTRY,
+):
+    """
+    Register a callable returning metric families, called on every scrape.
+    """
+    registry.register(CallbackCollector(collect))
+
+
+def register_cache_metrics(
+    caches: Dict[str, object], registry: CollectorRegistry = REGISTRY
+):
+    """
+    Expose the hit and miss counters of the given caches, keyed by cache name.
+    """
+
+    def collect():
+        hits = CounterMetricFamily(
+            "researcher_cache_hits", "Cache hits.", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "researcher_cache_misses", "Cache misses.", labels=["cache"]
+        )
+        for name, cache in caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+        return [hits, misses]
+
+    register_collector(collect, registry)
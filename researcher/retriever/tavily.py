@@ -1,19 +1,51 @@
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from langchain_community.tools import TavilySearchResults
 
+from researcher.cache import BaseCache, SingleFlight, hash_key
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query for caching: lowercase, collapse whitespace and strip
+    the quotes LLM generated queries are often wrapped in.
+    """
+    return " ".join(query.lower().split()).strip("\"'")
+
 
 class TavilyRetriever:
-    def __init__(self, **kwargs):
+    def __init__(self, cache: Optional[BaseCache] = None, **kwargs):
+        """
+        :param cache: Optional cache for search results, keyed on the normalized
+                      query and the search params.
+        :param kwargs: Params passed to TavilySearchResults.
+        """
         if not os.getenv("TAVILY_API_KEY"):
             raise ValueError("TAVILY_API_KEY environment variable is not set")
 
         self.search_tool = TavilySearchResults(**kwargs)
+        self.search_params = kwargs
+        self.cache = cache
+        # Identical searches in flight at the same time share one request
+        self.in_flight = SingleFlight()
 
     async def search(self, query: str) -> List[Dict[str, str]]:
+        key = hash_key(self.search_params, normalize_query(query))
+        return await self.in_flight.do(key, lambda: self._search(key, query))
+
+    async def _search(self, key: str, query: str) -> List[Dict[str, str]]:
+        if self.cache is not None:
+            results = await self.cache.aget(key)
+            if results is not None:
+                return results
+
         try:
             results = await self.search_tool.ainvoke({"query": query})
-            return results
         except Exception as e:
             raise Exception(f"Tavily API request failed: {str(e)}")
+
+        # Only cache successful searches, the tool returns errors as strings
+        if self.cache is not None and isinstance(results, list):
+            await self.cache.aset(key, results)
+        return results
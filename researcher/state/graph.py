@@ -10,3 +10,10 @@ class GraphState(MessagesState):
     chat_history: Optional[List[str]] = []
     files: Optional[List[str]] = []
     vector_store_results: Optional[List[str]] = []
+    validated: Optional[bool] = None
+    # Self-assessment of the response, set when it is generated in self-assessment mode
+    assessment: Optional[dict] = None
+    # Per-run budget tracking, reset by generate_query at the start of every run
+    iterations: Optional[int] = 0
+    tokens_used: Optional[int] = 0
+    deadline: Optional[float] = None
@@ -1,3 +1,4 @@
+from .pgvector import PGVectorStore
 from .vectorstore import Store
 
-__all__ = ["Store"]
+__all__ = ["PGVectorStore", "Store"]
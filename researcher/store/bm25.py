@@ -0,0 +1,80 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase word tokens, keeping identifiers such as ticker
+    symbols and part numbers whole.
+    """
+    return _TOKEN.findall(text.lower())
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Hashable]], k: int = 60
+) -> List[Tuple[Hashable, float]]:
+    """
+    Fuse rankings of the same items by reciprocal rank: each item scores the sum of
+    1 / (k + rank) over the rankings it appears in.
+
+    :return: The items with their fused score, best first.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 index, appended to as documents are added.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[Hashable, int]] = defaultdict(dict)
+        self.lengths: Dict[Hashable, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, doc_id: Hashable, text: str):
+        tokens = tokenize(text)
+        for token, count in Counter(tokens).items():
+            self.postings[token][doc_id] = count
+        self.lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def search(
+        self, query: str, k: Optional[int] = None
+    ) -> List[Tuple[Hashable, float]]:
+        """
+        Score the documents containing any query token.
+
+        :return: The best `k` documents with their score, or all of them if k is None.
+        """
+        if not self.lengths:
+            return []
+        average_length = self.total_length / len(self.lengths)
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (len(self.lengths) - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for doc_id, count in postings.items():
+                norm = self.k1 * (
+                    1 - self.b + self.b * self.lengths[doc_id] / average_length
+                )
+                scores[doc_id] += idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked if k is None else ranked[:k]
@@ -0,0 +1,44 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def maximal_marginal_relevance(
+    query_embedding: Sequence[float],
+    embeddings: Sequence[Sequence[float]],
+    k: int = 4,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Select up to k candidates by maximal marginal relevance: each pick maximizes
+    `lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, selected)`, with
+    cosine similarities computed in batch over all candidates.
+
+    :param lambda_mult: 1 ranks by relevance only, 0 by diversity only.
+    :return: Indices of the selected candidates, in selection order.
+    """
+    if len(embeddings) == 0 or k <= 0:
+        return []
+    candidates = _normalize(np.asarray(embeddings, dtype=np.float32))
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    relevance = candidates @ query
+
+    # The most relevant candidate is picked first, then the highest similarity of
+    # every candidate to the selected ones is kept up to date as they are picked
+    index = int(np.argmax(relevance))
+    selected = [index]
+    redundancy = candidates @ candidates[index]
+    available = np.ones(len(candidates), dtype=bool)
+    available[index] = False
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        index = int(np.argmax(np.where(available, scores, -np.inf)))
+        selected.append(index)
+        available[index] = False
+        redundancy = np.maximum(redundancy, candidates @ candidates[index])
+    return selected
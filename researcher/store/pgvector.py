@@ -0,0 +1,633 @@
+import hashlib
+from typing import List, Optional, Set, Tuple
+
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings as LangchainEmbeddings
+import psycopg
+from psycopg import sql
+from psycopg.types.json import Jsonb
+
+from researcher.utils.database import get_db_connection
+
+
+# Distance operators and the suffix of the matching operator classes of pgvector
+_DISTANCES = {
+    "l2": ("<->", "l2_ops"),
+    "cosine": ("<=>", "cosine_ops"),
+    "inner_product": ("<#>", "ip_ops"),
+}
+_INDEX_TYPES = {"hnsw", "ivfflat"}
+
+# Type the embeddings are stored as, by quantization. Binary quantization indexes
+# the sign bits of half-precision embeddings, which rescore the candidates
+_QUANTIZATIONS = {None: "vector", "float16": "halfvec", "binary": "halfvec"}
+
+# Metadata keys stored in their own indexed columns, filtered without JSON access
+_COLUMNS = ("source", "user_id", "chunk_hash")
+
+
+def to_vector(embedding: List[float]) -> str:
+    """
+    Format an embedding as a pgvector literal.
+    """
+    return "[" + ",".join(str(float(value)) for value in embedding) + "]"
+
+
+class PGVectorStore:
+    """
+    Vector store on the pgvector extension, queried through the async connection pool.
+
+    Chunks are stored in one table with their source, user and content hash in
+    indexed columns, so filters on them are applied in SQL before the vector
+    search, and the embedding is indexed with HNSW or IVFFlat. A generated tsvector
+    column with a GIN index serves full-text search.
+
+    With `partition_by_user`, the table is list-partitioned by owner: each user's
+    chunks live in their own partition with its own indexes, created on their first
+    upload, and searches filtered on a user_id only scan that partition, so their
+    latency depends on the user's data rather than the whole corpus.
+
+    Embeddings can be stored quantized, at the cost of some recall: as half-precision
+    `halfvec` with "float16", halving their size, or with "binary", indexed by their
+    sign bits only, a 32x smaller index searched by Hamming distance whose top
+    candidates are rescored by their half-precision distance. Quantization needs
+    pgvector 0.7 or later.
+    """
+
+    def __init__(
+        self,
+        embeddings: LangchainEmbeddings,
+        table_name: str = "document_chunks",
+        dimensions: int = 1536,
+        distance: str = "cosine",
+        index_type: str = "hnsw",
+        index_params: Optional[dict] = None,
+        ef_search: int = 40,
+        probes: int = 10,
+        text_search_config: str = "english",
+        partition_by_user: bool = False,
+        quantization: Optional[str] = None,
+        rescore_factor: int = 4,
+        max_scan_tuples: int = 20000,
+        async_connection=get_db_connection,
+    ):
+        """
+        :param embeddings: Embeddings of the stored chunks and of the queries.
+        :param table_name: Name of the table holding the chunks.
+        :param dimensions: Dimensions of the embeddings.
+        :param distance: Distance to search by: "l2", "cosine" or "inner_product".
+        :param index_type: Approximate index on the embeddings: "hnsw" or "ivfflat".
+        :param index_params: Index build parameters, defaults to m=16 and
+                             ef_construction=64 for HNSW and lists=100 for IVFFlat.
+        :param ef_search: Default size of the HNSW candidate list per query. Higher
+                          values trade latency for recall.
+        :param probes: Default number of IVFFlat lists scanned per query.
+        :param text_search_config: Postgres text search configuration of the
+                                   full-text index.
+        :param partition_by_user: Partition the table by the owner of the chunks.
+        :param quantization: Store embeddings as "float16" or "binary", full
+                             precision if None.
+        :param rescore_factor: With binary quantization, candidates rescored at full
+                               precision per result.
+        :param max_scan_tuples: With a filter, maximum rows an iterative HNSW scan
+                                visits to find enough matching ones.
+        :param async_connection: Async context manager yielding a connection.
+        """
+        if distance not in _DISTANCES:
+            raise ValueError(
+                f"Unknown distance: {distance} - Supported distances: {list(_DISTANCES)}"
+            )
+        if index_type not in _INDEX_TYPES:
+            raise ValueError(
+                f"Unknown index type: {index_type} - Supported types: {_INDEX_TYPES}"
+            )
+        if quantization not in _QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization: {quantization} - Supported quantizations: "
+                f"{[name for name in _QUANTIZATIONS if name]}"
+            )
+        self.embeddings = embeddings
+        self.table_name = table_name
+        self.dimensions = dimensions
+        self.distance = distance
+        self.index_type = index_type
+        if index_params is None:
+            index_params = (
+                {"m": 16, "ef_construction": 64}
+                if index_type == "hnsw"
+                else {"lists": 100}
+            )
+        self.index_params = index_params
+        self.ef_search = ef_search
+        self.probes = probes
+        self.text_search_config = text_search_config
+        self.partition_by_user = partition_by_user
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.max_scan_tuples = max_scan_tuples
+        self.vector_type = _QUANTIZATIONS[quantization]
+        self.async_connection = async_connection
+        # Owners whose partition is known to exist
+        self._partitions = set()
+        # Whether the installed pgvector scans HNSW indexes iteratively, once known
+        self._iterative_scan: Optional[bool] = None
+
+    async def acreate_table(self):
+        """
+        Create the vector extension, the chunks table and its indexes if they don't
+        exist. Indexes created on a partitioned table are created on every
+        partition.
+        """
+        await self._acheck_table()
+        table = sql.Identifier(self.table_name)
+        if self.quantization == "binary":
+            indexed = sql.SQL("(binary_quantize(embedding)::bit({dimensions}))").format(
+                dimensions=sql.Literal(self.dimensions)
+            )
+            operator_class = sql.SQL("bit_hamming_ops")
+        else:
+            indexed = sql.SQL("embedding")
+            operator_class = sql.SQL(
+                f"{self.vector_type}_{_DISTANCES[self.distance][1]}"
+            )
+        params = sql.SQL(", ").join(
+            sql.SQL("{} = {}").format(sql.Identifier(name), sql.Literal(value))
+            for name, value in self.index_params.items()
+        )
+        if self.partition_by_user:
+            # The partition key must be part of the primary key
+            user_id, primary_key = "user_id TEXT NOT NULL", "PRIMARY KEY (user_id, id)"
+            partitioning = "PARTITION BY LIST (user_id)"
+        else:
+            user_id, primary_key, partitioning = "user_id TEXT", "PRIMARY KEY (id)", ""
+        statements = [
+            sql.SQL("CREATE EXTENSION IF NOT EXISTS vector"),
+            sql.SQL(
+                """
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id BIGSERIAL,
+                    {user_id},
+                    source TEXT NOT NULL,
+                    chunk_hash TEXT,
+                    content TEXT NOT NULL,
+                    metadata JSONB NOT NULL DEFAULT '{{}}',
+                    embedding {vector_type}({dimensions}) NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    {primary_key}
+                ) {partitioning}
+                """
+            ).format(
+                table=table,
+                user_id=sql.SQL(user_id),
+                vector_type=sql.SQL(self.vector_type),
+                dimensions=sql.Literal(self.dimensions),
+                primary_key=sql.SQL(primary_key),
+                partitioning=sql.SQL(partitioning),
+            ),
+            sql.SQL(
+                "CREATE INDEX IF NOT EXISTS {index} ON {table} "
+                "USING {method} ({indexed} {operator_class}) WITH ({params})"
+            ).format(
+                index=sql.Identifier(f"{self.table_name}_embedding_idx"),
+                table=table,
+                method=sql.SQL(self.index_type),
+                indexed=indexed,
+                operator_class=operator_class,
+                params=params,
+            ),
+        ]
+        statements += [
+            sql.SQL(
+                "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS tsv tsvector "
+                "GENERATED ALWAYS AS (to_tsvector({config}, content)) STORED"
+            ).format(table=table, config=sql.Literal(self.text_search_config)),
+            sql.SQL(
+                "CREATE INDEX IF NOT EXISTS {index} ON {table} USING gin (tsv)"
+            ).format(index=sql.Identifier(f"{self.table_name}_tsv_idx"), table=table),
+        ]
+        for column in _COLUMNS:
+            statements.append(
+                sql.SQL(
+                    "CREATE INDEX IF NOT EXISTS {index} ON {table} ({column})"
+                ).format(
+                    index=sql.Identifier(f"{self.table_name}_{column}_idx"),
+                    table=table,
+                    column=sql.Identifier(column),
+                )
+            )
+
+        async with self.async_connection() as connection:
+            for statement in statements:
+                await connection.execute(statement)
+
+    async def _acheck_table(self):
+        """
+        Refuse to use an existing table whose partitioning or embedding type differs
+        from the store's, which has to be migrated with
+        init/partition_document_chunks.sql or init/quantize_document_chunks.sql.
+        """
+        async with self.async_connection() as connection:
+            cursor = await connection.execute(
+                """
+                SELECT c.relkind, format_type(a.atttypid, NULL)
+                FROM pg_class c
+                JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = 'embedding'
+                WHERE c.oid = to_regclass(%s)
+                """,
+                [sql.Identifier(self.table_name).as_string(connection)],
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return
+        kind, vector_type = row
+        if (kind == "p") != self.partition_by_user:
+            raise ValueError(
+                f"Table {self.table_name} is "
+                f"{'' if kind == 'p' else 'not '}partitioned by user, "
+                f"but the store was created with partition_by_user={self.partition_by_user}"
+            )
+        if vector_type != self.vector_type:
+            raise ValueError(
+                f"Table {self.table_name} stores embeddings as {vector_type}, but the "
+                f"store was created with quantization={self.quantization}"
+            )
+
+    def partition_name(self, user_id: str) -> str:
+        """
+        Name of the partition holding the chunks of a user, derived from a hash of
+        the user id so any id gives a valid identifier.
+        """
+        digest = hashlib.sha256(user_id.encode()).hexdigest()[:16]
+        return f"{self.table_name}_u_{digest}"
+
+    async def acreate_partition(self, user_id: str):
+        """
+        Create the partition of a user if it doesn't exist. Concurrent creations of
+        the same partition are serialized by an advisory lock on its name.
+        """
+        if user_id in self._partitions:
+            return
+        name = self.partition_name(user_id)
+        async with self.async_connection() as connection:
+            async with connection.transaction():
+                await connection.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext(%s))", [name]
+                )
+                await connection.execute(
+                    sql.SQL(
+                        "CREATE TABLE IF NOT EXISTS {partition} "
+                        "PARTITION OF {table} FOR VALUES IN ({user_id})"
+                    ).format(
+                        partition=sql.Identifier(name),
+                        table=sql.Identifier(self.table_name),
+                        user_id=sql.Literal(user_id),
+                    )
+                )
+        self._partitions.add(user_id)
+
+    async def aadd_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+    ):
+        """
+        Insert embedded chunks, creating the partitions of their owners first when
+        the table is partitioned by user.
+        """
+        if self.partition_by_user:
+            owners = {metadata.get("user_id") for metadata in metadatas}
+            if None in owners:
+                raise ValueError("Chunks of a store partitioned by user need a user_id")
+            for user_id in owners:
+                await self.acreate_partition(user_id)
+
+        query = sql.SQL(
+            """
+            INSERT INTO {table}
+                (user_id, source, chunk_hash, content, metadata, embedding)
+            VALUES (%s, %s, %s, %s, %s, %s::{vector_type})
+            """
+        ).format(
+            table=sql.Identifier(self.table_name),
+            vector_type=sql.SQL(self.vector_type),
+        )
+        rows = [
+            (
+                metadata.get("user_id"),
+                metadata["source"],
+                metadata.get("chunk_hash"),
+                text,
+                Jsonb(metadata),
+                to_vector(embedding),
+            )
+            for text, embedding, metadata in zip(texts, embeddings, metadatas)
+        ]
+        async with self.async_connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.executemany(query, rows)
+
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        with_embeddings: bool = False,
+    ) -> List[tuple]:
+        """
+        Search the chunks most similar to the query, with their distance.
+        """
+        embedding = await self.embeddings.aembed_query(query)
+        return await self.asimilarity_search_by_vector(
+            embedding,
+            k=k,
+            filter=filter,
+            ef_search=ef_search,
+            with_embeddings=with_embeddings,
+        )
+
+    async def asimilarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        with_embeddings: bool = False,
+    ) -> List[tuple]:
+        """
+        Search the chunks nearest to the embedding, with their distance, and their
+        own embedding with `with_embeddings`.
+
+        Supports the same filters as PGEmbedding: {"key": {"in": [...]}},
+        {"key": {"substring": "..."}} and {"key": value}, and {"key": {"ne": value}},
+        matching missing keys too. Filters on source, user_id
+        and chunk_hash use their indexed columns. `ef_search` overrides the HNSW
+        candidate list size for this query and is raised to at least the number of
+        results HNSW has to return: k, or the candidates rescored with binary
+        quantization.
+
+        An HNSW scan only returns its `ef_search` nearest candidates, which a
+        filter then narrows, so a selective filter would find fewer than k
+        chunks. With pgvector 0.8 or later, filtered scans go on iteratively until
+        enough rows match or `max_scan_tuples` rows were visited; when a filtered
+        search still comes back short, it is run again as an exact scan of the
+        matching rows.
+        """
+        where, params = self._where(filter)
+        vector = to_vector(embedding)
+        if self.quantization == "binary":
+            candidates = k * self.rescore_factor
+            query = sql.SQL(
+                """
+                SELECT content, metadata, distance{vector} FROM (
+                    SELECT content, metadata, embedding,
+                        embedding {operator} %s::halfvec AS distance
+                    FROM {table}
+                    WHERE {where}
+                    ORDER BY binary_quantize(embedding)::bit({dimensions})
+                        <~> binary_quantize(%s::halfvec)
+                    LIMIT %s
+                ) AS candidates
+                ORDER BY distance
+                LIMIT %s
+                """
+            )
+            params = [vector, *params, vector, candidates, k]
+        else:
+            candidates = k
+            # Iterative scans return rows slightly out of order, sorted again here
+            query = sql.SQL(
+                """
+                SELECT content, metadata, distance{vector} FROM (
+                    SELECT content, metadata, embedding,
+                        embedding {operator} %s::{vector_type} AS distance
+                    FROM {table}
+                    WHERE {where}
+                    ORDER BY distance
+                    LIMIT %s
+                ) AS nearest
+                ORDER BY distance
+                """
+            )
+            params = [vector, *params, k]
+        query = query.format(
+            operator=sql.SQL(_DISTANCES[self.distance][0]),
+            vector_type=sql.SQL(self.vector_type),
+            table=sql.Identifier(self.table_name),
+            where=where,
+            dimensions=sql.Literal(self.dimensions),
+            vector=self._embedding_column(with_embeddings),
+        )
+
+        async with self.async_connection() as connection:
+            async with connection.transaction():
+                if self.index_type == "hnsw":
+                    ef_search = max(ef_search or self.ef_search, candidates)
+                    await connection.execute(
+                        "SELECT set_config('hnsw.ef_search', %s, true)",
+                        [str(ef_search)],
+                    )
+                    if filter and await self._aiterative_scan(connection):
+                        await connection.execute(
+                            "SELECT set_config('hnsw.iterative_scan', "
+                            "'relaxed_order', true), "
+                            "set_config('hnsw.max_scan_tuples', %s, true)",
+                            [str(self.max_scan_tuples)],
+                        )
+                else:
+                    await connection.execute(
+                        "SELECT set_config('ivfflat.probes', %s, true)",
+                        [str(self.probes)],
+                    )
+                cursor = await connection.execute(query, params)
+                rows = await cursor.fetchall()
+                if filter and len(rows) < k:
+                    # Too few of the candidates matched: search the matching rows
+                    # exactly, without the approximate index
+                    await connection.execute(
+                        "SELECT set_config('enable_indexscan', 'off', true), "
+                        "set_config('enable_seqscan', 'on', true)"
+                    )
+                    cursor = await connection.execute(query, params)
+                    rows = await cursor.fetchall()
+
+        return [
+            (Document(page_content=content, metadata=metadata), *scores)
+            for content, metadata, *scores in rows
+        ]
+
+    async def _aiterative_scan(self, connection) -> bool:
+        """
+        Whether the installed pgvector, 0.8 or later, supports iterative index scans.
+        """
+        if self._iterative_scan is None:
+            cursor = await connection.execute(
+                "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+            )
+            row = await cursor.fetchone()
+            version = tuple(int(part) for part in row[0].split(".")[:2]) if row else ()
+            self._iterative_scan = version >= (0, 8)
+        return self._iterative_scan
+
+    async def alexical_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict] = None,
+        with_embeddings: bool = False,
+    ) -> List[tuple]:
+        """
+        Full-text search of the chunks matching any term of the query, ranked by
+        `ts_rank_cd`, with their rank, and their embedding with `with_embeddings`.
+        Supports the same filters as the vector search.
+
+        The query is the disjunction of the lexemes of the text, each quoted as is,
+        so lexemes holding tsquery operators, such as URLs, are matched whole.
+        """
+        where, params = self._where(filter)
+        query_sql = sql.SQL(
+            """
+            SELECT content, metadata, ts_rank_cd(tsv, terms) AS rank{vector}
+            FROM {table}, (
+                SELECT string_agg(
+                    '''' || replace(replace(lexeme, '\\', '\\\\'), '''', '''''') || '''',
+                    ' | '
+                )::tsquery AS terms
+                FROM unnest(tsvector_to_array(to_tsvector(%s::regconfig, %s)))
+                    AS lexeme
+            ) AS query
+            WHERE tsv @@ terms AND {where}
+            ORDER BY rank DESC
+            LIMIT %s
+            """
+        ).format(
+            table=sql.Identifier(self.table_name),
+            where=where,
+            vector=self._embedding_column(with_embeddings),
+        )
+        async with self.async_connection() as connection:
+            cursor = await connection.execute(
+                query_sql, [self.text_search_config, query, *params, k]
+            )
+            rows = await cursor.fetchall()
+        return [
+            (Document(page_content=content, metadata=metadata), *scores)
+            for content, metadata, *scores in rows
+        ]
+
+    @staticmethod
+    def _embedding_column(with_embeddings: bool) -> sql.Composable:
+        """
+        Extra column selecting the embeddings of the results, as float arrays.
+        """
+        if not with_embeddings:
+            return sql.SQL("")
+        return sql.SQL(", embedding::vector::real[]")
+
+    async def adelete(self, filter: dict) -> int:
+        """
+        Delete the chunks matching a filter, supporting the same filters as the
+        searches.
+
+        :return: The number of chunks deleted.
+        """
+        if not filter:
+            raise ValueError("Refusing to delete chunks without a filter")
+        where, params = self._where(filter)
+        query = sql.SQL("DELETE FROM {table} WHERE {where}").format(
+            table=sql.Identifier(self.table_name), where=where
+        )
+        async with self.async_connection() as connection:
+            cursor = await connection.execute(query, params)
+            return cursor.rowcount
+
+    async def acopy_chunks(
+        self, filter: dict, metadata: dict, expected: Optional[int] = None
+    ) -> int:
+        """
+        Copy the chunks matching a filter, with their embeddings, in a single
+        statement, overriding their metadata with `metadata`. The copies are
+        rolled back unless exactly `expected` chunks matched, when given.
+
+        :return: The number of chunks copied.
+        """
+        if not filter:
+            raise ValueError("Refusing to copy chunks without a filter")
+        user_id = metadata.get("user_id")
+        if self.partition_by_user:
+            if user_id is None:
+                raise ValueError("Chunks of a store partitioned by user need a user_id")
+            await self.acreate_partition(user_id)
+        where, params = self._where(filter)
+        query = sql.SQL(
+            """
+            INSERT INTO {table}
+                (user_id, source, chunk_hash, content, metadata, embedding)
+            SELECT %s, %s, chunk_hash, content, (metadata - %s::text[]) || %s, embedding
+            FROM {table} WHERE {where}
+            """
+        ).format(table=sql.Identifier(self.table_name), where=where)
+        params = [
+            user_id,
+            metadata["source"],
+            ["user_id", *metadata],
+            Jsonb(metadata),
+            *params,
+        ]
+        async with self.async_connection() as connection:
+            async with connection.transaction():
+                cursor = await connection.execute(query, params)
+                if expected is not None and cursor.rowcount != expected:
+                    raise psycopg.Rollback()
+                return cursor.rowcount
+        return 0
+
+    async def alookup_chunks(
+        self, hashes: Set[str], user_id: Optional[str] = None
+    ) -> List[Tuple[str, str, List[float]]]:
+        """
+        Find the stored chunks with the given content hashes, only among the chunks
+        of `user_id` if given.
+
+        :return: The hash, source and embedding of every chunk found.
+        """
+        where, params = self._where(
+            {"chunk_hash": {"in": list(hashes)}}
+            | ({} if user_id is None else {"user_id": user_id})
+        )
+        query = sql.SQL(
+            "SELECT chunk_hash, source, embedding::vector::real[] FROM {table} "
+            "WHERE {where}"
+        ).format(table=sql.Identifier(self.table_name), where=where)
+        async with self.async_connection() as connection:
+            cursor = await connection.execute(query, params)
+            return await cursor.fetchall()
+
+    def _where(self, filter: Optional[dict]) -> Tuple[sql.Composable, list]:
+        """
+        Build the WHERE clause of a metadata filter.
+        """
+        clauses, params = [], []
+        for key, value in (filter or {}).items():
+            if key in _COLUMNS:
+                field = sql.Identifier(key)
+            else:
+                field = sql.SQL("metadata->>{}").format(sql.Literal(key))
+            if isinstance(value, dict):
+                value = {op.lower(): operand for op, operand in value.items()}
+            if isinstance(value, dict) and "in" in value:
+                clauses.append(sql.SQL("{} = ANY(%s)").format(field))
+                params.append([str(item) for item in value["in"]])
+            elif isinstance(value, dict) and "substring" in value:
+                clauses.append(sql.SQL("{} ILIKE %s").format(field))
+                params.append(f"%{value['substring']}%")
+            elif isinstance(value, dict) and "ne" in value:
+                clauses.append(sql.SQL("{} IS DISTINCT FROM %s").format(field))
+                params.append(str(value["ne"]))
+            else:
+                clauses.append(sql.SQL("{} = %s").format(field))
+                params.append(str(value))
+        if not clauses:
+            return sql.SQL("TRUE"), params
+        return sql.SQL(" AND ").join(clauses), params
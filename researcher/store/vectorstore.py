@@ -1,26 +1,195 @@
-from typing import List, Dict, Union, Optional
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import unicodedata
+import uuid
+from contextlib import contextmanager
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import faiss
+import numpy as np
 from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS, PGEmbedding
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.embeddings import Embeddings as LangchainEmbeddings
+from prometheus_client import Counter
+import psycopg
+from psycopg import sql
+from psycopg.types.json import Json
+from researcher.cache import BaseCache, LRUCache, hash_key
+from researcher.document.chunker import Chunker
 from researcher.embeddings import Embeddings
+from researcher.utils.database import get_db_connection
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .mmr import maximal_marginal_relevance
+from .pgvector import PGVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Scalar quantizers of the default FAISS store's vectors, by quantization. int8
+# shares one range across dimensions, trained on the first vectors of the store
+_FAISS_QUANTIZATIONS = {
+    None: None,
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit_uniform,
+}
+
+INGESTED_CHUNKS = Counter(
+    "researcher_ingested_chunks_total",
+    "Chunks loaded into the vector store, by whether they were embedded, reused an "
+    "existing vector, were already stored or were copied from an identical file.",
+    ["outcome"],
+)
+DELETED_CHUNKS = Counter(
+    "researcher_deleted_chunks_total",
+    "Chunks deleted from the vector store, with their file or replaced on re-upload.",
+)
+
+
+def chunk_hash(text: str, model: str) -> str:
+    """
+    Fingerprint a chunk by its normalized text and the model embedding it.
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+    return hashlib.sha256(f"{model}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+async def _aiter(items: Iterable) -> AsyncIterator:
+    for item in items:
+        yield item
 
 
 class Store:
     """
     A Wrapper for Langchain VectorStore and PGEmbedding to handle GPT-Researcher Document Type.
     If no vector_store is provided, a default FAISS VectorStore will be created lazily in load method.
+
+    The default FAISS store can be persisted to `persist_directory`: it is loaded from
+    there, memory-mapped so that worker processes share its pages, and saved once per
+    load. Saves replace the files atomically under a file lock, and every process
+    reloads the index before searching once another process has saved it, appending
+    the batches it hasn't saved yet again.
+
+    In hybrid mode, searches fuse vector results with lexical results by reciprocal
+    rank, so exact identifiers missed by embeddings are still found: full-text
+    search for PGVectorStore and an in-process BM25 index for FAISS.
+
+    With MMR enabled, searches fetch `fetch_k` candidates and re-select k of them
+    by maximal marginal relevance, dropping near-duplicate overlapping chunks.
+
+    With a `file_cache`, files loaded with their SHA-256 are remembered by content,
+    so loading an identical file again, for another user or under another name,
+    copies the stored chunks and vectors instead of parsing and embedding it.
     """
 
     def __init__(
         self,
         vector_store_type: str = "default",
-        vector_store: Optional[Union[FAISS, PGEmbedding]] = None,
+        vector_store: Optional[Union[FAISS, PGEmbedding, PGVectorStore]] = None,
+        async_connection=get_db_connection,
+        embeddings: Optional[LangchainEmbeddings] = None,
+        persist_directory: Optional[str] = None,
+        mmap: bool = True,
+        hybrid: bool = False,
+        rrf_k: int = 60,
+        mmr: bool = False,
+        fetch_k: Optional[int] = None,
+        lambda_mult: float = 0.5,
+        chunker: Optional[Chunker] = None,
+        quantization: Optional[str] = None,
+        file_cache: Optional[BaseCache] = None,
+        quantization_training_size: int = 1024,
     ):
+        """
+        :param vector_store_type: Type of the vector store, for reference.
+        :param vector_store: The Langchain VectorStore, FAISS is created lazily if None.
+        :param async_connection: Async context manager yielding a database connection,
+                                 used to search PGEmbedding without blocking.
+        :param embeddings: Embeddings used for the default FAISS store, defaults to
+                           OpenAI embeddings with an in-process query cache.
+        :param persist_directory: Directory the default FAISS store is saved to and
+                                  loaded from, kept in memory only if None.
+        :param mmap: Memory-map the persisted FAISS index instead of reading it.
+        :param hybrid: Fuse vector and lexical results by default in searches.
+        :param rrf_k: Rank offset of the reciprocal rank fusion, higher values give
+                      lower ranked results more weight.
+        :param mmr: Re-select search results by maximal marginal relevance by default.
+        :param fetch_k: Candidates fetched for MMR, defaults to 4 times k.
+        :param lambda_mult: MMR trade-off, 1 ranks by relevance only and 0 by
+                            diversity only.
+        :param chunker: Splits loaded documents into chunks, defaults to chunks of
+                        1000 characters overlapping by 200.
+        :param quantization: Store the vectors of the default FAISS store as
+                             "float16" or "int8" scalars, float32 if None. Searches
+                             rank the quantized vectors without rescoring them at
+                             full precision, which int8 costs some recall, measured
+                             by benchmarks/quantization_benchmark.py.
+        :param file_cache: Cache mapping the SHA-256 of loaded files to the chunks
+                           stored for them, used by `acopy_file`.
+        :param quantization_training_size: Vectors the int8 range is trained on, kept
+                                           at float32 until the store holds as many.
+                                           The range is widened by 20% on both sides
+                                           for the vectors appended later.
+        """
+        if quantization not in _FAISS_QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization: {quantization} - Supported quantizations: "
+                f"{[name for name in _FAISS_QUANTIZATIONS if name]}"
+            )
         self.vector_store_type = vector_store_type
         self.vector_store = vector_store
-        self.embeddings = Embeddings(
-            embedding_provider="openai", model="text-embedding-3-small"
-        ).get_embeddings()
+        self.async_connection = async_connection
+        if embeddings is None:
+            embeddings = Embeddings(
+                embedding_provider="openai",
+                model="text-embedding-3-small",
+                cache=LRUCache(max_size=1024),
+            ).get_embeddings()
+        self.embeddings = embeddings
+
+        self.persist_directory = persist_directory
+        self.mmap = mmap
+        self._persisted_version = None
+        # Serializes the threads reading and writing FAISS, as they can't overlap
+        self._faiss_lock = threading.RLock()
+        # Batches appended to the persisted FAISS store since it was last saved
+        self._unsaved: List[Tuple[List[str], List[List[float]], List[dict]]] = []
+        self.hybrid = hybrid
+        self.rrf_k = rrf_k
+        self.mmr = mmr
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self.chunker = chunker or Chunker()
+        self.quantization = quantization
+        self.file_cache = file_cache
+        self.quantization_training_size = quantization_training_size
+        self._bm25 = None
+        self._bm25_store = None
+        # Positions, owners and sources of the FAISS chunks by chunk hash, and the
+        # number of positions indexed
+        self._chunk_positions: Dict[str, List[Tuple[int, Optional[str], str]]] = {}
+        self._chunk_positions_size = 0
+        self._chunk_positions_store = None
+        if persist_directory is not None and vector_store is None:
+            self._refresh_persisted()
 
     def load(self, documents: List[Dict[str, str]]):
         """
@@ -28,55 +197,1340 @@ class Store:
         Translates to Langchain document type, splits to chunks, then loads.
         """
         langchain_documents = self._create_langchain_documents(documents)
-        splitted_documents = self._split_documents(langchain_documents)
+        splitted_documents = list(self._split_documents(langchain_documents))
 
         # Lazily initialize FAISS if vector_store is None
-        if self.vector_store is None:
+        if self.vector_store is None or isinstance(self.vector_store, FAISS):
             texts = [doc.page_content for doc in splitted_documents]
             metadatas = [doc.metadata for doc in splitted_documents]
-            self.vector_store = FAISS.from_texts(
-                texts=texts, embedding=self.embeddings, metadatas=metadatas
+            self._add_faiss_embeddings(
+                texts, self.embeddings.embed_documents(texts), metadatas
             )
         elif isinstance(self.vector_store, PGEmbedding):
             texts = [doc.page_content for doc in splitted_documents]
             metadatas = [doc.metadata for doc in splitted_documents]
             self.vector_store.add_texts(texts=texts, metadatas=metadatas)
+        elif isinstance(self.vector_store, PGVectorStore):
+            raise ValueError("PGVectorStore is async only, load documents with aload")
         else:
             self.vector_store.add_documents(splitted_documents)
 
-    def _create_langchain_documents(self, data: List[Dict[str, str]]) -> List[Document]:
-        """Convert GPT Researcher Document to Langchain Document format."""
-        return [
-            Document(page_content=item["raw_content"], metadata={"source": item["url"]})
-            for item in data
-        ]
+    async def aload(
+        self,
+        documents: Union[Iterable[Dict[str, str]], AsyncIterable[Dict[str, str]]],
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        replace: bool = False,
+        on_progress: Optional[Callable[[int, Optional[int]], Awaitable[None]]] = None,
+        file_hash: Optional[str] = None,
+    ):
+        """
+        Load documents into the vector store without blocking the event loop.
+
+        Documents, from a list or an async iterator such as
+        `DocumentLoader.lazy_load`, flow through splitting, embedding and writing in
+        batches of `batch_size` chunks, with at most `max_concurrency` batches in
+        flight: the next documents are only read once a batch completes, so memory
+        stays bounded however large the input, and each batch is searchable as soon
+        as it is written. A failed embedding request is retried up to `max_retries`
+        times with exponential backoff starting at `retry_delay` seconds. PGEmbedding
+        is written through the async connection pool.
+
+        Chunks are fingerprinted with `chunk_hash` before embedding: chunks already
+        stored for the same source are skipped and chunks stored for other sources of
+        the same owner, or embedded by an earlier batch, reuse their vector, so only
+        new content reaches the embedding API. Identical files of other owners are
+        copied from the file cache instead, see `acopy_file`.
+
+        With `replace`, every chunk of the loaded sources is written again, reusing
+        the vectors of unchanged chunks, and the chunks stored by earlier loads of
+        the sources are deleted once all are written, so a re-uploaded file leaves no
+        stale chunks behind and stays searchable meanwhile.
+
+        `on_progress` is awaited with the number of chunks written and the number of
+        chunks to write, None until every document has been split, whenever chunks
+        are written.
+
+        Given the `file_hash` of the file the documents were parsed from, the chunks
+        stored for it are recorded in the file cache, to be copied by `acopy_file`
+        when an identical file is loaded.
+
+        A persisted FAISS store is saved once, when the load ends, so other processes
+        see its chunks from then on.
+        """
+        model = self._embedding_model()
+        load_id = uuid.uuid4().hex
+        # Fingerprints and sources of the chunks read, the owners of the sources, the
+        # vectors of the chunks being embedded by a batch in flight, and the
+        # fingerprints of the chunks written
+        seen: Set[Tuple[str, str]] = set()
+        owners: Dict[str, Optional[str]] = {}
+        in_flight: Dict[str, asyncio.Future] = {}
+        written: Set[str] = set()
+        counts = {"written": 0, "to_write": 0, "skipped": 0}
+        total: Optional[int] = None
+
+        async def report(written: int = 0, skipped: int = 0):
+            counts["written"] += written
+            counts["to_write"] -= skipped
+            counts["skipped"] += skipped
+            if on_progress is not None and (written or total is not None):
+                total_to_write = None if total is None else counts["to_write"]
+                await on_progress(counts["written"], total_to_write)
+
+        async def load_batch(batch: List[Document]):
+            waiting = {
+                doc.metadata["chunk_hash"]: in_flight[doc.metadata["chunk_hash"]]
+                for doc in batch
+                if doc.metadata["chunk_hash"] in in_flight
+            }
+            existing = {}
 
-    def _split_documents(
+            async def lookup(docs: List[Document]):
+                # Look up the chunks of each owner among theirs only, which in a table
+                # partitioned by owner only scans their partition
+                hashes: Dict[Optional[str], Set[str]] = {}
+                for doc in docs:
+                    hashes.setdefault(doc.metadata.get("user_id"), set()).add(
+                        doc.metadata["chunk_hash"]
+                    )
+                for user_id, owned in hashes.items():
+                    found = await self._alookup_chunks(owned, user_id=user_id)
+                    for fingerprint, stored in found.items():
+                        existing[fingerprint, user_id] = stored
+
+            await lookup(
+                [doc for doc in batch if doc.metadata["chunk_hash"] not in waiting]
+            )
+            # Other batches may have started or finished writing a chunk meanwhile
+            late = []
+            for doc in batch:
+                fingerprint = doc.metadata["chunk_hash"]
+                if fingerprint in waiting or (
+                    (fingerprint, doc.metadata.get("user_id")) in existing
+                ):
+                    continue
+                if fingerprint in in_flight:
+                    waiting[fingerprint] = in_flight[fingerprint]
+                elif fingerprint in written:
+                    late.append(doc)
+            await lookup(late)
+
+            docs, vectors, pending, awaited, duplicates = [], [], {}, [], 0
+            for doc in batch:
+                fingerprint, source = doc.metadata["chunk_hash"], doc.metadata["source"]
+                key = (fingerprint, doc.metadata.get("user_id"))
+                if key in existing:
+                    if not replace and source in existing[key][1]:
+                        duplicates += 1
+                        continue
+                    docs.append(doc)
+                    vectors.append(existing[key][0])
+                elif fingerprint in waiting:
+                    awaited.append(doc)
+                else:
+                    pending.setdefault(fingerprint, []).append(doc)
+            INGESTED_CHUNKS.labels(outcome="duplicate").inc(duplicates)
+
+            # Embed each new chunk once, even when it is stored for several sources
+            # or read again by a later batch
+            loop = asyncio.get_running_loop()
+            futures = {fingerprint: loop.create_future() for fingerprint in pending}
+            in_flight.update(futures)
+            try:
+                embeddings = (
+                    await self._aembed_with_retry(
+                        [group[0].page_content for group in pending.values()],
+                        max_retries=max_retries,
+                        retry_delay=retry_delay,
+                    )
+                    if pending
+                    else []
+                )
+                for (fingerprint, group), vector in zip(pending.items(), embeddings):
+                    futures[fingerprint].set_result(vector)
+                    docs.extend(group)
+                    vectors.extend([vector] * len(group))
+                for doc in awaited:
+                    docs.append(doc)
+                    vectors.append(await waiting[doc.metadata["chunk_hash"]])
+                if docs:
+                    await self._aadd_embeddings(
+                        [doc.page_content for doc in docs],
+                        vectors,
+                        [doc.metadata for doc in docs],
+                    )
+                written.update(futures)
+            except BaseException as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"Embedding failed: {e}"))
+                        # Mark the exception as retrieved when nothing waits for it
+                        future.exception()
+                raise
+            finally:
+                # Written chunks are found by looking up the store from now on
+                for fingerprint in futures:
+                    in_flight.pop(fingerprint, None)
+            INGESTED_CHUNKS.labels(outcome="embedded").inc(len(pending))
+            INGESTED_CHUNKS.labels(outcome="reused").inc(len(docs) - len(pending))
+            await report(written=len(docs), skipped=duplicates)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        tasks: Set[asyncio.Task] = set()
+
+        async def schedule(batch: List[Document]):
+            # Wait for a free slot before reading further, failing fast on an error
+            await semaphore.acquire()
+            for task in [task for task in tasks if task.done()]:
+                tasks.discard(task)
+                task.result()
+            task = asyncio.ensure_future(load_batch(batch))
+            task.add_done_callback(lambda _: semaphore.release())
+            tasks.add(task)
+
+        try:
+            batch = []
+            async for doc in self._achunks(documents):
+                doc.metadata["chunk_hash"] = chunk_hash(doc.page_content, model)
+                doc.metadata["load_id"] = load_id
+                key = (doc.metadata["chunk_hash"], doc.metadata["source"])
+                # Drop chunks repeated within the same source
+                if key in seen:
+                    INGESTED_CHUNKS.labels(outcome="duplicate").inc()
+                    continue
+                seen.add(key)
+                owners.setdefault(key[1], doc.metadata.get("user_id"))
+                counts["to_write"] += 1
+                batch.append(doc)
+                if len(batch) == batch_size:
+                    await schedule(batch)
+                    batch = []
+            if batch:
+                await schedule(batch)
+            total = counts["to_write"]
+            await report()
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            # Batches written before a failure are kept, like in Postgres
+            await asyncio.to_thread(self._save_unsaved)
+
+        if replace:
+            for source, user_id in owners.items():
+                filter = {"source": source, "load_id": {"ne": load_id}}
+                if user_id is not None:
+                    filter["user_id"] = user_id
+                await self.adelete(filter)
+
+        # Only a complete load of a single file holds every chunk of the file
+        if (
+            file_hash is not None
+            and self.file_cache is not None
+            and len(owners) == 1
+            and not counts["skipped"]
+        ):
+            [(source, user_id)] = owners.items()
+            await self.file_cache.aset(
+                self._file_key(file_hash),
+                {
+                    "source": source,
+                    "user_id": user_id,
+                    "load_id": load_id,
+                    "chunks": counts["written"],
+                },
+            )
+
+    async def acopy_file(
         self,
-        documents: List[Document],
-        chunk_size: int = 1000,
-        chunk_overlap: int = 200,
-    ) -> List[Document]:
+        file_hash: str,
+        source: str,
+        user_id: Optional[str] = None,
+        replace: bool = False,
+    ) -> Optional[int]:
+        """
+        Load a file already loaded with the same content, chunker and embedding
+        model by copying its stored chunks and vectors to a new source or owner,
+        without parsing, splitting or embedding anything.
+
+        The copy is only made when every chunk recorded for the file is still
+        stored, as a file deleted or re-uploaded since leaves nothing to copy. The
+        file cache then points at the copy. With `replace`, the chunks stored by
+        earlier loads of the source are deleted once the copy is written.
+
+        :return: The number of chunks copied, or None if no complete copy of the
+                 file is stored, in which case it must be loaded with `aload`.
+        """
+        if self.file_cache is None:
+            return None
+        key = self._file_key(file_hash)
+        entry = await self.file_cache.aget(key)
+        if entry is None:
+            return None
+
+        load_id = uuid.uuid4().hex
+        filter = {"source": entry["source"], "load_id": entry["load_id"]}
+        if entry["user_id"] is not None:
+            filter["user_id"] = entry["user_id"]
+        metadata = {"source": source, "load_id": load_id}
+        if user_id is not None:
+            metadata["user_id"] = user_id
+        copied = await self._acopy_chunks(filter, metadata, entry["chunks"])
+        if copied != entry["chunks"]:
+            logger.info(f"Chunks of file {file_hash} are no longer stored, loading it")
+            return None
+        INGESTED_CHUNKS.labels(outcome="copied").inc(copied)
+
+        if replace:
+            filter = {"source": source, "load_id": {"ne": load_id}}
+            if user_id is not None:
+                filter["user_id"] = user_id
+            await self.adelete(filter)
+        await self.file_cache.aset(
+            key,
+            {
+                "source": source,
+                "user_id": user_id,
+                "load_id": load_id,
+                "chunks": copied,
+            },
+        )
+        return copied
+
+    def _file_key(self, file_hash: str) -> str:
         """
-        Split documents into smaller chunks for more efficient vector storage.
+        Key of a file in the file cache. Chunks are only reused by loads splitting
+        and embedding them the same way.
         """
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
+        encoding = self.chunker.encoding
+        return hash_key(
+            "file",
+            file_hash,
+            self._embedding_model(),
+            self.chunker.chunk_size,
+            self.chunker.chunk_overlap,
+            None if encoding is None else encoding.name,
+            list(self.chunker.separators),
         )
-        return text_splitter.split_documents(documents)
 
-    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None):
+    async def _acopy_chunks(
+        self, filter: dict, metadata: dict, expected: Optional[int] = None
+    ) -> int:
         """
-        Perform similarity search. Handles both PGEmbedding and default VectorStore types.
+        Copy the chunks matching a filter with their vectors, overriding their
+        metadata, only if exactly `expected` chunks match when given.
+
+        :return: The number of chunks copied.
         """
         if isinstance(self.vector_store, PGEmbedding):
+            return await self._apg_embedding_copy(filter, metadata, expected)
+        elif isinstance(self.vector_store, PGVectorStore):
+            return await self.vector_store.acopy_chunks(filter, metadata, expected)
+        elif self.vector_store is None or isinstance(self.vector_store, FAISS):
+            return await asyncio.to_thread(self._copy_faiss, filter, metadata, expected)
+        return 0
+
+    def _copy_faiss(
+        self, filter: dict, metadata: dict, expected: Optional[int] = None
+    ) -> int:
+        """
+        Append copies of the FAISS chunks matching a filter, with their
+        reconstructed vectors, when exactly `expected` chunks match if given.
+        """
+        with self._persist_lock(fcntl.LOCK_SH):
+            self._refresh_persisted(locked=True)
+            if self.vector_store is None:
+                return 0
+            filter = self._translate_filter(filter)
+            texts, embeddings, metadatas = [], [], []
+            for position, doc_id in self.vector_store.index_to_docstore_id.items():
+                doc = self.vector_store.docstore.search(doc_id)
+                if self._matches(doc, filter):
+                    texts.append(doc.page_content)
+                    embeddings.append(
+                        self.vector_store.index.reconstruct(position).tolist()
+                    )
+                    copy = dict(doc.metadata)
+                    copy.pop("user_id", None)
+                    metadatas.append({**copy, **metadata})
+        if not texts or (expected is not None and len(texts) != expected):
+            return 0
+        self._add_faiss_embeddings(texts, embeddings, metadatas)
+        return len(texts)
+
+    async def _achunks(
+        self,
+        documents: Union[Iterable[Dict[str, str]], AsyncIterable[Dict[str, str]]],
+    ) -> AsyncIterator[Document]:
+        """
+        Lazily split documents, read from an iterable or an async iterable, into
+        chunks.
+        """
+        if not isinstance(documents, AsyncIterable):
+            documents = _aiter(documents)
+        async for item in documents:
+            for doc in self._split_documents(self._create_langchain_documents([item])):
+                yield doc
+
+    def _embedding_model(self) -> str:
+        """
+        Name of the model embedding the documents, part of every chunk hash.
+        """
+        embeddings = self._document_embeddings()
+        return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    async def _alookup_chunks(
+        self, hashes: Set[str], user_id: Optional[str] = None
+    ) -> Dict[str, Tuple[List[float], Set[str]]]:
+        """
+        Find the chunks with the given hashes already in the vector store, only
+        among the chunks of `user_id` if given.
+
+        :return: The vector and the sources stored for each fingerprint found.
+        """
+        found = {}
+        if not hashes:
+            return found
+
+        if isinstance(self.vector_store, PGEmbedding):
+            async with self.async_connection() as connection:
+                cursor = await connection.execute(
+                    """
+                    SELECT e.cmetadata->>'chunk_hash', e.cmetadata->>'source', e.embedding
+                    FROM langchain_pg_embedding e
+                    JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+                    WHERE c.name = %s AND e.cmetadata->>'chunk_hash' = ANY(%s)
+                        AND (%s::text IS NULL OR e.cmetadata->>'user_id' = %s)
+                    """,
+                    [self.vector_store.collection_name, list(hashes), user_id, user_id],
+                )
+                rows = await cursor.fetchall()
+        elif isinstance(self.vector_store, PGVectorStore):
+            rows = await self.vector_store.alookup_chunks(hashes, user_id=user_id)
+        elif self.vector_store is None or isinstance(self.vector_store, FAISS):
+            rows = await asyncio.to_thread(self._lookup_faiss_chunks, hashes, user_id)
+        else:
+            rows = []
+
+        for fingerprint, source, embedding in rows:
+            found.setdefault(fingerprint, (list(embedding), set()))[1].add(source)
+        return found
+
+    def _lookup_faiss_chunks(
+        self, hashes: Set[str], user_id: Optional[str] = None
+    ) -> List[Tuple[str, str, List[float]]]:
+        """
+        Find the FAISS chunks with the given hashes, with their reconstructed vectors.
+        """
+        with self._persist_lock(fcntl.LOCK_SH):
+            self._refresh_persisted(locked=True)
+            if self.vector_store is None:
+                return []
+            self._index_chunk_positions()
+            return [
+                (
+                    fingerprint,
+                    source,
+                    self.vector_store.index.reconstruct(position).tolist(),
+                )
+                for fingerprint in hashes
+                for position, owner, source in self._chunk_positions.get(
+                    fingerprint, []
+                )
+                if user_id is None or owner == user_id
+            ]
+
+    def _index_chunk_positions(self):
+        """
+        Map the chunk hashes of the FAISS store to the positions of their chunks,
+        indexing the chunks appended since the last lookup.
+        """
+        if self._chunk_positions_store is not self.vector_store:
+            self._chunk_positions = {}
+            self._chunk_positions_size = 0
+            self._chunk_positions_store = self.vector_store
+        ids = self.vector_store.index_to_docstore_id
+        for position in range(self._chunk_positions_size, len(ids)):
+            metadata = self.vector_store.docstore.search(ids[position]).metadata
+            if "chunk_hash" in metadata:
+                self._chunk_positions.setdefault(metadata["chunk_hash"], []).append(
+                    (position, metadata.get("user_id"), metadata.get("source"))
+                )
+        self._chunk_positions_size = len(ids)
+
+    async def acreate_chunk_hash_index(self):
+        """
+        Index the chunk hashes of the PGEmbedding table, used to look up chunks
+        before embedding them.
+        """
+        async with self.async_connection() as connection:
+            await connection.execute(
+                """
+                CREATE INDEX IF NOT EXISTS langchain_pg_embedding_chunk_hash_idx
+                ON langchain_pg_embedding ((cmetadata->>'chunk_hash'))
+                """
+            )
+            await connection.commit()
+
+    async def adelete(self, filter: dict) -> int:
+        """
+        Delete the chunks matching a metadata filter, such as the chunks of a deleted
+        file, supporting the same filters as the searches. Rows deleted from Postgres
+        leave dead index entries behind until `acompact` runs, FAISS vectors are
+        removed from the index at once.
+
+        :return: The number of chunks deleted.
+        """
+        if not filter:
+            raise ValueError("Refusing to delete chunks without a filter")
+
+        if isinstance(self.vector_store, PGEmbedding):
+            where, params = self._apg_embedding_where(filter)
+            async with self.async_connection() as connection:
+                cursor = await connection.execute(
+                    sql.SQL(
+                        """
+                        DELETE FROM langchain_pg_embedding e
+                        USING langchain_pg_collection c
+                        WHERE e.collection_id = c.uuid AND {where}
+                        """
+                    ).format(where=where),
+                    params,
+                )
+                deleted = cursor.rowcount
+        elif isinstance(self.vector_store, PGVectorStore):
+            deleted = await self.vector_store.adelete(filter)
+        elif self.vector_store is None or isinstance(self.vector_store, FAISS):
+            deleted = await asyncio.to_thread(self._delete_faiss, filter)
+        else:
+            raise ValueError(
+                f"Deleting chunks from {type(self.vector_store).__name__} is not supported"
+            )
+        DELETED_CHUNKS.inc(deleted)
+        return deleted
+
+    def _delete_faiss(self, filter: dict) -> int:
+        """
+        Remove the chunks matching a filter from the FAISS store, and save it when
+        persisted.
+        """
+        with self._persist_lock(fcntl.LOCK_EX):
+            self._refresh_persisted(locked=True)
+            if self.vector_store is None:
+                return 0
+            filter = self._translate_filter(filter)
+            ids = [
+                doc_id
+                for doc_id in self.vector_store.index_to_docstore_id.values()
+                if self._matches(self.vector_store.docstore.search(doc_id), filter)
+            ]
+            if ids:
+                self.vector_store.delete(ids)
+                # Positions have shifted, the BM25 index and the positions of the
+                # chunk hashes are rebuilt when next used
+                self._bm25_store = None
+                self._chunk_positions_store = None
+                if self.persist_directory is not None:
+                    self._save_persisted()
+            return len(ids)
+
+    @staticmethod
+    def _matches(doc: Document, filter: dict) -> bool:
+        """
+        Whether a document matches a filter in the list form of `_translate_filter`,
+        where values may also be {"ne": value}.
+        """
+
+        def match(value, expected) -> bool:
+            if isinstance(expected, list):
+                return value in expected
+            if isinstance(expected, dict) and "ne" in expected:
+                return value != expected["ne"]
+            return value == expected
+
+        return all(
+            match(doc.metadata.get(key), expected) for key, expected in filter.items()
+        )
+
+    async def acompact(self, dead_ratio: float = 0.1) -> List[str]:
+        """
+        Reclaim the space of deleted chunks in Postgres: tables, or partitions, whose
+        dead rows exceed `dead_ratio` of their rows have their indexes rebuilt
+        concurrently, dropping the dead entries every search had to skip, and are
+        vacuumed. Compactions of the same table from several workers are serialized
+        by an advisory lock, later ones return at once. FAISS needs no compaction.
+
+        :return: The tables compacted.
+        """
+        if isinstance(self.vector_store, PGVectorStore):
+            table = self.vector_store.table_name
+        elif isinstance(self.vector_store, PGEmbedding):
+            table = "langchain_pg_embedding"
+        else:
+            return []
+
+        compacted = []
+        async with self.async_connection() as connection:
+            # VACUUM and REINDEX CONCURRENTLY can't run in a transaction
+            await connection.set_autocommit(True)
+            try:
+                cursor = await connection.execute(
+                    "SELECT pg_try_advisory_lock(hashtext(%s))", [f"compact:{table}"]
+                )
+                if not (await cursor.fetchone())[0]:
+                    return compacted
+                try:
+                    cursor = await connection.execute(
+                        """
+                        SELECT s.relid::regclass::text
+                        FROM pg_stat_user_tables s
+                        WHERE (s.relid = to_regclass(%s) OR s.relid IN (
+                            SELECT inhrelid FROM pg_inherits
+                            WHERE inhparent = to_regclass(%s)
+                        ))
+                        AND s.n_dead_tup > 0
+                        AND s.n_dead_tup >= %s * (s.n_live_tup + s.n_dead_tup)
+                        """,
+                        [table, table, dead_ratio],
+                    )
+                    for (relation,) in await cursor.fetchall():
+                        logger.info(f"Compacting {relation}")
+                        await connection.execute(
+                            sql.SQL("REINDEX TABLE CONCURRENTLY {}").format(
+                                sql.SQL(relation)
+                            )
+                        )
+                        await connection.execute(
+                            sql.SQL("VACUUM (ANALYZE) {}").format(sql.SQL(relation))
+                        )
+                        compacted.append(relation)
+                finally:
+                    await connection.execute(
+                        "SELECT pg_advisory_unlock(hashtext(%s))", [f"compact:{table}"]
+                    )
+            finally:
+                await connection.set_autocommit(False)
+        return compacted
+
+    def _document_embeddings(self) -> LangchainEmbeddings:
+        if isinstance(self.vector_store, (PGEmbedding, PGVectorStore)):
+            return self.vector_store.embeddings
+        return self.embeddings
+
+    async def _aembed_with_retry(
+        self, texts: List[str], max_retries: int, retry_delay: float
+    ) -> List[List[float]]:
+        """
+        Embed a batch of texts, retrying failures with exponential backoff.
+        """
+        embeddings = self._document_embeddings()
+        for attempt in range(max_retries + 1):
+            try:
+                return await embeddings.aembed_documents(texts)
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = retry_delay * 2**attempt
+                logger.warning(
+                    "Embedding batch of %s chunks failed (%s), retrying in %.1fs",
+                    len(texts),
+                    e,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+    async def _aadd_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+    ):
+        """
+        Write an embedded batch to the vector store, lazily creating FAISS.
+        """
+        if isinstance(self.vector_store, PGEmbedding):
+            await self._apg_embedding_insert(texts, embeddings, metadatas)
+        elif isinstance(self.vector_store, PGVectorStore):
+            await self.vector_store.aadd_embeddings(texts, embeddings, metadatas)
+        elif self.vector_store is None or isinstance(self.vector_store, FAISS):
+            await asyncio.to_thread(
+                self._add_faiss_embeddings, texts, embeddings, metadatas, False
+            )
+        else:
+            await self.vector_store.aadd_texts(texts, metadatas=metadatas)
+
+    def _add_faiss_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+        save: bool = True,
+    ):
+        """
+        Append embedded chunks to the FAISS store, creating it if needed. When
+        persisted, the store is saved, or without `save` the chunks are kept to be
+        saved by `_save_unsaved`, as saving rewrites the whole store.
+        """
+        with self._persist_lock(fcntl.LOCK_EX):
+            # Append to the latest saved index, not a stale copy
+            self._refresh_persisted(locked=True)
+            self._append_faiss(texts, embeddings, metadatas)
+            if self.persist_directory is not None:
+                if save:
+                    self._save_persisted()
+                else:
+                    self._unsaved.append((texts, embeddings, metadatas))
+
+    def _save_unsaved(self):
+        """
+        Save the persisted FAISS store if batches were appended without saving it.
+        """
+        if not self._unsaved:
+            return
+        with self._persist_lock(fcntl.LOCK_EX):
+            self._refresh_persisted(locked=True)
+            if self._unsaved:
+                self._save_persisted()
+
+    def _append_faiss(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+    ):
+        """
+        Append embedded chunks to the in-memory FAISS store, creating it if needed.
+        The index is appended to, and only rebuilt once to quantize the vectors an
+        int8 quantizer was trained on.
+        """
+        if self.vector_store is None and self.quantization is not None:
+            index = self._quantized_index(len(embeddings[0]))
+            if not index.is_trained:
+                # Kept at full precision until there are enough vectors to train on
+                index = faiss.IndexFlatL2(index.d)
+            self.vector_store = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+        if self.vector_store is None:
+            self.vector_store = FAISS.from_embeddings(
+                list(zip(texts, embeddings)),
+                embedding=self.embeddings,
+                metadatas=metadatas,
+            )
+        else:
+            stored = self.vector_store.index.ntotal
+            self.vector_store.add_embeddings(
+                list(zip(texts, embeddings)), metadatas=metadatas
+            )
+            self._train_quantizer(stored)
+
+    def _quantized_index(self, dimensions: int) -> faiss.Index:
+        """
+        Create an empty scalar quantized FAISS index, to be trained if int8.
+        """
+        index = faiss.IndexScalarQuantizer(
+            dimensions, _FAISS_QUANTIZATIONS[self.quantization], faiss.METRIC_L2
+        )
+        index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        index.sq.rangestat_arg = 0.2
+        return index
+
+    def _train_quantizer(self, stored: int):
+        """
+        Quantize the full precision vectors of the store once an append of vectors to
+        its `stored` ones brings them to `quantization_training_size`, training the
+        quantizer on all of them.
+        """
+        index = self.vector_store.index
+        if (
+            self.quantization is None
+            or not isinstance(index, faiss.IndexFlat)
+            or not stored < self.quantization_training_size <= index.ntotal
+        ):
+            return
+        vectors = index.reconstruct_n(0, index.ntotal)
+        quantized = self._quantized_index(index.d)
+        quantized.train(vectors)
+        quantized.add(vectors)
+        self.vector_store.index = quantized
+
+    @contextmanager
+    def _persist_lock(self, operation: int):
+        """
+        Hold a lock on the persist directory, shared by readers and exclusive to
+        writers, across processes. Within a process, the threads holding it run
+        one at a time.
+        """
+        with self._faiss_lock:
+            if self.persist_directory is None:
+                yield
+                return
+            os.makedirs(self.persist_directory, exist_ok=True)
+            with open(os.path.join(self.persist_directory, "index.lock"), "a") as lock:
+                fcntl.flock(lock, operation)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _persisted_path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _persisted_file_version(self) -> Tuple[int, int]:
+        stat = os.stat(self._persisted_path("index.pkl"))
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh_persisted(self, locked: bool = False):
+        """
+        Load the persisted FAISS store if it was saved since it was last loaded,
+        appending the batches not saved yet to it again.
+        """
+        if self.persist_directory is None:
+            return
+        if not locked:
+            with self._persist_lock(fcntl.LOCK_SH):
+                return self._refresh_persisted(locked=True)
+
+        try:
+            version = self._persisted_file_version()
+        except FileNotFoundError:
+            return
+        if version == self._persisted_version:
+            return
+
+        index_path = self._persisted_path("index.faiss")
+        index = None
+        if self.mmap:
+            try:
+                index = faiss.read_index(
+                    index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                logger.warning("Index type cannot be memory-mapped, reading it")
+        if index is None:
+            index = faiss.read_index(index_path)
+        with open(self._persisted_path("index.pkl"), "rb") as file:
+            docstore, index_to_docstore_id = pickle.load(file)
+
+        self.vector_store = FAISS(
+            self.embeddings, index, docstore, index_to_docstore_id
+        )
+        self._persisted_version = version
+        for batch in self._unsaved:
+            self._append_faiss(*batch)
+
+    def _save_persisted(self):
+        """
+        Save the FAISS store, replacing the files atomically so processes that
+        memory-mapped the previous index keep reading it until they reload.
+        """
+        index_file = tempfile.NamedTemporaryFile(
+            dir=self.persist_directory, suffix=".faiss", delete=False
+        )
+        index_file.close()
+        faiss.write_index(self.vector_store.index, index_file.name)
+        with tempfile.NamedTemporaryFile(
+            dir=self.persist_directory, suffix=".pkl", delete=False
+        ) as docstore_file:
+            pickle.dump(
+                (self.vector_store.docstore, self.vector_store.index_to_docstore_id),
+                docstore_file,
+            )
+
+        # index.pkl is replaced last, its inode and modification time version the store
+        os.replace(index_file.name, self._persisted_path("index.faiss"))
+        os.replace(docstore_file.name, self._persisted_path("index.pkl"))
+        self._persisted_version = self._persisted_file_version()
+        self._unsaved = []
+
+    async def _apg_embedding_insert(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+    ):
+        """
+        Insert embedded chunks into the PGEmbedding tables.
+        """
+        async with self.async_connection() as connection:
+            async with connection.transaction():
+                cursor = await connection.execute(
+                    "SELECT uuid FROM langchain_pg_collection WHERE name = %s",
+                    [self.vector_store.collection_name],
+                )
+                collection = await cursor.fetchone()
+                if collection is None:
+                    raise ValueError("Collection not found")
+                async with connection.cursor() as cursor:
+                    await cursor.executemany(
+                        """
+                        INSERT INTO langchain_pg_embedding
+                            (collection_id, embedding, document, cmetadata, custom_id, uuid)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        """,
+                        [
+                            (
+                                collection[0],
+                                embedding,
+                                text,
+                                Json(metadata),
+                                str(uuid.uuid4()),
+                                uuid.uuid4(),
+                            )
+                            for text, embedding, metadata in zip(
+                                texts, embeddings, metadatas
+                            )
+                        ],
+                    )
+
+    async def _apg_embedding_copy(
+        self, filter: dict, metadata: dict, expected: Optional[int] = None
+    ) -> int:
+        """
+        Copy the PGEmbedding chunks matching a filter in a single statement, rolled
+        back unless exactly `expected` chunks matched when given.
+        """
+        where, params = self._apg_embedding_where(filter)
+        query = sql.SQL(
+            """
+            INSERT INTO langchain_pg_embedding
+                (collection_id, embedding, document, cmetadata, custom_id, uuid)
+            SELECT e.collection_id, e.embedding, e.document,
+                ((e.cmetadata::jsonb - %s::text[]) || %s::jsonb)::json,
+                gen_random_uuid()::text, gen_random_uuid()
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE {where}
+            """
+        ).format(where=where)
+        params = [["user_id", *metadata], Json(metadata), *params]
+        async with self.async_connection() as connection:
+            async with connection.transaction():
+                cursor = await connection.execute(query, params)
+                if expected is not None and cursor.rowcount != expected:
+                    raise psycopg.Rollback()
+                return cursor.rowcount
+        return 0
+
+    def _create_langchain_documents(
+        self, data: Iterable[Dict[str, str]]
+    ) -> Iterator[Document]:
+        """
+        Convert GPT Researcher Document to Langchain Document format. The owner of a
+        document, if given as "user_id", and its page number, if given as "page", are
+        kept in its metadata.
+        """
+        for item in data:
+            metadata = {"source": item["url"]}
+            for key in ("user_id", "page"):
+                if key in item:
+                    metadata[key] = item[key]
+            yield Document(page_content=item["raw_content"], metadata=metadata)
+
+    def _split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Lazily split documents into smaller chunks for more efficient vector storage,
+        recording the character span of every chunk in its document.
+        """
+        return self.chunker.split_documents(documents)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict] = None,
+        hybrid: Optional[bool] = None,
+        mmr: Optional[bool] = None,
+        fetch_k: Optional[int] = None,
+        lambda_mult: Optional[float] = None,
+    ):
+        """
+        Perform similarity search. Handles both PGEmbedding and default VectorStore types.
+        `hybrid`, `mmr`, `fetch_k` and `lambda_mult` override the store's settings
+        for this search.
+
+        MMR needs the vectors of the candidates, which only FAISS holds here: other
+        vector stores are searched by similarity alone, as with `asimilarity_search`
+        when none of their candidates' vectors are found.
+        """
+        self._refresh_persisted()
+        if not (self.mmr if mmr is None else mmr) or not isinstance(
+            self.vector_store, FAISS
+        ):
+            return self._search(query, k=k, filter=filter, hybrid=hybrid)
+
+        candidates = self._search(
+            query,
+            k=max(k, fetch_k or self.fetch_k or 4 * k),
+            filter=filter,
+            hybrid=hybrid,
+        )
+        documents = [self._result_document(result) for result in candidates]
+        embeddings = self._faiss_embeddings(documents)
+        if all(embedding is None for embedding in embeddings):
+            return candidates[:k]
+        query_embedding = self._document_embeddings().embed_query(query)
+        return self._select_mmr(query_embedding, candidates, embeddings, k, lambda_mult)
+
+    def _search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict] = None,
+        hybrid: Optional[bool] = None,
+    ):
+        """
+        Search the vector store, fusing lexical results in hybrid mode.
+        """
+        hybrid = self.hybrid if hybrid is None else hybrid
+        if hybrid and isinstance(self.vector_store, FAISS):
+            candidates = self._hybrid_candidates(k)
+            embedding = self.vector_store.embeddings.embed_query(query)
+            return self._fuse(
+                *self._faiss_search(embedding, candidates, filter, lexical=query), k
+            )
+        if isinstance(self.vector_store, FAISS):
+            embedding = self.vector_store.embeddings.embed_query(query)
+            results, _ = self._faiss_search(embedding, k, filter)
+        elif isinstance(self.vector_store, PGEmbedding):
             results = self.vector_store.similarity_search_with_score(
                 query=query, k=k, filter=filter
             )
+        elif isinstance(self.vector_store, PGVectorStore):
+            raise ValueError(
+                "PGVectorStore is async only, search with asimilarity_search"
+            )
         else:
             results = self.vector_store.similarity_search(
-                query=query, k=k, filter=filter
+                query=query, k=k, filter=self._translate_filter(filter)
             )
 
         return results
+
+    def _faiss_search(
+        self,
+        embedding: List[float],
+        k: int,
+        filter: Optional[dict] = None,
+        lexical: Optional[str] = None,
+    ) -> Tuple[List[Document], List[Document]]:
+        """
+        Search the FAISS store by vector, and with BM25 for the `lexical` query if
+        given, holding its lock.
+
+        :return: The vector and the lexical results.
+        """
+        with self._persist_lock(fcntl.LOCK_SH):
+            self._refresh_persisted(locked=True)
+            vector_results = self.vector_store.similarity_search_by_vector(
+                embedding, k=k, filter=self._translate_filter(filter)
+            )
+            if lexical is None:
+                return vector_results, []
+            return vector_results, self._bm25_search(lexical, k, filter)
+
+    def _translate_filter(self, filter: Optional[dict]) -> Optional[dict]:
+        """
+        Translate PGEmbedding style {"key": {"in": [...]}} filters to the list form
+        understood by the other vector stores, such as FAISS.
+        """
+        if filter is None:
+            return None
+        return {
+            key: value["in"] if isinstance(value, dict) and "in" in value else value
+            for key, value in filter.items()
+        }
+
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        hybrid: Optional[bool] = None,
+        mmr: Optional[bool] = None,
+        fetch_k: Optional[int] = None,
+        lambda_mult: Optional[float] = None,
+    ):
+        """
+        Perform similarity search without blocking the event loop. Returns the same
+        results as similarity_search.
+
+        PGEmbedding is searched through the async connection pool instead of its
+        blocking SQLAlchemy session, other vector stores use their async API.
+        `ef_search` tunes the HNSW search of PGVectorStore for this query, and
+        `hybrid`, `mmr`, `fetch_k` and `lambda_mult` override the store's settings.
+
+        The MMR candidates' vectors are selected with them from PGVectorStore. For
+        PGEmbedding, they are looked up by chunk hash, within the user's chunks when
+        the filter is on a single user_id. Candidates whose vector isn't found, such
+        as chunks loaded without a hash, are left out rather than embedded again, and
+        without any vector the candidates are ranked by similarity alone.
+        """
+        if self.persist_directory is not None:
+            await asyncio.to_thread(self._refresh_persisted)
+        if not (self.mmr if mmr is None else mmr):
+            return await self._asearch(
+                query, k=k, filter=filter, ef_search=ef_search, hybrid=hybrid
+            )
+
+        with_embeddings = isinstance(self.vector_store, PGVectorStore)
+        candidates = await self._asearch(
+            query,
+            k=max(k, fetch_k or self.fetch_k or 4 * k),
+            filter=filter,
+            ef_search=ef_search,
+            hybrid=hybrid,
+            with_embeddings=with_embeddings,
+        )
+        if with_embeddings:
+            embeddings = [list(embedding) for _, _, embedding in candidates]
+            candidates = [(doc, score) for doc, score, _ in candidates]
+        documents = [self._result_document(result) for result in candidates]
+        if isinstance(self.vector_store, FAISS):
+            embeddings = await asyncio.to_thread(self._faiss_embeddings, documents)
+        elif not with_embeddings:
+            embeddings = [None] * len(documents)
+        if isinstance(self.vector_store, PGEmbedding):
+            user_id = (filter or {}).get("user_id")
+            found = await self._alookup_chunks(
+                {
+                    doc.metadata["chunk_hash"]
+                    for doc in documents
+                    if "chunk_hash" in doc.metadata
+                },
+                user_id=user_id if isinstance(user_id, str) else None,
+            )
+            embeddings = [
+                (
+                    found[doc.metadata["chunk_hash"]][0]
+                    if doc.metadata.get("chunk_hash") in found
+                    else None
+                )
+                for doc in documents
+            ]
+        if all(embedding is None for embedding in embeddings):
+            return candidates[:k]
+        query_embedding = await self._document_embeddings().aembed_query(query)
+        return self._select_mmr(query_embedding, candidates, embeddings, k, lambda_mult)
+
+    async def _asearch(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict] = None,
+        ef_search: Optional[int] = None,
+        hybrid: Optional[bool] = None,
+        with_embeddings: bool = False,
+    ):
+        """
+        Search the vector store without blocking, fusing lexical results in hybrid
+        mode. PGVectorStore results carry their embedding with `with_embeddings`.
+        """
+        hybrid = self.hybrid if hybrid is None else hybrid
+        if hybrid and isinstance(self.vector_store, PGVectorStore):
+            candidates = self._hybrid_candidates(k)
+            vector_results, lexical_results = await asyncio.gather(
+                self.vector_store.asimilarity_search(
+                    query,
+                    k=candidates,
+                    filter=filter,
+                    ef_search=ef_search,
+                    with_embeddings=with_embeddings,
+                ),
+                self.vector_store.alexical_search(
+                    query,
+                    k=candidates,
+                    filter=filter,
+                    with_embeddings=with_embeddings,
+                ),
+            )
+            return self._fuse(vector_results, lexical_results, k)
+        if hybrid and isinstance(self.vector_store, FAISS):
+            candidates = self._hybrid_candidates(k)
+            embedding = await self.vector_store.embeddings.aembed_query(query)
+            vector_results, lexical_results = await asyncio.to_thread(
+                self._faiss_search, embedding, candidates, filter, query
+            )
+            return self._fuse(vector_results, lexical_results, k)
+        if isinstance(self.vector_store, FAISS):
+            embedding = await self.vector_store.embeddings.aembed_query(query)
+            results, _ = await asyncio.to_thread(
+                self._faiss_search, embedding, k, filter
+            )
+            return results
+        if isinstance(self.vector_store, PGVectorStore):
+            return await self.vector_store.asimilarity_search(
+                query,
+                k=k,
+                filter=filter,
+                ef_search=ef_search,
+                with_embeddings=with_embeddings,
+            )
+        if isinstance(self.vector_store, PGEmbedding):
+            embedding = await self.vector_store.embeddings.aembed_query(query)
+            return await self._apg_embedding_search(embedding, k=k, filter=filter)
+        return await self.vector_store.asimilarity_search(
+            query=query, k=k, filter=self._translate_filter(filter)
+        )
+
+    def _result_document(self, result) -> Document:
+        return result[0] if isinstance(result, tuple) else result
+
+    def _faiss_embeddings(self, documents: List[Document]) -> list:
+        """
+        Reconstruct the vectors of documents from the FAISS index, None for the
+        documents it doesn't hold.
+        """
+        if not isinstance(self.vector_store, FAISS):
+            return [None] * len(documents)
+        with self._persist_lock(fcntl.LOCK_SH):
+            positions = {
+                doc_id: position
+                for position, doc_id in self.vector_store.index_to_docstore_id.items()
+            }
+            return [
+                (
+                    self.vector_store.index.reconstruct(positions[doc.id]).tolist()
+                    if doc.id in positions
+                    else None
+                )
+                for doc in documents
+            ]
+
+    def _select_mmr(
+        self,
+        query_embedding: List[float],
+        candidates: list,
+        embeddings: List[List[float]],
+        k: int,
+        lambda_mult: Optional[float] = None,
+    ) -> list:
+        """
+        Select k of the candidate results by maximal marginal relevance, leaving out
+        the candidates without an embedding.
+        """
+        kept = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+        selected = maximal_marginal_relevance(
+            query_embedding,
+            [embeddings[i] for i in kept],
+            k=k,
+            lambda_mult=self.lambda_mult if lambda_mult is None else lambda_mult,
+        )
+        return [candidates[kept[index]] for index in selected]
+
+    def _hybrid_candidates(self, k: int) -> int:
+        """
+        Number of results fetched from each retriever before fusing them.
+        """
+        return max(4 * k, 20)
+
+    def _fuse(self, vector_results: list, lexical_results: list, k: int) -> list:
+        """
+        Fuse vector and lexical results by reciprocal rank. Results are documents or
+        (document, score) tuples, like the vector results, with the fused score and
+        any other values of the results, such as their embedding.
+        """
+        documents = {}
+        extras = {}
+        rankings = []
+        for results in (vector_results, lexical_results):
+            ranking = []
+            for result in results:
+                doc = result[0] if isinstance(result, tuple) else result
+                key = (doc.page_content, doc.metadata.get("source"))
+                documents.setdefault(key, doc)
+                extras.setdefault(key, result[2:] if isinstance(result, tuple) else ())
+                ranking.append(key)
+            rankings.append(ranking)
+
+        fused = reciprocal_rank_fusion(rankings, k=self.rrf_k)[:k]
+        if vector_results and not isinstance(vector_results[0], tuple):
+            return [documents[key] for key, _ in fused]
+        return [(documents[key], score, *extras[key]) for key, score in fused]
+
+    def _bm25_search(
+        self, query: str, k: int, filter: Optional[dict] = None
+    ) -> List[Document]:
+        """
+        Search the FAISS docstore lexically with BM25, indexing documents appended
+        since the last search.
+        """
+        if self._bm25_store is not self.vector_store:
+            self._bm25 = BM25Index()
+            self._bm25_store = self.vector_store
+        ids = self.vector_store.index_to_docstore_id
+        for position in range(len(self._bm25), len(ids)):
+            doc = self.vector_store.docstore.search(ids[position])
+            self._bm25.add(ids[position], doc.page_content)
+
+        filter = self._translate_filter(filter) or {}
+        results = []
+        for doc_id, _ in self._bm25.search(query):
+            doc = self.vector_store.docstore.search(doc_id)
+            if self._matches(doc, filter):
+                results.append(doc)
+                if len(results) == k:
+                    break
+        return results
+
+    async def _apg_embedding_search(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Search the PGEmbedding tables by vector, supporting the same metadata filters
+        as PGEmbedding: {"key": {"in": [...]}}, {"key": {"substring": "..."}} and
+        {"key": value}, and {"key": {"ne": value}}.
+        """
+        where, params = self._apg_embedding_where(filter)
+        query = sql.SQL(
+            """
+            SELECT e.document, e.cmetadata, abs(e.embedding <-> %s::real[]) AS distance
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE {where}
+            ORDER BY distance
+            LIMIT %s;
+            """
+        ).format(where=where)
+
+        async with self.async_connection() as connection:
+            async with connection.transaction():
+                # Same as PGEmbedding, favour the HNSW index over a sequential scan
+                await connection.execute("SET LOCAL enable_seqscan = off")
+                cursor = await connection.execute(query, [embedding, *params, k])
+                rows = await cursor.fetchall()
+
+        return [
+            (Document(page_content=document, metadata=metadata), distance)
+            for document, metadata, distance in rows
+        ]
+
+    def _apg_embedding_where(
+        self, filter: Optional[dict]
+    ) -> Tuple[sql.Composable, list]:
+        """
+        Build the WHERE clause of a metadata filter on the PGEmbedding collection,
+        joined as `e` and `c`.
+        """
+        clauses = [sql.SQL("c.name = %s")]
+        params = [self.vector_store.collection_name]
+        for key, value in (filter or {}).items():
+            if isinstance(value, dict):
+                value = {op.lower(): operand for op, operand in value.items()}
+            if isinstance(value, dict) and "in" in value:
+                clauses.append(sql.SQL("e.cmetadata->>%s = ANY(%s)"))
+                params.extend([key, [str(item) for item in value["in"]]])
+            elif isinstance(value, dict) and "substring" in value:
+                clauses.append(sql.SQL("e.cmetadata->>%s ILIKE %s"))
+                params.extend([key, f"%{value['substring']}%"])
+            elif isinstance(value, dict) and "ne" in value:
+                clauses.append(sql.SQL("e.cmetadata->>%s IS DISTINCT FROM %s"))
+                params.extend([key, str(value["ne"])])
+            else:
+                clauses.append(sql.SQL("e.cmetadata->>%s = %s"))
+                params.extend([key, str(value)])
+        return sql.SQL(" AND ").join(clauses), params
@@ -6,8 +6,11 @@ import logging
 import os
 from contextlib import asynccontextmanager
 
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 from psycopg_pool import AsyncConnectionPool
 
+from researcher.metrics import register_collector
+
 # Set up a simple logger for console output during development
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -88,3 +91,45 @@ async def get_db_connection():
     """
     async with connection_pool.connection() as connection:
         yield connection
+
+
+# Pool statistics describing its current state; the other statistics are counted
+# since the pool was opened
+POOL_MEASURES = {
+    "pool_min",
+    "pool_max",
+    "pool_size",
+    "pool_available",
+    "requests_waiting",
+}
+
+
+# Expose the connection pool statistics as metrics
+def collect_pool_metrics():
+    """
+    Collect the statistics of the connection pool, if it is initialized.
+
+    Returns:
+        A list with a gauge holding one sample per statistic of the current state of
+        the pool, and a counter holding one sample per cumulative statistic, such as
+        the number of requests or of connections opened.
+    """
+    if connection_pool is None:
+        return []
+    gauge = GaugeMetricFamily(
+        "researcher_db_pool", "Database connection pool statistics.", labels=["stat"]
+    )
+    counter = CounterMetricFamily(
+        "researcher_db_pool_events",
+        "Database connection pool statistics counted since the pool was opened.",
+        labels=["stat"],
+    )
+    for stat, value in connection_pool.get_stats().items():
+        if stat in POOL_MEASURES:
+            gauge.add_metric([stat], value)
+        else:
+            counter.add_metric([stat], value)
+    return [gauge, counter]
+
+
+register_collector(collect_pool_metrics)
@@ -0,0 +1,154 @@
+import asyncio
+import gc
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from api.utils.admission import AdmissionController, AdmittedStream
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_limits_concurrency(self):
+        controller = AdmissionController(
+            "test", max_concurrency=2, max_queue=10, queue_timeout=5
+        )
+        running, peak = 0, 0
+
+        async def request():
+            nonlocal running, peak
+            async with controller.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        async def main():
+            await asyncio.gather(*(request() for _ in range(6)))
+
+        asyncio.run(main())
+        self.assertEqual(peak, 2)
+        self.assertEqual(controller.queued, 0)
+
+    def test_rejects_when_queue_full(self):
+        controller = AdmissionController(
+            "test", max_concurrency=1, max_queue=1, queue_timeout=5
+        )
+
+        async def main():
+            held = await controller.acquire()
+            waiting = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0)
+            with self.assertRaises(HTTPException) as context:
+                await controller.acquire()
+            controller.release(held)
+            controller.release(await waiting)
+            return context.exception
+
+        error = asyncio.run(main())
+        self.assertEqual(error.status_code, 429)
+        self.assertGreaterEqual(int(error.headers["Retry-After"]), 1)
+
+    def test_rejects_after_queue_timeout(self):
+        controller = AdmissionController(
+            "test", max_concurrency=1, max_queue=1, queue_timeout=0.01
+        )
+
+        async def main():
+            held = await controller.acquire()
+            with self.assertRaises(HTTPException) as context:
+                await controller.acquire()
+            controller.release(held)
+            # The slot is free again once released
+            controller.release(await controller.acquire())
+            return context.exception
+
+        error = asyncio.run(main())
+        self.assertEqual(error.status_code, 503)
+        self.assertIn("Retry-After", error.headers)
+        self.assertEqual(controller.queued, 0)
+
+    def test_slot_taken_as_the_wait_times_out_is_released(self):
+        controller = AdmissionController(
+            "test", max_concurrency=1, max_queue=1, queue_timeout=5
+        )
+
+        async def late_wait(tasks, timeout):
+            # The acquire completes, but the wait reports a timeout
+            await asyncio.sleep(0)
+            return set(), tasks
+
+        async def main():
+            with mock.patch("api.utils.admission.asyncio.wait", late_wait):
+                with self.assertRaises(HTTPException) as context:
+                    await controller.acquire()
+            await asyncio.sleep(0)
+            return context.exception
+
+        self.assertEqual(asyncio.run(main()).status_code, 503)
+        self.assertEqual(controller.semaphore._value, 1)
+
+    def test_cancelled_wait_leaves_no_slot_taken(self):
+        controller = AdmissionController(
+            "test", max_concurrency=1, max_queue=1, queue_timeout=5
+        )
+
+        async def main():
+            held = await controller.acquire()
+            waiting = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            controller.release(held)
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            await asyncio.sleep(0)
+
+        asyncio.run(main())
+        self.assertEqual(controller.semaphore._value, 1)
+        self.assertEqual(controller.queued, 0)
+
+
+class TestAdmittedStream(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = AdmissionController(
+            "test", max_concurrency=1, max_queue=1, queue_timeout=5
+        )
+
+    async def events(self):
+        yield "first"
+        yield "second"
+
+    def test_slot_is_released_when_stream_ends(self):
+        async def main():
+            body = AdmittedStream(
+                self.controller, await self.controller.acquire(), self.events()
+            )
+            self.assertTrue(self.controller.semaphore.locked())
+            events = [event async for event in body]
+            await body.aclose()
+            return events
+
+        self.assertEqual(asyncio.run(main()), ["first", "second"])
+        self.assertFalse(self.controller.semaphore.locked())
+        self.assertEqual(self.controller.semaphore._value, 1)
+
+    def test_slot_is_released_when_response_is_dropped(self):
+        async def main():
+            body = AdmittedStream(
+                self.controller, await self.controller.acquire(), self.events()
+            )
+            response = StreamingResponse(body)
+            self.assertTrue(self.controller.semaphore.locked())
+            # The response is never sent, so its body is never iterated
+            del response, body
+            gc.collect()
+
+        asyncio.run(main())
+        self.assertEqual(self.controller.semaphore._value, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+
+import numpy as np
+
+from benchmarks import quantization_benchmark
+from benchmarks.graph_benchmark import parse_args, percentile, run_benchmark
+
+
+class TestGraphBenchmark(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+
+    def test_run_benchmark(self):
+        args = parse_args(
+            [
+                "--requests=8",
+                "--concurrency=4",
+                "--warmup=0",
+                "--llm-latency=0",
+                "--search-latency=0",
+                "--embedding-latency=0",
+                "--embedding-size=8",
+                "--files=2",
+                "--max-iterations=3",
+            ]
+        )
+        results = asyncio.run(run_benchmark(args))
+        self.assertEqual(results["requests"], 8)
+        self.assertGreater(results["requests_per_s"], 0)
+        self.assertLessEqual(results["p50_ms"], results["p99_ms"])
+        self.assertGreaterEqual(results["mean_iterations"], 1)
+        self.assertLessEqual(results["mean_iterations"], 3)
+
+    def test_run_benchmark_self_assessment(self):
+        args = parse_args(
+            [
+                "--requests=4",
+                "--warmup=0",
+                "--llm-latency=0",
+                "--search-latency=0",
+                "--embedding-latency=0",
+                "--embedding-size=8",
+                "--files=1",
+                "--self-assessment",
+            ]
+        )
+        results = asyncio.run(run_benchmark(args))
+        self.assertEqual(results["requests"], 4)
+
+
+class TestQuantizationBenchmark(unittest.TestCase):
+
+    def test_run_benchmark(self):
+        args = quantization_benchmark.parse_args(
+            [
+                "--vectors=300",
+                "--dimensions=32",
+                "--queries=10",
+                "--k=5",
+                "--batch-size=16",
+                "--training-size=100",
+            ]
+        )
+        report = asyncio.run(quantization_benchmark.run_benchmark(args))
+        self.assertEqual(set(report), {"faiss/float32", "faiss/float16", "faiss/int8"})
+        self.assertEqual(report["faiss/float32"]["recall@5"], 1.0)
+        self.assertGreater(report["faiss/int8"]["recall@5"], 0.5)
+        self.assertEqual(report["faiss/float16"]["bytes_per_vector"], 64)
+        self.assertEqual(report["faiss/int8"]["bytes_per_vector"], 32)
+
+    def test_recall(self):
+        truth = quantization_benchmark.exact_neighbours(np.eye(3), np.eye(3), 1)
+        self.assertEqual(quantization_benchmark.recall([[0], [1], [0]], truth), 2 / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
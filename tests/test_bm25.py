@@ -0,0 +1,73 @@
+import unittest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from researcher.store import Store
+from researcher.store.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add("a", "Revenue of AAPL grew in 2023.")
+        self.index.add("b", "Part number XK-2231 ships in March.")
+        self.index.add("c", "Revenue and revenue guidance for the year.")
+
+    def test_tokenize_keeps_identifiers(self):
+        self.assertEqual(tokenize("Part XK2231, AAPL!"), ["part", "xk2231", "aapl"])
+
+    def test_exact_identifier_ranks_first(self):
+        results = self.index.search("Which part is XK-2231?")
+        self.assertEqual(results[0][0], "b")
+
+    def test_term_frequency_and_limit(self):
+        results = self.index.search("revenue", k=1)
+        self.assertEqual(results, [("c", results[0][1])])
+        self.assertEqual(self.index.search("unknown"), [])
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+
+    def test_items_in_both_rankings_rank_first(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+        self.assertEqual([item for item, _ in fused], ["c", "a", "b", "d"])
+        self.assertAlmostEqual(fused[0][1], 1 / 63 + 1 / 61)
+
+
+class TestHybridStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store(embeddings=DeterministicFakeEmbedding(size=8), hybrid=True)
+        self.store.load(
+            [
+                {"raw_content": f"Filler paragraph number {i}.", "url": f"doc{i % 2}"}
+                for i in range(10)
+            ]
+            + [{"raw_content": "The order used part XK-2231.", "url": "doc1"}]
+        )
+
+    def test_hybrid_finds_exact_identifier(self):
+        results = self.store.similarity_search("XK-2231", k=2)
+        self.assertEqual(results[0].page_content, "The order used part XK-2231.")
+
+    def test_hybrid_respects_filter(self):
+        results = self.store.similarity_search(
+            "XK-2231", k=3, filter={"source": {"in": ["doc0"]}}
+        )
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(doc.metadata["source"] == "doc0" for doc in results))
+
+    def test_bm25_indexes_appended_documents(self):
+        self.store.similarity_search("XK-2231", k=1)
+        self.store.load([{"raw_content": "Ticker MSFT closed higher.", "url": "doc2"}])
+        results = self.store.similarity_search("MSFT", k=1)
+        self.assertEqual(results[0].page_content, "Ticker MSFT closed higher.")
+
+    def test_hybrid_can_be_disabled_per_search(self):
+        results = self.store.similarity_search("XK-2231", k=2, hybrid=False)
+        self.assertEqual(len(results), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
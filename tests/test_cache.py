@@ -0,0 +1,140 @@
+import asyncio
+import os
+import unittest
+from contextlib import asynccontextmanager
+from unittest import mock
+
+import psycopg
+from dotenv import load_dotenv
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from researcher.cache import LRUCache, PostgresCache, TieredCache, hash_key
+from researcher.embeddings import CachedEmbeddings
+from researcher.utils.database import get_db_connection_str
+
+load_dotenv()
+
+
+@asynccontextmanager
+async def connect():
+    async with await psycopg.AsyncConnection.connect(get_db_connection_str()) as conn:
+        yield conn
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_and_set_count_hits_and_misses(self):
+        cache = LRUCache(max_size=2)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(ttl=10)
+        with mock.patch("researcher.cache.cache.time.monotonic", return_value=0):
+            cache.set("a", 1)
+        with mock.patch("researcher.cache.cache.time.monotonic", return_value=11):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestTieredCache(unittest.TestCase):
+
+    def test_lower_tier_hits_are_written_back(self):
+        upper, lower = LRUCache(), LRUCache()
+        lower.set("a", 1)
+        cache = TieredCache(upper, lower)
+        self.assertEqual(asyncio.run(cache.aget("a")), 1)
+        self.assertEqual(upper.get("a"), 1)
+
+    def test_hash_key_is_stable(self):
+        self.assertEqual(
+            hash_key({"model": "m", "t": 0}, "prompt"),
+            hash_key({"t": 0, "model": "m"}, "prompt"),
+        )
+        self.assertNotEqual(hash_key("a"), hash_key("b"))
+
+
+@unittest.skipUnless(os.getenv("DB_HOST"), "requires a Postgres database")
+class TestPostgresCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = PostgresCache("test_cache", ttl=60, async_connection=connect)
+
+        async def create_table():
+            async with connect() as conn:
+                await conn.execute("DROP TABLE IF EXISTS test_cache")
+            await self.cache.acreate_table()
+
+        asyncio.run(create_table())
+
+    def test_purge_deletes_expired_entries_only(self):
+        async def main():
+            await self.cache.aset("old", {"value": 1})
+            await self.cache.aset("new", {"value": 2})
+            async with connect() as conn:
+                await conn.execute(
+                    "UPDATE test_cache SET created_at = NOW() - interval '2 minutes' "
+                    "WHERE key = 'old'"
+                )
+            purged = await self.cache.apurge()
+            return purged, await self.cache.aget("old"), await self.cache.aget("new")
+
+        self.assertEqual(asyncio.run(main()), (1, None, {"value": 2}))
+
+    def test_entries_without_ttl_are_kept(self):
+        cache = PostgresCache("test_cache", async_connection=connect)
+        self.assertEqual(asyncio.run(cache.apurge()), 0)
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.underlying = CountingEmbeddings(size=8)
+        self.persistent = LRUCache()
+        self.embeddings = CachedEmbeddings(
+            self.underlying, "fake-model", persistent_cache=self.persistent
+        )
+
+    def test_query_embeddings_are_cached(self):
+        first = self.embeddings.embed_query("query")
+        second = asyncio.run(self.embeddings.aembed_query("query"))
+        self.assertEqual(first, second)
+        self.assertEqual(self.underlying.calls, 1)
+
+    def test_async_queries_use_persistent_cache(self):
+        asyncio.run(self.embeddings.aembed_query("query"))
+        other_worker = CachedEmbeddings(
+            self.underlying, "fake-model", persistent_cache=self.persistent
+        )
+        asyncio.run(other_worker.aembed_query("query"))
+        self.assertEqual(self.underlying.calls, 1)
+        self.assertEqual(self.persistent.hits, 1)
+
+    def test_cache_key_includes_model(self):
+        self.embeddings.embed_query("query")
+        CachedEmbeddings(self.underlying, "other-model").embed_query("query")
+        self.assertEqual(self.underlying.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import tiktoken
+from langchain.docstore.document import Document
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from researcher.document.chunker import Chunker
+from researcher.store import Store
+
+
+def byte_encoding() -> tiktoken.Encoding:
+    """
+    Encoding with one token per byte, available without downloading BPE ranks.
+    """
+    return tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+
+class TestChunker(unittest.TestCase):
+
+    def setUp(self):
+        self.text = (
+            "First paragraph with a few words.\n\n"
+            "Second paragraph, a little longer than the first one. It has two sentences.\n\n"
+            "Third."
+        )
+
+    def test_offsets_match_chunks(self):
+        chunker = Chunker(chunk_size=40, chunk_overlap=10)
+        document = Document(page_content=self.text, metadata={"source": "a", "page": 2})
+        chunks = list(chunker.split_documents([document]))
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            start, end = chunk.metadata["start_index"], chunk.metadata["end_index"]
+            self.assertEqual(self.text[start:end], chunk.page_content)
+            self.assertLessEqual(len(chunk.page_content), 40)
+            self.assertEqual(chunk.metadata["page"], 2)
+        self.assertTrue(chunks[-1].page_content.endswith("Third."))
+
+    def test_prefers_paragraph_boundaries(self):
+        chunker = Chunker(chunk_size=60, chunk_overlap=0)
+        first = next(chunker.split_documents([Document(page_content=self.text)]))
+        self.assertEqual(first.page_content, "First paragraph with a few words.")
+
+    def test_consecutive_chunks_overlap_on_words(self):
+        text = " ".join(f"word{i}" for i in range(100))
+        spans = list(Chunker(chunk_size=50, chunk_overlap=20).spans(text))
+        for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+            self.assertLess(start, previous_end)
+            self.assertEqual(text[start - 1], " ")
+        self.assertEqual(spans[-1][1], len(text))
+
+    def test_split_is_lazy(self):
+        def documents():
+            yield Document(page_content=self.text)
+            raise AssertionError("second document read before it was needed")
+
+        chunks = Chunker(chunk_size=40, chunk_overlap=10).split_documents(documents())
+        self.assertTrue(next(chunks).page_content)
+
+    def test_token_lengths(self):
+        chunker = Chunker(chunk_size=16, chunk_overlap=4, encoding=byte_encoding())
+        text = "Ünïcödé text is measured in tokens, not characters."
+        for start, end in chunker.spans(text):
+            self.assertLessEqual(len(text[start:end].encode()), 16)
+
+    def test_overlap_must_be_smaller_than_size(self):
+        with self.assertRaises(ValueError):
+            Chunker(chunk_size=10, chunk_overlap=10)
+
+
+class TestStoreChunks(unittest.TestCase):
+
+    def test_chunks_keep_page_and_offsets(self):
+        text = "A sentence about revenue. " * 10
+        store = Store(
+            embeddings=DeterministicFakeEmbedding(size=8),
+            chunker=Chunker(chunk_size=60, chunk_overlap=20),
+        )
+        store.load([{"raw_content": text, "url": "report", "page": 3}])
+        chunks = list(store.vector_store.docstore._dict.values())
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertEqual(chunk.metadata["page"], 3)
+            start, end = chunk.metadata["start_index"], chunk.metadata["end_index"]
+            self.assertEqual(text[start:end], chunk.page_content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import asyncio
+import unittest
+
+from api.utils.compaction import compact_periodically
+
+
+class FlakyStore:
+    """Fails the first compaction, recording every call."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def acompact(self, dead_ratio: float):
+        self.calls.append(dead_ratio)
+        if len(self.calls) == 1:
+            raise RuntimeError("lock timeout")
+        return ["document_chunks"]
+
+
+class TestCompactPeriodically(unittest.TestCase):
+
+    def test_compacts_until_cancelled_despite_failures(self):
+        store = FlakyStore()
+
+        async def main():
+            task = asyncio.create_task(compact_periodically(store, 0.01, 0.2))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with self.assertLogs("api.utils.compaction", level="ERROR"):
+            asyncio.run(main())
+        self.assertGreater(len(store.calls), 2)
+        self.assertEqual(set(store.calls), {0.2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from researcher.document.document import DocumentLoader
+from researcher.document.parser import ParserPool
+
+
+class TestParserPool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "notes.txt")
+        with open(self.path, "w") as file:
+            file.write("Quarterly revenue grew by 12%.")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, path, parser):
+        return asyncio.run(DocumentLoader(path, "s3://bucket/notes.txt", parser).load())
+
+    def test_parsed_in_child_process(self):
+        documents = self.load(self.path, ParserPool(max_workers=2))
+        self.assertEqual(
+            documents,
+            [
+                {
+                    "raw_content": "Quarterly revenue grew by 12%.",
+                    "url": "s3://bucket/notes.txt",
+                    "page": 0,
+                }
+            ],
+        )
+
+    def test_parsed_in_thread_without_pool(self):
+        self.assertEqual(self.load(self.path, None), self.load(self.path, ParserPool()))
+
+    def test_unsupported_extension(self):
+        with self.assertRaises(ValueError):
+            self.load(os.path.join(self.directory.name, "notes.exe"), ParserPool())
+
+    def test_slow_parse_is_killed(self):
+        # Opening a FIFO blocks until a writer shows up, which never happens
+        fifo = os.path.join(self.directory.name, "stuck.txt")
+        os.mkfifo(fifo)
+        with self.assertRaisesRegex(ValueError, "took over 0.5 seconds"):
+            self.load(fifo, ParserPool(timeout=0.5))
+
+    def test_memory_limit(self):
+        parser = ParserPool(memory_limit=300 * 2**20)
+        self.assertEqual(len(self.load(self.path, parser)), 1)
+        with open(self.path, "w") as file:
+            file.write("word " * 10_000_000)
+        with self.assertRaisesRegex(MemoryError, "exceeded the memory limit"):
+            asyncio.run(parser.aparse(self.path, "txt"))
+        with self.assertRaises(ValueError):
+            self.load(self.path, parser)
+
+    def test_loader_error_is_raised_once(self):
+        missing = os.path.join(self.directory.name, "missing.txt")
+        with self.assertRaises(RuntimeError) as raised:
+            asyncio.run(ParserPool().aparse(missing, "txt"))
+        self.assertEqual(str(raised.exception), f"Error loading {missing}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import unittest
+from contextlib import asynccontextmanager
+
+import psycopg
+from dotenv import load_dotenv
+
+from api.utils.ingestion import IngestionQueue, IngestionWorkers
+from researcher.utils.database import get_db_connection_str
+
+load_dotenv()
+
+
+@asynccontextmanager
+async def connect():
+    async with await psycopg.AsyncConnection.connect(get_db_connection_str()) as conn:
+        yield conn
+
+
+class FakeQueue:
+    """In-memory queue recording the updates of its jobs."""
+
+    lease = 300
+
+    def __init__(self, jobs):
+        self.jobs = {job["id"]: {**job, "status": "queued"} for job in jobs}
+        self.updates = []
+
+    async def aenqueue(
+        self, user_id, file_name, s3_location, spool_path=None, sha256=None
+    ):
+        job_id = str(len(self.jobs))
+        self.jobs[job_id] = {
+            "id": job_id,
+            "user_id": user_id,
+            "file_name": file_name,
+            "s3_location": s3_location,
+            "spool_path": spool_path,
+            "sha256": sha256,
+            "attempts": 0,
+            "status": "queued",
+        }
+        return job_id
+
+    async def aclaim(self):
+        for job in self.jobs.values():
+            if job["status"] == "queued":
+                job["status"] = "running"
+                job["attempts"] += 1
+                return dict(job)
+        return None
+
+    async def aupdate(self, job_id, attempt, stage, progress=None, chunks=None):
+        self.updates.append((job_id, stage, progress))
+        return True
+
+    async def acomplete(self, job_id, attempt):
+        self.jobs[job_id]["status"] = "succeeded"
+
+    async def afail(self, job_id, attempt, error, retry):
+        self.jobs[job_id]["status"] = "queued" if retry else "failed"
+        self.jobs[job_id]["error"] = error
+
+
+class TestIngestionWorkers(unittest.TestCase):
+
+    def run_workers(self, queue, handler, **kwargs):
+        async def main():
+            workers = IngestionWorkers(queue, handler, poll_interval=0.01, **kwargs)
+            workers.start()
+            await asyncio.sleep(0.2)
+            await workers.stop()
+
+        asyncio.run(main())
+
+    def test_jobs_report_progress_and_succeed(self):
+        queue = FakeQueue(
+            [{"id": str(i), "attempts": 0, "s3_location": f"doc{i}"} for i in range(3)]
+        )
+        processed = []
+
+        async def handler(job, report):
+            await report("embedding", 0.5)
+            processed.append(job["s3_location"])
+
+        self.run_workers(queue, handler, workers=2)
+        self.assertEqual(sorted(processed), ["doc0", "doc1", "doc2"])
+        self.assertEqual({job["status"] for job in queue.jobs.values()}, {"succeeded"})
+        self.assertIn(("1", "embedding", 0.5), queue.updates)
+
+    def test_failed_job_is_retried_then_given_up(self):
+        queue = FakeQueue([{"id": "0", "attempts": 0, "s3_location": "doc"}])
+        attempts = []
+
+        async def handler(job, report):
+            attempts.append(job["attempts"])
+            raise ValueError("Unsupported file type")
+
+        with self.assertLogs("api.utils.ingestion", level="ERROR"):
+            self.run_workers(queue, handler, max_attempts=2)
+        self.assertEqual(attempts, [1, 2])
+        self.assertEqual(queue.jobs["0"]["status"], "failed")
+        self.assertEqual(queue.jobs["0"]["error"], "Unsupported file type")
+
+    def test_submitted_job_wakes_idle_worker(self):
+        queue = FakeQueue([])
+
+        async def main():
+            done = asyncio.Event()
+
+            async def handler(job, report):
+                done.set()
+
+            workers = IngestionWorkers(queue, handler, poll_interval=60)
+            workers.start()
+            await asyncio.sleep(0.01)
+            await workers.asubmit("alice", "notes.txt", "s3://bucket/notes.txt")
+            await asyncio.wait_for(done.wait(), 1)
+            await workers.stop()
+
+        asyncio.run(main())
+        self.assertEqual(queue.jobs["0"]["status"], "succeeded")
+
+
+@unittest.skipUnless(os.getenv("DB_HOST"), "requires a Postgres database")
+class TestIngestionQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = IngestionQueue(
+            "test_ingestion_jobs", lease=60, async_connection=connect
+        )
+
+        async def create_table():
+            async with connect() as conn:
+                await conn.execute("DROP TABLE IF EXISTS test_ingestion_jobs")
+            await self.queue.acreate_table()
+
+        asyncio.run(create_table())
+
+    def test_jobs_are_claimed_once_in_order(self):
+        async def main():
+            first = await self.queue.aenqueue("alice", "a.txt", "s3://bucket/a.txt")
+            second = await self.queue.aenqueue("bob", "b.txt", "s3://bucket/b.txt")
+            claims = await asyncio.gather(*(self.queue.aclaim() for _ in range(3)))
+            return first, second, claims
+
+        first, second, claims = asyncio.run(main())
+        claimed = [claim["id"] for claim in claims if claim is not None]
+        self.assertEqual(sorted(claimed), sorted([first, second]))
+
+    def test_status_reports_progress_to_owner_only(self):
+        async def main():
+            job_id = await self.queue.aenqueue("alice", "a.txt", "s3://bucket/a.txt")
+            job = await self.queue.aclaim()
+            await self.queue.aupdate(
+                job_id, job["attempts"], "embedding", 0.25, chunks=40
+            )
+            return (
+                job_id,
+                await self.queue.aget(job_id, "alice"),
+                await self.queue.aget(job_id, "bob"),
+            )
+
+        job_id, job, other = asyncio.run(main())
+        self.assertEqual(job["job_id"], job_id)
+        self.assertEqual(
+            (job["status"], job["stage"], job["progress"], job["chunks"]),
+            ("running", "embedding", 0.25, 40),
+        )
+        self.assertIsNone(other)
+
+    def test_expired_lease_is_reclaimed(self):
+        async def main():
+            job_id = await self.queue.aenqueue("alice", "a.txt", "s3://bucket/a.txt")
+            first = await self.queue.aclaim()
+            self.assertIsNone(await self.queue.aclaim())
+            async with connect() as conn:
+                await conn.execute(
+                    "UPDATE test_ingestion_jobs "
+                    "SET updated_at = NOW() - interval '2 minutes'"
+                )
+            second = await self.queue.aclaim()
+            # The first attempt can no longer update the job
+            updated = await self.queue.aupdate(job_id, first["attempts"], "parsing")
+            await self.queue.acomplete(job_id, second["attempts"])
+            return second, updated, await self.queue.aget(job_id, "alice")
+
+        second, updated, job = asyncio.run(main())
+        self.assertEqual(second["attempts"], 2)
+        self.assertFalse(updated)
+        self.assertEqual((job["status"], job["progress"]), ("succeeded", 1))
+
+    def test_failed_job_is_queued_again(self):
+        async def main():
+            job_id = await self.queue.aenqueue("alice", "a.txt", "s3://bucket/a.txt")
+            job = await self.queue.aclaim()
+            await self.queue.afail(job_id, job["attempts"], "timeout", retry=True)
+            return await self.queue.aget(job_id, "alice"), await self.queue.aclaim()
+
+        job, claimed = asyncio.run(main())
+        self.assertEqual((job["status"], job["error"]), ("queued", "timeout"))
+        self.assertEqual(claimed["attempts"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+
+from prometheus_client import CollectorRegistry, generate_latest
+
+from researcher.cache import LRUCache
+from researcher.metrics import register_cache_metrics, register_collector
+from researcher.utils import database
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = CollectorRegistry()
+
+    def render(self) -> str:
+        return generate_latest(self.registry).decode()
+
+    def test_cache_metrics_are_collected_on_render(self):
+        cache = LRUCache()
+        register_cache_metrics({"search": cache}, registry=self.registry)
+        cache.get("missing")
+        output = self.render()
+        self.assertIn("# TYPE researcher_cache_misses_total counter", output)
+        self.assertIn('researcher_cache_misses_total{cache="search"} 1.0', output)
+        cache.get("missing")
+        self.assertIn(
+            'researcher_cache_misses_total{cache="search"} 2.0', self.render()
+        )
+
+    def test_cumulative_pool_statistics_are_counters(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {"pool_size": 4, "requests_num": 120}
+        register_collector(database.collect_pool_metrics, registry=self.registry)
+        self.assertEqual(self.render(), "")
+        with mock.patch.object(database, "connection_pool", pool):
+            output = self.render()
+        self.assertIn("# TYPE researcher_db_pool gauge", output)
+        self.assertIn('researcher_db_pool{stat="pool_size"} 4.0', output)
+        self.assertIn("# TYPE researcher_db_pool_events_total counter", output)
+        self.assertIn(
+            'researcher_db_pool_events_total{stat="requests_num"} 120.0', output
+        )
+        self.assertNotIn('researcher_db_pool{stat="requests_num"}', output)
+
+
+if __name__ == "__main__":
+    unittest.main()
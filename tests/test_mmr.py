@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from researcher.store import Store
+from researcher.store.mmr import maximal_marginal_relevance
+
+
+class TestMaximalMarginalRelevance(unittest.TestCase):
+
+    def setUp(self):
+        self.query = [1.0, 0.0, 0.0]
+        self.embeddings = [
+            [0.9, 0.1, 0.0],
+            [0.9, 0.11, 0.0],
+            [0.6, 0.0, 0.8],
+            [0.0, 1.0, 0.0],
+        ]
+
+    def test_most_relevant_first_then_diverse(self):
+        selected = maximal_marginal_relevance(self.query, self.embeddings, k=2)
+        self.assertEqual(selected, [0, 2])
+
+    def test_lambda_one_ranks_by_relevance(self):
+        selected = maximal_marginal_relevance(
+            self.query, self.embeddings, k=4, lambda_mult=1
+        )
+        self.assertEqual(selected, [0, 1, 2, 3])
+
+    def test_k_larger_than_candidates_and_empty(self):
+        self.assertEqual(
+            sorted(maximal_marginal_relevance(self.query, self.embeddings, k=10)),
+            [0, 1, 2, 3],
+        )
+        self.assertEqual(maximal_marginal_relevance(self.query, [], k=3), [])
+
+
+class TestMMRStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store(embeddings=DeterministicFakeEmbedding(size=8))
+        self.store.load(
+            [
+                {"raw_content": "Quarterly revenue grew.", "url": f"copy{i}"}
+                for i in range(3)
+            ]
+            + [
+                {"raw_content": "Guidance was raised.", "url": "other"},
+                {"raw_content": "Margins were flat.", "url": "other"},
+            ]
+        )
+
+    def test_mmr_drops_duplicate_chunks(self):
+        results = self.store.similarity_search(
+            "Quarterly revenue grew.", k=3, mmr=True, fetch_k=5, lambda_mult=0
+        )
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0].page_content, "Quarterly revenue grew.")
+        self.assertEqual(len({doc.page_content for doc in results}), 3)
+
+    def test_async_mmr_respects_filter(self):
+        results = asyncio.run(
+            self.store.asimilarity_search(
+                "Quarterly revenue grew.",
+                k=2,
+                filter={"source": {"in": ["copy0", "other"]}},
+                mmr=True,
+                lambda_mult=0,
+            )
+        )
+        self.assertEqual(results[0].page_content, "Quarterly revenue grew.")
+        self.assertTrue(
+            all(doc.metadata["source"] in ("copy0", "other") for doc in results)
+        )
+        self.assertNotEqual(results[0].page_content, results[1].page_content)
+
+    def test_fetch_k_is_raised_to_k(self):
+        self.store.fetch_k = 2
+        results = self.store.similarity_search("Quarterly revenue grew.", k=4, mmr=True)
+        self.assertEqual(len(results), 4)
+        results = asyncio.run(
+            self.store.asimilarity_search("Quarterly revenue grew.", k=4, mmr=True)
+        )
+        self.assertEqual(len(results), 4)
+
+    def test_candidates_without_vectors_are_not_embedded(self):
+        faiss_embeddings = self.store._faiss_embeddings
+
+        def without_copies(documents):
+            return [
+                None if doc.metadata["source"].startswith("copy") else embedding
+                for doc, embedding in zip(documents, faiss_embeddings(documents))
+            ]
+
+        with mock.patch.object(
+            self.store, "_faiss_embeddings", side_effect=without_copies
+        ), mock.patch.object(
+            DeterministicFakeEmbedding, "embed_documents", side_effect=AssertionError
+        ):
+            results = asyncio.run(
+                self.store.asimilarity_search(
+                    "Quarterly revenue grew.", k=3, mmr=True, fetch_k=5
+                )
+            )
+            self.assertEqual({doc.metadata["source"] for doc in results}, {"other"})
+            self.assertEqual(len(results), 2)
+
+            # Without any vector, the candidates are ranked by similarity
+            with mock.patch.object(
+                self.store, "_faiss_embeddings", side_effect=lambda docs: [None] * 5
+            ):
+                results = self.store.similarity_search(
+                    "Quarterly revenue grew.", k=3, mmr=True, fetch_k=5
+                )
+            self.assertEqual(
+                [doc.page_content for doc in results], ["Quarterly revenue grew."] * 3
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,373 @@
+import asyncio
+import os
+import unittest
+from contextlib import asynccontextmanager
+from unittest import mock
+
+import psycopg
+from dotenv import load_dotenv
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from researcher.cache import LRUCache
+from researcher.store import PGVectorStore, Store
+from researcher.store.pgvector import to_vector
+from researcher.utils.database import get_db_connection_str
+
+load_dotenv()
+
+
+@asynccontextmanager
+async def connect():
+    async with await psycopg.AsyncConnection.connect(get_db_connection_str()) as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def connect_indexed():
+    # Planned as on a large table, where the approximate index is used
+    async with connect() as conn:
+        await conn.execute("SET enable_seqscan = off")
+        yield conn
+
+
+class TestPGVectorFilters(unittest.TestCase):
+
+    def setUp(self):
+        self.store = PGVectorStore(DeterministicFakeEmbedding(size=8), dimensions=8)
+
+    def test_columns_and_metadata_filters(self):
+        where, params = self.store._where(
+            {"source": {"in": ["a", "b"]}, "user_id": "alice", "page": {"substring": 1}}
+        )
+        self.assertEqual(params, [["a", "b"], "alice", "%1%"])
+        self.assertEqual(
+            where.as_string(None),
+            '"source" = ANY(%s) AND "user_id" = %s AND metadata->>\'page\' ILIKE %s',
+        )
+
+    def test_empty_filter(self):
+        where, params = self.store._where(None)
+        self.assertEqual(where.as_string(None), "TRUE")
+        self.assertEqual(params, [])
+
+    def test_to_vector(self):
+        self.assertEqual(to_vector([1, 0.5]), "[1.0,0.5]")
+
+    def test_partition_name(self):
+        name = self.store.partition_name("alice@example.com")
+        self.assertRegex(name, r"^document_chunks_u_[0-9a-f]{16}$")
+        self.assertEqual(name, self.store.partition_name("alice@example.com"))
+        self.assertNotEqual(name, self.store.partition_name("bob@example.com"))
+
+    def test_unknown_quantization(self):
+        with self.assertRaises(ValueError):
+            PGVectorStore(DeterministicFakeEmbedding(size=8), quantization="int8")
+
+    def test_unknown_distance(self):
+        with self.assertRaises(ValueError):
+            PGVectorStore(DeterministicFakeEmbedding(size=8), distance="hamming")
+
+
+@unittest.skipUnless(os.getenv("DB_HOST"), "requires a Postgres database with pgvector")
+class TestPGVectorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+        vector_store = PGVectorStore(
+            self.embeddings,
+            table_name="test_document_chunks",
+            dimensions=8,
+            async_connection=connect,
+        )
+        self.store = Store(
+            "pgvector",
+            vector_store=vector_store,
+            async_connection=connect,
+            embeddings=self.embeddings,
+        )
+
+        async def create_table():
+            async with connect() as conn:
+                await conn.execute("DROP TABLE IF EXISTS test_document_chunks")
+            await vector_store.acreate_table()
+
+        asyncio.run(create_table())
+        self.documents = [
+            {
+                "raw_content": f"Document number {i}.",
+                "url": f"doc{i % 2}",
+                "user_id": "alice",
+            }
+            for i in range(6)
+        ]
+
+    def test_search_filters_by_source(self):
+        asyncio.run(self.store.aload(self.documents))
+        results = asyncio.run(
+            self.store.asimilarity_search(
+                "Document number 3.",
+                k=2,
+                filter={"source": {"in": ["doc1"]}},
+                ef_search=80,
+            )
+        )
+        self.assertEqual(results[0][0].page_content, "Document number 3.")
+        self.assertTrue(all(doc.metadata["source"] == "doc1" for doc, _ in results))
+
+    def test_selective_filter_finds_rows_beyond_ef_search(self):
+        documents = [
+            {"raw_content": f"Note {i}.", "url": "notes", "user_id": "alice"}
+            for i in range(300)
+        ] + [
+            {"raw_content": f"Rare {i}.", "url": "rare", "user_id": "alice", "page": 9}
+            for i in range(3)
+        ]
+        asyncio.run(self.store.aload(documents))
+        self.store.vector_store.async_connection = connect_indexed
+        for filter in ({"page": "9"}, {"source": "rare"}):
+            results = asyncio.run(
+                self.store.vector_store.asimilarity_search(
+                    "Note 7.", k=3, filter=filter, ef_search=3
+                )
+            )
+            self.assertEqual(
+                sorted(doc.page_content for doc, _ in results),
+                ["Rare 0.", "Rare 1.", "Rare 2."],
+            )
+            distances = [distance for _, distance in results]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_hybrid_search_finds_exact_identifier(self):
+        asyncio.run(
+            self.store.aload(
+                self.documents
+                + [{"raw_content": "Order of part XK-2231.", "url": "doc2"}]
+            )
+        )
+        lexical = asyncio.run(
+            self.store.vector_store.alexical_search("Where is XK-2231?", k=3)
+        )
+        self.assertEqual(
+            [doc.page_content for doc, _ in lexical], ["Order of part XK-2231."]
+        )
+        results = asyncio.run(
+            self.store.asimilarity_search("Where is XK-2231?", k=3, hybrid=True)
+        )
+        self.assertEqual(results[0][0].page_content, "Order of part XK-2231.")
+
+    def test_lexical_search_matches_lexemes_with_operators(self):
+        url = "example.com/report?year=2024&quarter=3"
+        asyncio.run(
+            self.store.aload(
+                self.documents
+                + [
+                    {"raw_content": f"See {url} for details.", "url": "doc2"},
+                    {"raw_content": "Visit example.com today.", "url": "doc3"},
+                ]
+            )
+        )
+        lexical = asyncio.run(self.store.vector_store.alexical_search(url, k=3))
+        self.assertEqual(
+            [doc.page_content for doc, _ in lexical],
+            [f"See {url} for details.", "Visit example.com today."],
+        )
+        self.assertGreater(lexical[0][1], lexical[1][1])
+        self.assertEqual(
+            asyncio.run(self.store.vector_store.alexical_search("the of", k=3)), []
+        )
+
+    def test_reload_skips_stored_chunks(self):
+        asyncio.run(self.store.aload(self.documents))
+        asyncio.run(self.store.aload(self.documents))
+        results = asyncio.run(
+            self.store.asimilarity_search("Document", k=10, filter={"user_id": "alice"})
+        )
+        self.assertEqual(len(results), 6)
+
+    def test_mmr_selects_candidate_embeddings_with_them(self):
+        asyncio.run(self.store.aload(self.documents))
+        with mock.patch.object(
+            self.store, "_alookup_chunks", side_effect=AssertionError
+        ), mock.patch.object(
+            DeterministicFakeEmbedding, "aembed_documents", side_effect=AssertionError
+        ):
+            for hybrid in (False, True):
+                results = asyncio.run(
+                    self.store.asimilarity_search(
+                        "Document number 3.",
+                        k=8,
+                        mmr=True,
+                        fetch_k=4,
+                        hybrid=hybrid,
+                        lambda_mult=1,
+                    )
+                )
+                self.assertEqual(len(results), 6)
+                self.assertEqual(results[0][0].page_content, "Document number 3.")
+                self.assertTrue(all(len(result) == 2 for result in results))
+
+    def test_quantization_mismatch_is_refused(self):
+        halfvec = PGVectorStore(
+            self.embeddings,
+            table_name="test_document_chunks",
+            dimensions=8,
+            quantization="float16",
+            async_connection=connect,
+        )
+        with self.assertRaises(ValueError):
+            asyncio.run(halfvec.acreate_table())
+
+
+@unittest.skipUnless(os.getenv("DB_HOST"), "requires a Postgres database with pgvector")
+class TestPartitionedPGVectorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+        self.vector_store = PGVectorStore(
+            self.embeddings,
+            table_name="test_partitioned_chunks",
+            dimensions=8,
+            partition_by_user=True,
+            async_connection=connect,
+        )
+        self.store = Store(
+            "pgvector",
+            vector_store=self.vector_store,
+            async_connection=connect,
+            embeddings=self.embeddings,
+        )
+
+        async def create_table():
+            async with connect() as conn:
+                await conn.execute("DROP TABLE IF EXISTS test_partitioned_chunks")
+            await self.vector_store.acreate_table()
+
+        asyncio.run(create_table())
+
+    def test_search_is_routed_to_user_partition(self):
+        asyncio.run(
+            self.store.aload(
+                [
+                    {"raw_content": f"Note {i}.", "url": f"{user}-doc", "user_id": user}
+                    for user in ("alice", "bob")
+                    for i in range(3)
+                ]
+            )
+        )
+
+        async def partitions():
+            async with connect() as conn:
+                cursor = await conn.execute(
+                    "SELECT count(*) FROM pg_inherits "
+                    "WHERE inhparent = 'test_partitioned_chunks'::regclass"
+                )
+                return (await cursor.fetchone())[0]
+
+        self.assertEqual(asyncio.run(partitions()), 2)
+        results = asyncio.run(
+            self.store.asimilarity_search(
+                "Note 1.", k=10, filter={"user_id": "bob"}, mmr=True
+            )
+        )
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(doc.metadata["user_id"] == "bob" for doc, _ in results))
+
+    def test_deleted_chunks_are_compacted(self):
+        documents = [
+            {"raw_content": f"Note {i}.", "url": f"doc{i % 2}", "user_id": "alice"}
+            for i in range(10)
+        ]
+        asyncio.run(self.store.aload(documents))
+        deleted = asyncio.run(
+            self.store.adelete({"source": "doc0", "user_id": "alice"})
+        )
+        self.assertEqual(deleted, 5)
+
+        async def compact():
+            # Dead rows are counted once the deleting session's statistics are flushed
+            for _ in range(20):
+                compacted = await self.store.acompact(dead_ratio=0.1)
+                if compacted:
+                    return compacted
+                await asyncio.sleep(0.1)
+            return []
+
+        self.assertEqual(
+            asyncio.run(compact()), [self.vector_store.partition_name("alice")]
+        )
+        results = asyncio.run(
+            self.store.asimilarity_search("Note", k=10, filter={"user_id": "alice"})
+        )
+        self.assertEqual({doc.metadata["source"] for doc, _ in results}, {"doc1"})
+
+    def test_reupload_replaces_chunks_of_earlier_loads(self):
+        asyncio.run(
+            self.store.aload(
+                [
+                    {"raw_content": f"Note {i}.", "url": "doc", "user_id": "alice"}
+                    for i in range(3)
+                ]
+            )
+        )
+        asyncio.run(
+            self.store.aload(
+                [
+                    {"raw_content": text, "url": "doc", "user_id": "alice"}
+                    for text in ("Note 0.", "Revised note.")
+                ],
+                replace=True,
+            )
+        )
+        results = asyncio.run(
+            self.store.asimilarity_search("Note", k=10, filter={"user_id": "alice"})
+        )
+        self.assertEqual(
+            sorted(doc.page_content for doc, _ in results),
+            ["Note 0.", "Revised note."],
+        )
+
+    def test_identical_file_is_copied_to_other_partition(self):
+        self.store.file_cache = LRUCache()
+        pages = [
+            {"raw_content": f"Note {i}.", "url": "alice-doc", "user_id": "alice"}
+            for i in range(3)
+        ]
+        asyncio.run(self.store.aload(pages, file_hash="abc"))
+        copied = asyncio.run(self.store.acopy_file("abc", "bob-doc", "bob"))
+        self.assertEqual(copied, 3)
+
+        results = asyncio.run(
+            self.store.asimilarity_search("Note 1.", k=10, filter={"user_id": "bob"})
+        )
+        self.assertEqual(
+            sorted(doc.page_content for doc, _ in results),
+            ["Note 0.", "Note 1.", "Note 2."],
+        )
+        self.assertEqual(
+            {(doc.metadata["source"], doc.metadata["user_id"]) for doc, _ in results},
+            {("bob-doc", "bob")},
+        )
+
+        # Once the chunks copied from are gone, the copy can't be made
+        asyncio.run(self.store.adelete({"source": "bob-doc", "user_id": "bob"}))
+        self.assertIsNone(
+            asyncio.run(self.store.acopy_file("abc", "carol-doc", "carol"))
+        )
+
+    def test_chunks_need_an_owner(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(self.store.aload([{"raw_content": "Note.", "url": "doc"}]))
+
+    def test_partitioning_mismatch_is_refused(self):
+        unpartitioned = PGVectorStore(
+            self.embeddings,
+            table_name="test_partitioned_chunks",
+            dimensions=8,
+            async_connection=connect,
+        )
+        with self.assertRaises(ValueError):
+            asyncio.run(unpartitioned.acreate_table())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import unittest
+
+from langgraph.checkpoint.memory import MemorySaver
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("TAVILY_API_KEY", "test-key")
+
+from researcher.graph.researcher import Researcher  # noqa: E402
+from researcher.llm import AssessedResponse  # noqa: E402
+from researcher.store.vectorstore import Store  # noqa: E402
+
+
+class FakeLLMProvider:
+    """Answers every prompt with a fixed validation verdict."""
+
+    def __init__(self, validation: str = "no", tokens: int = 10):
+        self.validation = validation
+        self.tokens = tokens
+        self.calls = 0
+
+    async def agenerate_with_usage(self, prompt, config=None):
+        self.calls += 1
+        if "Answer 'yes' or 'no'" in prompt[0]:
+            return self.validation, self.tokens
+        return f"reply {self.calls}", self.tokens
+
+
+class FakeAssessingLLMProvider(FakeLLMProvider):
+    """Answers with a self-assessment, complete once `complete_after` answers."""
+
+    def __init__(self, complete_after: int = 1, tokens: int = 10):
+        super().__init__(tokens=tokens)
+        self.complete_after = complete_after
+        self.answers = 0
+        self.questions = []
+
+    async def agenerate_structured(self, prompt, schema, config=None):
+        self.calls += 1
+        self.answers += 1
+        self.questions.append(prompt[0].split("Question: ")[1].split("\n")[0])
+        complete = self.answers >= self.complete_after
+        response = schema(
+            answer=f"answer {self.answers}",
+            confidence=0.9 if complete else 0.2,
+            complete=complete,
+            follow_up_query=None if complete else f"follow up {self.answers}",
+        )
+        return response, self.tokens
+
+
+class FakeRetriever:
+    async def search(self, query):
+        return [{"url": "http://example.com", "content": query}]
+
+
+class ResearcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.researcher = asyncio.run(Researcher.create_researcher(Store()))
+        self.researcher.retriever = FakeRetriever()
+        self.graph = self.researcher.graph.compile(checkpointer=MemorySaver())
+        self.state = {"question": "What is AI?", "chat_history": [], "files": []}
+
+    def run_graph(self, llm, **configurable):
+        self.researcher.llm = llm
+        config = {"configurable": {"thread_id": "thread", **configurable}}
+        return asyncio.run(self.graph.ainvoke(self.state, config=config))
+
+
+class TestResearcherBudgets(ResearcherTestCase):
+
+    def test_validation_passes_on_first_iteration(self):
+        result = self.run_graph(FakeLLMProvider(validation="yes"))
+        self.assertEqual(result["iterations"], 1)
+        self.assertTrue(result["validated"])
+
+    def test_max_iterations_from_config(self):
+        result = self.run_graph(FakeLLMProvider(), max_iterations=2)
+        self.assertEqual(result["iterations"], 2)
+
+    def test_iterations_do_not_leak_across_runs(self):
+        self.run_graph(FakeLLMProvider(), max_iterations=2)
+        result = self.run_graph(FakeLLMProvider(), max_iterations=2)
+        self.assertEqual(result["iterations"], 2)
+
+    def test_token_budget_short_circuits(self):
+        # generate_query and generate_response spend 20 tokens in the first pass
+        result = self.run_graph(FakeLLMProvider(), max_iterations=10, token_budget=20)
+        self.assertEqual(result["iterations"], 1)
+        self.assertEqual(result["tokens_used"], 20)
+
+    def test_timeout_short_circuits(self):
+        result = self.run_graph(FakeLLMProvider(), max_iterations=10, timeout=0)
+        self.assertEqual(result["iterations"], 1)
+
+
+class TestResearcherSelfAssessment(ResearcherTestCase):
+
+    def test_self_assessment_replaces_validation_calls(self):
+        llm = FakeAssessingLLMProvider(complete_after=2)
+        result = self.run_graph(llm, self_assessment=True)
+        self.assertEqual(result["response"], "answer 2")
+        self.assertTrue(result["validated"])
+        # One query generation and two structured answers, no validation calls
+        self.assertEqual(llm.calls, 3)
+        self.assertEqual(llm.questions[1], "follow up 1")
+
+    def test_self_assessment_schema_bounds_confidence(self):
+        with self.assertRaises(ValueError):
+            AssessedResponse(answer="answer", confidence=2, complete=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from langchain_core.messages import AIMessageChunk
+
+from researcher.llm import JSONFieldStream, structured_output_fragment
+
+
+class TestJSONFieldStream(unittest.TestCase):
+
+    def stream(self, fragments, field="answer"):
+        stream = JSONFieldStream(field)
+        return [stream.feed(fragment) for fragment in fragments], stream
+
+    def test_field_is_decoded_across_fragments(self):
+        tokens, stream = self.stream(
+            ['{"ans', 'wer": "The', " sky", ' is blue", "confidence', '": 0.9}']
+        )
+        self.assertEqual(tokens, ["", "The", " sky", " is blue", ""])
+        self.assertTrue(stream.done)
+
+    def test_other_fields_are_skipped(self):
+        tokens, _ = self.stream(['{"reasoning": "answer", "answer": "yes"}'])
+        self.assertEqual("".join(tokens), "yes")
+
+    def test_escapes_split_across_fragments(self):
+        tokens, stream = self.stream(
+            ['{"answer": "a\\', 'nb \\"q\\', '" \\ud83d', "\\ude", '00 c"}']
+        )
+        self.assertEqual("".join(tokens), 'a\nb "q" \U0001f600 c')
+        self.assertEqual(tokens[3], "")
+        self.assertTrue(stream.done)
+
+    def test_nothing_is_decoded_after_the_field(self):
+        tokens, _ = self.stream(['{"answer": "done"', ', "answer": "again"}'])
+        self.assertEqual(tokens, ["done", ""])
+
+
+class TestStructuredOutputFragment(unittest.TestCase):
+
+    def test_tool_call_arguments(self):
+        chunk = AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {"name": "AssessedResponse", "args": '{"ans', "id": None, "index": 0}
+            ],
+        )
+        self.assertEqual(structured_output_fragment(chunk), '{"ans')
+
+    def test_content(self):
+        chunk = AIMessageChunk(content='{"answer": "')
+        self.assertEqual(structured_output_fragment(chunk), '{"answer": "')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import unittest
+
+from researcher.cache import LRUCache, SingleFlight
+from researcher.retriever.tavily import TavilyRetriever, normalize_query
+
+
+class FakeSearchTool:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, params):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return [{"url": "http://example.com", "content": params["query"]}]
+
+
+class TestTavilyRetriever(unittest.TestCase):
+
+    def setUp(self):
+        os.environ.setdefault("TAVILY_API_KEY", "test-key")
+        self.retriever = TavilyRetriever(cache=LRUCache(ttl=60), max_results=2)
+        self.retriever.search_tool = FakeSearchTool()
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query('  "Latest  AI News" '), "latest ai news")
+
+    def test_repeated_searches_are_cached(self):
+        asyncio.run(self.retriever.search("Latest AI news"))
+        asyncio.run(self.retriever.search('"latest   ai news"'))
+        self.assertEqual(self.retriever.search_tool.calls, 1)
+        self.assertEqual(self.retriever.cache.hits, 1)
+
+    def test_concurrent_searches_share_one_request(self):
+        async def search_concurrently():
+            return await asyncio.gather(
+                *(self.retriever.search("Latest AI news") for _ in range(5))
+            )
+
+        results = asyncio.run(search_concurrently())
+        self.assertEqual(self.retriever.search_tool.calls, 1)
+        self.assertEqual(self.retriever.in_flight.coalesced, 4)
+        self.assertTrue(all(result == results[0] for result in results))
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_errors_reach_every_caller(self):
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def call_concurrently():
+            flight = SingleFlight()
+            return await asyncio.gather(
+                flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+            )
+
+        results = asyncio.run(call_concurrently())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
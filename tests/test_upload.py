@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+
+from api.utils.upload import (
+    clean_spool,
+    clean_spool_periodically,
+    file_sha256,
+    remove_spooled,
+    spool_upload,
+)
+
+BOUNDARY = "----boundary7MA4YWxkTrZu0gW"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def multipart_body(content: bytes, file_name: str = "report.PDF") -> bytes:
+    return (
+        (
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="note"\r\n\r\n'
+            "not the file\r\n"
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        + content
+        + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+async def chunks(body: bytes, size: int = 65536, error: Exception = None):
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+        if error is not None:
+            raise error
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool_dir = os.path.join(self.directory.name, "uploads")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_upload_is_streamed_to_spool_with_its_extension(self):
+        content = os.urandom(3 * 2**20 + 17)
+        file_name, path, digest = asyncio.run(
+            spool_upload(chunks(multipart_body(content)), CONTENT_TYPE, self.spool_dir)
+        )
+        self.assertEqual(file_name, "report.PDF")
+        self.assertTrue(path.startswith(self.spool_dir))
+        self.assertTrue(path.endswith(".pdf"))
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(digest, hashlib.sha256(content).hexdigest())
+        self.assertEqual(file_sha256(path), digest)
+        remove_spooled(path)
+        remove_spooled(path)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_body_without_file_is_refused(self):
+        body = multipart_body(b"content").replace(b'name="file"', b'name="other"')
+        with self.assertRaises(ValueError):
+            asyncio.run(spool_upload(chunks(body), CONTENT_TYPE, self.spool_dir))
+        with self.assertRaises(ValueError):
+            asyncio.run(spool_upload(chunks(body), "application/pdf", self.spool_dir))
+        self.assertFalse(os.path.exists(self.spool_dir))
+
+    def test_failed_spool_leaves_no_file(self):
+        body = multipart_body(os.urandom(2**20))
+        error = ConnectionResetError("client went away")
+        with self.assertRaises(ConnectionResetError):
+            asyncio.run(
+                spool_upload(chunks(body, 1024, error), CONTENT_TYPE, self.spool_dir)
+            )
+        # The body is cut short of the file's end
+        with self.assertRaises(ValueError):
+            asyncio.run(spool_upload(chunks(body[:-100]), CONTENT_TYPE, self.spool_dir))
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_clean_spool_removes_stale_files_only(self):
+        os.makedirs(self.spool_dir)
+        stale, fresh = (os.path.join(self.spool_dir, name) for name in ("a", "b"))
+        for path in (stale, fresh):
+            with open(path, "wb") as file:
+                file.write(b"upload")
+        day_ago = time.time() - 86400
+        os.utime(stale, (day_ago, day_ago))
+        self.assertEqual(clean_spool(self.spool_dir, max_age=3600), 1)
+        self.assertEqual(os.listdir(self.spool_dir), [os.path.basename(fresh)])
+        self.assertEqual(clean_spool(os.path.join(self.spool_dir, "missing"), 0), 0)
+
+    def test_spool_is_cleaned_periodically(self):
+        os.makedirs(self.spool_dir)
+
+        async def main():
+            task = asyncio.create_task(
+                clean_spool_periodically(self.spool_dir, max_age=0.2, interval=0.01)
+            )
+            with open(os.path.join(self.spool_dir, "a"), "wb") as file:
+                file.write(b"upload")
+            await asyncio.sleep(0.05)
+            self.assertEqual(os.listdir(self.spool_dir), ["a"])
+            await asyncio.sleep(0.5)
+            self.assertEqual(os.listdir(self.spool_dir), [])
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,14 @@
+import asyncio
+import tempfile
+import threading
 import unittest
+from unittest import mock
+import faiss
 from langchain.docstore.document import Document
-from researcher.store.vectorstore import Store  # Adjust based on actual path
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from researcher.cache import LRUCache
+from researcher.document.chunker import Chunker
+from researcher.store.vectorstore import Store, chunk_hash
 
 
 class TestDefaultVectorStore(unittest.TestCase):
@@ -96,5 +104,459 @@ class TestDefaultVectorStore(unittest.TestCase):
                 self.assertIn(source, expected_urls)
 
 
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    """Fails the first `failures` batch embeddings, recording every batch size."""
+
+    failures: int = 0
+    batches: list = []
+
+    async def aembed_documents(self, texts):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("rate limited")
+        self.batches.append(len(texts))
+        return self.embed_documents(texts)
+
+
+class TestBatchedLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = [
+            {
+                "raw_content": f"Document number {i} about topic {i % 3}.",
+                "url": f"doc{i}",
+            }
+            for i in range(10)
+        ]
+
+    def test_aload_embeds_in_batches(self):
+        embeddings = FlakyEmbeddings(size=8, batches=[])
+        store = Store(embeddings=embeddings)
+        asyncio.run(store.aload(self.documents, batch_size=3, max_concurrency=2))
+
+        self.assertEqual(sorted(embeddings.batches), [1, 3, 3, 3])
+        self.assertEqual(store.vector_store.index.ntotal, 10)
+        results = store.similarity_search(
+            "Document number 4 about topic 1.", k=1, filter={"source": {"in": ["doc4"]}}
+        )
+        self.assertEqual(results[0].metadata["source"], "doc4")
+
+    def test_aload_reports_progress(self):
+        store = Store(embeddings=FlakyEmbeddings(size=8, batches=[]))
+        progress = []
+
+        async def on_progress(written, total):
+            progress.append((written, total))
+
+        asyncio.run(
+            store.aload(
+                self.documents, batch_size=4, max_concurrency=1, on_progress=on_progress
+            )
+        )
+        # The number of chunks to write is known once every document is split
+        self.assertEqual(progress, [(4, None), (8, None), (8, 10), (10, 10)])
+
+    def test_aload_streams_documents_in_bounded_batches(self):
+        store = Store(embeddings=FlakyEmbeddings(size=8, batches=[]))
+        written_when_read = []
+
+        async def pages():
+            for document in self.documents:
+                index = store.vector_store.index.ntotal if store.vector_store else 0
+                written_when_read.append(index)
+                yield document
+
+        asyncio.run(store.aload(pages(), batch_size=2, max_concurrency=1))
+        self.assertEqual(store.vector_store.index.ntotal, 10)
+        # Batches are written while later documents are still to be read
+        self.assertEqual(written_when_read[-1], 6)
+
+    def test_aload_embeds_chunks_repeated_across_batches_once(self):
+        embeddings = FlakyEmbeddings(size=8, batches=[])
+        store = Store(embeddings=embeddings)
+        documents = [
+            {"raw_content": "Shared disclaimer.", "url": "doc0"},
+            {"raw_content": "Body of the first file.", "url": "doc0"},
+            {"raw_content": "Shared disclaimer.", "url": "doc1"},
+        ]
+        asyncio.run(store.aload(documents, batch_size=1, max_concurrency=3))
+        self.assertEqual(embeddings.batches, [1, 1])
+        self.assertEqual(store.vector_store.index.ntotal, 3)
+
+    def test_aload_retries_failed_batches(self):
+        embeddings = FlakyEmbeddings(size=8, failures=2, batches=[])
+        store = Store(embeddings=embeddings)
+        asyncio.run(store.aload(self.documents, batch_size=5, retry_delay=0))
+        self.assertEqual(store.vector_store.index.ntotal, 10)
+
+    def test_faiss_is_written_and_searched_off_the_event_loop(self):
+        store = Store(embeddings=FlakyEmbeddings(size=8, batches=[]))
+        store.load(self.documents[:1])
+        threads = []
+
+        def record(method):
+            def wrapper(*args):
+                threads.append(threading.get_ident())
+                return method(*args)
+
+            return wrapper
+
+        async def load_and_search():
+            return await asyncio.gather(
+                store.aload(self.documents[1:], batch_size=2),
+                *(
+                    store.asimilarity_search("Document number 1.", k=2)
+                    for _ in range(5)
+                ),
+            )
+
+        with mock.patch.object(
+            store, "_add_faiss_embeddings", record(store._add_faiss_embeddings)
+        ), mock.patch.object(store, "_faiss_search", record(store._faiss_search)):
+            asyncio.run(load_and_search())
+        self.assertEqual(len(threads), 10)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(store.vector_store.index.ntotal, 10)
+        results = store.similarity_search("Document number 1 about topic 1.", k=1)
+        self.assertEqual(results[0].metadata["source"], "doc1")
+
+    def test_aload_raises_after_max_retries(self):
+        embeddings = FlakyEmbeddings(size=8, failures=10, batches=[])
+        store = Store(embeddings=embeddings)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(
+                store.aload(self.documents, batch_size=5, max_retries=1, retry_delay=0)
+            )
+
+
+class TestChunkDeduplication(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = [
+            {
+                "raw_content": f"Document number {i} about topic {i % 3}.",
+                "url": f"doc{i}",
+            }
+            for i in range(5)
+        ]
+        self.embeddings = FlakyEmbeddings(size=8, batches=[])
+        self.store = Store(embeddings=self.embeddings)
+        asyncio.run(self.store.aload(self.documents))
+
+    def test_chunk_hash_normalizes_whitespace(self):
+        self.assertEqual(
+            chunk_hash("Some  text\n here ", "model"),
+            chunk_hash("Some text here", "model"),
+        )
+        self.assertNotEqual(
+            chunk_hash("Some text", "model"), chunk_hash("Some text", "other-model")
+        )
+
+    def test_reload_skips_stored_chunks(self):
+        asyncio.run(self.store.aload(self.documents))
+        self.assertEqual(self.embeddings.batches, [5])
+        self.assertEqual(self.store.vector_store.index.ntotal, 5)
+
+    def test_other_source_reuses_vectors(self):
+        copies = [{**document, "url": "copy"} for document in self.documents]
+        asyncio.run(self.store.aload(copies))
+        self.assertEqual(self.embeddings.batches, [5])
+        self.assertEqual(self.store.vector_store.index.ntotal, 10)
+
+        results = self.store.similarity_search(
+            "Document number 2 about topic 2.", k=1, filter={"source": {"in": ["copy"]}}
+        )
+        self.assertEqual(results[0].page_content, "Document number 2 about topic 2.")
+
+    def test_other_owner_looks_up_its_own_chunks(self):
+        owned = [
+            {**document, "url": f"bob-{document['url']}", "user_id": "bob"}
+            for document in self.documents
+        ]
+        with mock.patch.object(
+            self.store, "_alookup_chunks", wraps=self.store._alookup_chunks
+        ) as lookup:
+            asyncio.run(self.store.aload(owned))
+        self.assertEqual(
+            {call.kwargs["user_id"] for call in lookup.call_args_list}, {"bob"}
+        )
+        self.assertEqual(self.embeddings.batches, [5, 5])
+
+        asyncio.run(self.store.aload([{**owned[0], "url": "bob-copy"}]))
+        self.assertEqual(self.embeddings.batches, [5, 5])
+        self.assertEqual(self.store.vector_store.index.ntotal, 11)
+
+    def test_repeated_chunks_are_embedded_once(self):
+        documents = [
+            {"raw_content": "A new paragraph.", "url": "doc7"},
+            {"raw_content": "A  new paragraph.", "url": "doc7"},
+            {"raw_content": "A new paragraph.", "url": "doc8"},
+        ]
+        asyncio.run(self.store.aload(documents))
+        self.assertEqual(self.embeddings.batches, [5, 1])
+        self.assertEqual(self.store.vector_store.index.ntotal, 7)
+
+    def test_lookup_only_reads_appended_chunks(self):
+        docstore = self.store.vector_store.docstore
+        with mock.patch.object(docstore, "search", wraps=docstore.search) as search:
+            asyncio.run(self.store.aload(self.documents[:2]))
+            self.assertEqual(search.call_count, 5)
+            asyncio.run(self.store.aload([{**self.documents[0], "url": "copy"}]))
+            self.assertEqual(search.call_count, 5)
+            for url in ("doc7", "doc8"):
+                asyncio.run(
+                    self.store.aload([{"raw_content": "A new paragraph.", "url": url}])
+                )
+            # Later lookups only read the chunks appended since the previous one
+            self.assertEqual(search.call_count, 7)
+        self.assertEqual(self.embeddings.batches, [5, 1])
+
+    def test_lookup_after_delete_finds_shifted_chunks(self):
+        text = "Document number 4 about topic 1."
+        asyncio.run(self.store.aload([{"raw_content": text, "url": "copy"}]))
+        asyncio.run(self.store.adelete({"source": "doc0"}))
+        fingerprint = next(
+            doc.metadata["chunk_hash"]
+            for doc in self.store.vector_store.docstore._dict.values()
+            if doc.page_content == text
+        )
+        found = asyncio.run(self.store._alookup_chunks({fingerprint}))
+        embedding, sources = found[fingerprint]
+        self.assertEqual(sources, {"doc4", "copy"})
+        for value, expected in zip(embedding, self.embeddings.embed_query(text)):
+            self.assertAlmostEqual(value, expected, places=5)
+
+
+class TestPersistentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.embeddings = DeterministicFakeEmbedding(size=8)
+        self.documents = [
+            {"raw_content": f"Document number {i}.", "url": f"doc{i}"} for i in range(4)
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_store(self, **kwargs):
+        return Store(
+            embeddings=self.embeddings, persist_directory=self.directory.name, **kwargs
+        )
+
+    def test_store_is_loaded_from_directory(self):
+        self.create_store().load(self.documents)
+
+        for mmap in (True, False):
+            store = self.create_store(mmap=mmap)
+            self.assertEqual(store.vector_store.index.ntotal, 4)
+            results = store.similarity_search("Document number 2.", k=1)
+            self.assertEqual(results[0].metadata["source"], "doc2")
+
+    def test_append_is_saved_and_seen_by_other_stores(self):
+        writer, reader = self.create_store(), self.create_store()
+        writer.load(self.documents[:2])
+        asyncio.run(reader.aload(self.documents[2:]))
+
+        # The reader appended to the writer's saved index, the writer reloads it
+        self.assertEqual(reader.vector_store.index.ntotal, 4)
+        results = writer.similarity_search("Document number 3.", k=1)
+        self.assertEqual(results[0].metadata["source"], "doc3")
+        self.assertEqual(self.create_store().vector_store.index.ntotal, 4)
+
+    def test_own_save_is_not_reloaded(self):
+        store = self.create_store()
+        asyncio.run(store.aload(self.documents[:2]))
+        vector_store = store.vector_store
+        asyncio.run(store.aload(self.documents[2:]))
+        store._refresh_persisted()
+        self.assertIs(store.vector_store, vector_store)
+        self.assertEqual(store.vector_store.index.ntotal, 4)
+
+    def test_load_is_saved_once(self):
+        store, other = self.create_store(), self.create_store()
+        with mock.patch.object(
+            store, "_save_persisted", wraps=store._save_persisted
+        ) as save:
+            asyncio.run(store.aload(self.documents, batch_size=1))
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(
+            other.similarity_search("Document number 3.", k=4)[0].metadata["source"],
+            "doc3",
+        )
+
+    def test_unsaved_batches_survive_reload(self):
+        store, other = self.create_store(), self.create_store()
+        store._add_faiss_embeddings(
+            ["Unsaved."],
+            self.embeddings.embed_documents(["Unsaved."]),
+            [{}],
+            save=False,
+        )
+        other.load(self.documents)
+        store._save_unsaved()
+        self.assertEqual(store.vector_store.index.ntotal, 5)
+        self.assertEqual(self.create_store().vector_store.index.ntotal, 5)
+
+
+class TestDeleteChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = FlakyEmbeddings(size=8, batches=[])
+        self.store = Store(embeddings=self.embeddings, hybrid=True)
+        asyncio.run(
+            self.store.aload(
+                [
+                    {"raw_content": f"Section {i} of the report.", "url": f"doc{i % 2}"}
+                    for i in range(6)
+                ]
+            )
+        )
+
+    def test_delete_removes_source(self):
+        self.assertEqual(asyncio.run(self.store.adelete({"source": "doc0"})), 3)
+        self.assertEqual(self.store.vector_store.index.ntotal, 3)
+        results = self.store.similarity_search("Section 2 of the report.", k=6)
+        self.assertEqual({doc.metadata["source"] for doc in results}, {"doc1"})
+
+    def test_delete_needs_a_filter(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(self.store.adelete({}))
+
+    def test_reupload_replaces_stale_chunks(self):
+        self.embeddings.batches.clear()
+        asyncio.run(
+            self.store.aload(
+                [
+                    {"raw_content": "Section 0 of the report.", "url": "doc0"},
+                    {"raw_content": "A new section.", "url": "doc0"},
+                ],
+                replace=True,
+            )
+        )
+        # Only the new chunk is embedded, the unchanged one reuses its vector
+        self.assertEqual(self.embeddings.batches, [1])
+        contents = {
+            doc.page_content
+            for doc in self.store.vector_store.docstore._dict.values()
+            if doc.metadata["source"] == "doc0"
+        }
+        self.assertEqual(contents, {"Section 0 of the report.", "A new section."})
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = FlakyEmbeddings(size=8, batches=[])
+        self.store = Store(embeddings=self.embeddings, file_cache=LRUCache())
+        self.pages = [
+            {"raw_content": f"Page {i} of the annual report.", "url": "alice/report"}
+            for i in range(3)
+        ]
+        asyncio.run(self.store.aload(self.pages, file_hash="abc"))
+
+    def sources(self):
+        return sorted(
+            (doc.metadata["source"], doc.metadata.get("user_id"))
+            for doc in self.store.vector_store.docstore._dict.values()
+        )
+
+    def test_identical_file_is_copied(self):
+        copied = asyncio.run(self.store.acopy_file("abc", "bob/copy", "bob"))
+        self.assertEqual(copied, 3)
+        self.assertEqual(self.embeddings.batches, [3])
+        self.assertEqual(
+            self.sources(), [("alice/report", None)] * 3 + [("bob/copy", "bob")] * 3
+        )
+        results = self.store.similarity_search(
+            "Page 1 of the annual report.", k=1, filter={"user_id": {"in": ["bob"]}}
+        )
+        self.assertEqual(results[0].page_content, "Page 1 of the annual report.")
+        self.assertEqual(results[0].metadata["source"], "bob/copy")
+
+    def test_unknown_file_is_a_miss(self):
+        self.assertIsNone(asyncio.run(self.store.acopy_file("def", "bob/copy")))
+        self.assertIsNone(
+            asyncio.run(Store(embeddings=self.embeddings).acopy_file("abc", "copy"))
+        )
+
+    def test_deleted_file_is_a_miss(self):
+        asyncio.run(self.store.adelete({"source": "alice/report"}))
+        self.assertIsNone(asyncio.run(self.store.acopy_file("abc", "bob/copy")))
+
+    def test_copy_replaces_source_and_becomes_the_cached_copy(self):
+        asyncio.run(self.store.aload([{"raw_content": "Draft.", "url": "bob/copy"}]))
+        asyncio.run(self.store.acopy_file("abc", "bob/copy", replace=True))
+        # The original can go, the copy is copied from next
+        asyncio.run(self.store.adelete({"source": "alice/report"}))
+        self.assertEqual(asyncio.run(self.store.acopy_file("abc", "carol/copy")), 3)
+        self.assertEqual(
+            self.sources(), [("bob/copy", None)] * 3 + [("carol/copy", None)] * 3
+        )
+
+    def test_other_chunker_misses(self):
+        store = Store(
+            embeddings=self.embeddings,
+            file_cache=self.store.file_cache,
+            chunker=Chunker(chunk_size=10, chunk_overlap=2),
+        )
+        store.vector_store = self.store.vector_store
+        self.assertIsNone(asyncio.run(store.acopy_file("abc", "bob/copy")))
+
+
+class TestQuantizedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = DeterministicFakeEmbedding(size=64)
+        self.documents = [
+            {"raw_content": f"Document number {i}.", "url": f"doc{i}"} for i in range(8)
+        ]
+
+    def test_quantized_vectors_are_searched(self):
+        for quantization, code_size in (("float16", 128), ("int8", 64)):
+            with tempfile.TemporaryDirectory() as directory:
+                store = Store(
+                    embeddings=self.embeddings,
+                    quantization=quantization,
+                    persist_directory=directory,
+                    quantization_training_size=4,
+                )
+                store.load(self.documents[:1])
+                asyncio.run(store.aload(self.documents[1:]))
+                self.assertEqual(store.vector_store.index.code_size, code_size)
+                reloaded = Store(
+                    embeddings=self.embeddings, persist_directory=directory
+                )
+                results = reloaded.similarity_search("Document number 5.", k=1)
+                self.assertEqual(results[0].metadata["source"], "doc5")
+
+    def test_int8_is_trained_on_the_first_vectors(self):
+        store = Store(
+            embeddings=self.embeddings,
+            quantization="int8",
+            quantization_training_size=5,
+        )
+        store.load(self.documents[:1])
+        # Full precision until there are enough vectors to train on
+        self.assertEqual(store.vector_store.index.code_size, 256)
+        asyncio.run(store.aload(self.documents[1:], batch_size=2, max_concurrency=1))
+        self.assertEqual(store.vector_store.index.code_size, 64)
+        self.assertEqual(store.vector_store.index.ntotal, 8)
+
+        trained = self.embeddings.embed_documents(
+            [document["raw_content"] for document in self.documents[:5]]
+        )
+        low, high = min(map(min, trained)), max(map(max, trained))
+        vmin, vdiff = faiss.vector_to_array(store.vector_store.index.sq.trained)
+        self.assertAlmostEqual(vmin, low - 0.2 * (high - low), places=5)
+        self.assertAlmostEqual(vdiff, 1.4 * (high - low), places=5)
+        results = store.similarity_search("Document number 2.", k=1)
+        self.assertEqual(results[0].metadata["source"], "doc2")
+
+    def test_unknown_quantization(self):
+        with self.assertRaises(ValueError):
+            Store(embeddings=self.embeddings, quantization="binary")
+
+
 if __name__ == "__main__":
     unittest.main()